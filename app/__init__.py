@@ -19,4 +19,10 @@ def create_app() -> Flask:
     from .routes import bp as main_bp
     app.register_blueprint(main_bp)
 
+    # Optional warm-up: load models, open the index and DB pool before this worker serves
+    from .config import settings
+    if settings.WARMUP:
+        from .services.warmup import warm_up
+        warm_up()
+
     return app
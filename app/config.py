@@ -8,6 +8,12 @@ class Settings(BaseModel):
 
     # Spring Boot DB
     DB_URL: str | None = os.getenv("DB_URL")
+    # Connection pool for the process-wide engine (ignored for SQLite); 0 disables the statement timeout
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
     USE_DUMMY_LOGS: bool = bool(int(os.getenv("USE_DUMMY_LOGS", "1")))
     LOG_TABLE: str = os.getenv("LOG_TABLE", "logs")
     COL_TIMESTAMP: str = os.getenv("COL_TIMESTAMP", "timestamp")
@@ -15,22 +21,70 @@ class Settings(BaseModel):
     COL_LOGGER: str = os.getenv("COL_LOGGER", "logger")
     COL_MESSAGE: str = os.getenv("COL_MESSAGE", "message")
     COL_CORRELATION_ID: str = os.getenv("COL_CORRELATION_ID", "correlation_id")
+    # Optional unique, orderable row key (e.g. id; rowid on SQLite) that orders and pages timestamp ties; unset = timestamp only
+    COL_ROW_ID: str = os.getenv("COL_ROW_ID", "")
+    # Rows buffered per server-side cursor fetch, and max rows per /api/logs page
+    LOG_FETCH_BATCH: int = int(os.getenv("LOG_FETCH_BATCH", "1000"))
+    LOG_PAGE_MAX: int = int(os.getenv("LOG_PAGE_MAX", "5000"))
+    # Max log lines kept verbatim (first and last half) for the RCA prompt; all lines still feed templates
+    RCA_MAX_LOGS: int = int(os.getenv("RCA_MAX_LOGS", "400"))
+    # Log lines per fetched chunk handed to retrieval, and max concurrent retrieval calls per analysis
+    RCA_CHUNK_SIZE: int = int(os.getenv("RCA_CHUNK_SIZE", "500"))
+    RCA_RETRIEVAL_CONCURRENCY: int = int(os.getenv("RCA_RETRIEVAL_CONCURRENCY", "4"))
+    # Prompt token budget for logs + templates + retrieved snippets, and the share reserved for log lines
+    RCA_PROMPT_TOKEN_BUDGET: int = int(os.getenv("RCA_PROMPT_TOKEN_BUDGET", "6000"))
+    RCA_PROMPT_LOG_SHARE: float = float(os.getenv("RCA_PROMPT_LOG_SHARE", "0.4"))
+    # Finished analyses cached per (correlation ID, log fingerprint, index version, LLM_MODEL); TTL in seconds, 0 = no expiry
+    RCA_CACHE_ENABLED: bool = bool(int(os.getenv("RCA_CACHE_ENABLED", "1")))
+    RCA_CACHE_SIZE: int = int(os.getenv("RCA_CACHE_SIZE", "256"))
+    RCA_CACHE_TTL: float = float(os.getenv("RCA_CACHE_TTL", "900"))
+    # /analyze/batch: max correlation IDs per request, IDs per IN (...) query, concurrent LLM calls (one per cluster)
+    RCA_BATCH_MAX_IDS: int = int(os.getenv("RCA_BATCH_MAX_IDS", "500"))
+    LOG_IN_BATCH: int = int(os.getenv("LOG_IN_BATCH", "500"))
+    RCA_BATCH_LLM_CONCURRENCY: int = int(os.getenv("RCA_BATCH_LLM_CONCURRENCY", "4"))
 
     # Codebase scanning
     JAVA_CODE_PATH: str = os.getenv("JAVA_CODE_PATH", "./spring-app/")
-    # More permissive default: captures logger.xxx(...) across lines and any arg style
-    # Matches: logger.info("..."); log.error("... {}", var); etc.
+    # Locates the head of a logger call, e.g. logger.info( / log.error( ; the argument list
+    # (across lines, nested calls, string literals) is then found by paren balancing in code_scan
     LOG_REGEX: str = os.getenv(
         "LOG_REGEX",
-        r"\.(info|error|warn|debug|trace)\s*\((?:.|\n)*?\)"
+        r"\.(info|error|warn|debug|trace)\s*\("
     )
+    # Logger calls are indexed one document per enclosing method; CONTEXT_WINDOW lines around a call are
+    # used for calls outside any method and to clip methods longer than METHOD_MAX_LINES
     CONTEXT_WINDOW: int = int(os.getenv("CONTEXT_WINDOW", "20"))
+    METHOD_MAX_LINES: int = int(os.getenv("METHOD_MAX_LINES", "150"))
     FILE_EXTS: list[str] = os.getenv("FILE_EXTS", ".java,.kt").split(",")
     EXCLUDE_DIRS: list[str] = os.getenv("EXCLUDE_DIRS", ".git,node_modules,build,target,out,dist").split(",")
+    # Scanner process pool size (0 = one per CPU, 1 = scan in-process) and snippets per streamed upsert
+    SCAN_WORKERS: int = int(os.getenv("SCAN_WORKERS", "0"))
+    SCAN_UPSERT_BATCH: int = int(os.getenv("SCAN_UPSERT_BATCH", "256"))
+    # Per-file scan manifest for incremental re-indexing; defaults to <CHROMA_DIR parent>/<collection>.manifest.json
+    SCAN_MANIFEST_PATH: str | None = os.getenv("SCAN_MANIFEST_PATH") or None
+    # Background ingest jobs: SQLite job records shared by all workers, progress write interval (seconds)
+    INGEST_JOBS_PATH: str = os.getenv("INGEST_JOBS_PATH", "./data/ingest_jobs.sqlite3")
+    INGEST_PROGRESS_INTERVAL: float = float(os.getenv("INGEST_PROGRESS_INTERVAL", "0.5"))
 
-    # Vector DB
+    # Vector DB: "chroma" or "mmap" (embedded NumPy index); CHROMA_COLLECTION names the index for both
+    VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "chroma")
     CHROMA_DIR: str = os.getenv("CHROMA_DIR", "./data/chroma")
     CHROMA_COLLECTION: str = os.getenv("CHROMA_COLLECTION", "log_context")
+    # Hybrid retrieval: exact log-format literal hits skip the ANN query; others fuse BM25 + vector by RRF
+    HYBRID_RETRIEVAL: bool = bool(int(os.getenv("HYBRID_RETRIEVAL", "1")))
+    LITERAL_MIN_CHARS: int = int(os.getenv("LITERAL_MIN_CHARS", "12"))
+    RRF_K: int = int(os.getenv("RRF_K", "60"))
+    # Stack frames in log messages resolve straight to their method snippets (no embedding/ANN for those lines)
+    STACK_FRAME_LOOKUP: bool = bool(int(os.getenv("STACK_FRAME_LOOKUP", "1")))
+    STACK_FRAME_MAX_PER_LOG: int = int(os.getenv("STACK_FRAME_MAX_PER_LOG", "3"))
+    # mmap backend: index directory and stored vector type (float32, float16 or int8)
+    MMAP_INDEX_DIR: str = os.getenv("MMAP_INDEX_DIR", "./data/mmap_index")
+    MMAP_INDEX_DTYPE: str = os.getenv("MMAP_INDEX_DTYPE", "float32")
+    # Sharding: "" (one collection), "package" (first SHARD_PACKAGE_DEPTH package segments) or "root" (top-level
+    # directory under JAVA_CODE_PATH); queries go to the shards matching the logger, concurrently, else to all
+    SHARD_BY: str = os.getenv("SHARD_BY", "").strip().lower()
+    SHARD_PACKAGE_DEPTH: int = int(os.getenv("SHARD_PACKAGE_DEPTH", "3"))
+    SHARD_QUERY_CONCURRENCY: int = int(os.getenv("SHARD_QUERY_CONCURRENCY", "4"))
 
     # Embeddings
     USE_OPENAI_EMBEDDINGS: bool = bool(int(os.getenv("USE_OPENAI_EMBEDDINGS", "0")))
@@ -39,12 +93,32 @@ class Settings(BaseModel):
     OPENAI_BASE_URL: str | None = os.getenv("OPENAI_BASE_URL")
     OPENAI_EMBEDDING_MODEL: str = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
     ST_EMBEDDING_MODEL: str = os.getenv("ST_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    # Local engine: texts per length-sorted batch, backend (torch, onnx, openvino) and optional model file
+    # (e.g. onnx/model_qint8_avx512_vnni.onnx), dynamic int8 for torch, encode processes (0 = one per CPU)
+    ST_BATCH_SIZE: int = int(os.getenv("ST_BATCH_SIZE", "64"))
+    ST_BACKEND: str = os.getenv("ST_BACKEND", "torch")
+    ST_MODEL_FILE: str | None = os.getenv("ST_MODEL_FILE") or None
+    ST_QUANTIZE: bool = bool(int(os.getenv("ST_QUANTIZE", "0")))
+    ST_PROCESSES: int = int(os.getenv("ST_PROCESSES", "1"))
     OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     OLLAMA_EMBEDDING_MODEL: str = os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
+    OLLAMA_EMBED_BATCH_SIZE: int = int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", "64"))
+    OLLAMA_EMBED_CONCURRENCY: int = int(os.getenv("OLLAMA_EMBED_CONCURRENCY", "4"))
+    OLLAMA_MAX_RETRIES: int = int(os.getenv("OLLAMA_MAX_RETRIES", "3"))
+    OLLAMA_RETRY_BACKOFF: float = float(os.getenv("OLLAMA_RETRY_BACKOFF", "0.5"))
+    OLLAMA_TIMEOUT: float = float(os.getenv("OLLAMA_TIMEOUT", "60"))
+    # Embedding cache: SQLite file keyed by (provider, model, sha1(text)) with an in-process LRU in front
+    EMBEDDING_CACHE_ENABLED: bool = bool(int(os.getenv("EMBEDDING_CACHE_ENABLED", "1")))
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "./data/embedding_cache.sqlite3")
+    EMBEDDING_CACHE_LRU_SIZE: int = int(os.getenv("EMBEDDING_CACHE_LRU_SIZE", "20000"))
 
     # LLM
     LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-4o-mini")
     REQUIRE_LLM: bool = bool(int(os.getenv("REQUIRE_LLM", "1")))
 
+    # Startup: opt-in warm-up in create_app before the worker serves; steps out of db,embeddings,index,llm,tokenizer
+    WARMUP: bool = bool(int(os.getenv("WARMUP", "0")))
+    WARMUP_STEPS: list[str] = os.getenv("WARMUP_STEPS", "db,embeddings,index,llm,tokenizer").split(",")
+
 
 settings = Settings()
@@ -1,5 +1,15 @@
-from flask import Blueprint, render_template, request, jsonify
-from .services import db_ingest, rca as rca_service
+import os
+import json
+from flask import Blueprint, Response, render_template, request, jsonify, stream_with_context
+from .services import db_ingest, metrics, rca as rca_service
+from .services.embedding_cache import get_cache
+from .services.rca_cache import get_cache as get_rca_cache
+from .services.literal_index import peek_index as peek_literal_index
+from .services.frame_index import peek_index as peek_frame_index
+from .services.shard_index import peek_index as peek_shard_index
+from .services.ingest_jobs import IngestBusy, get_jobs
+from .services.warmup import last_report as last_warmup_report
+from .config import settings
 
 bp = Blueprint('main', __name__)
 
@@ -12,9 +22,51 @@ def get_logs():
     cid = request.args.get('correlation_id')
     if not cid:
         return jsonify({"error": "correlation_id required"}), 400
-    
-    logs = db_ingest.fetch_logs_by_correlation(cid)
-    return jsonify({"logs": logs, "count": len(logs)})
+    after = request.args.get('after') or None
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit <= 0:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    ndjson = request.args.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', '')
+    if ndjson:
+        # Stream one JSON object per line straight from the DB cursor
+        rows = db_ingest.iter_logs_by_correlation(cid, after=after, limit=limit)
+        body = (json.dumps(row, default=str) + "\n" for row in rows)
+        return Response(stream_with_context(body), mimetype="application/x-ndjson")
+
+    limit = min(limit or settings.LOG_PAGE_MAX, settings.LOG_PAGE_MAX)
+    logs = db_ingest.fetch_logs_by_correlation(cid, after=after, limit=limit)
+    next_after = db_ingest.log_cursor(logs[-1]) if len(logs) == limit else None
+    return jsonify({"logs": logs, "count": len(logs), "next_after": next_after})
+
+def _stats():
+    cache = get_cache()
+    rca_cache = get_rca_cache()
+    literal_index = peek_literal_index()
+    frame_index = peek_frame_index()
+    shard_index = peek_shard_index()
+    return {
+        "embedding_cache": cache.stats() if cache else None,
+        "db_pool": db_ingest.pool_stats(),
+        "rca_stream": rca_service.stream_stats(),
+        "rca_cache": rca_cache.stats() if rca_cache else None,
+        "literal_index": literal_index.stats() if literal_index else None,
+        "frame_index": frame_index.stats() if frame_index else None,
+        "shard_index": shard_index.stats() if shard_index else None,
+        "warmup": last_warmup_report(),
+    }
+
+@bp.get('/api/stats')
+def stats():
+    return jsonify(_stats())
+
+@bp.get('/metrics')
+def prometheus_metrics():
+    # Stage histograms and counters of this worker process, plus the /api/stats numbers as gauges
+    return Response(metrics.render(_stats()), mimetype="text/plain; version=0.0.4")
+
+def _truthy(value) -> bool:
+    return str(value or "").lower() in ("1", "true", "yes")
 
 @bp.route('/analyze', methods=['POST'])
 def analyze():
@@ -23,16 +75,77 @@ def analyze():
         return jsonify({"error": "correlation_id required"}), 400
     
     cid = data['correlation_id']
+    force = _truthy(data.get('force'))
     try:
-        result = rca_service.analyze_correlation(cid)
+        result = rca_service.analyze_correlation(cid, force=force)
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@bp.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    data = request.get_json(silent=True) or {}
+    ids = data.get('correlation_ids')
+    if not isinstance(ids, list) or not ids:
+        return jsonify({"error": "correlation_ids (non-empty list) required"}), 400
+    ids = [str(i).strip() for i in ids if str(i).strip()]
+    if len(set(ids)) > settings.RCA_BATCH_MAX_IDS:
+        return jsonify({"error": f"at most {settings.RCA_BATCH_MAX_IDS} correlation IDs per batch"}), 400
+    try:
+        return jsonify(rca_service.analyze_batch(ids))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@bp.route('/analyze/stream', methods=['GET', 'POST'])
+def analyze_stream():
+    # GET (?correlation_id=...) serves EventSource clients; POST takes the same JSON body as /analyze
+    data = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    cid = data.get('correlation_id')
+    if not cid:
+        return jsonify({"error": "correlation_id required"}), 400
+    force = _truthy(data.get('force'))
+
+    def _events():
+        events = rca_service.iter_analysis_events(cid, force=force)
+        try:
+            for event, payload in events:
+                yield _sse(event, payload)
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+        finally:
+            events.close()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(_events()), mimetype="text/event-stream", headers=headers)
+
+@bp.get("/ingest-ui")
+def ingest_ui():
+    return render_template("ingest.html")
+
+def _start_ingest(java_path: str, data):
+    # Scans run as background jobs; "wait": true blocks until the job ends (the old synchronous behaviour)
+    if not os.path.exists(java_path):
+        return jsonify({"error": f"java_path does not exist: {java_path}"}), 400
+    jobs = get_jobs()
+    try:
+        job = jobs.submit(java_path, full=_truthy(data.get("full")))
+    except IngestBusy as e:
+        return jsonify({"error": str(e), "job": e.job}), 409
+    if not _truthy(data.get("wait")):
+        return jsonify({"job_id": job["id"], **job}), 202
+    job = jobs.wait(job["id"])
+    stats = job["result"] or {}
+    status = "ok" if job["status"] == "succeeded" else "error"
+    return jsonify({"status": status, "path": java_path, "count": stats.get("documents_indexed", 0), "job": job, **stats})
+
 @bp.post("/ingest")
 def ingest():
-    # Trigger code scan and vector index build
-    return jsonify({"status": "ok"})
+    # Trigger code scan and vector index build for JAVA_CODE_PATH
+    data = request.get_json(silent=True) or request.form
+    return _start_ingest(settings.JAVA_CODE_PATH, data)
 
 @bp.post("/ingest/path")
 def ingest_path():
@@ -40,5 +153,23 @@ def ingest_path():
     java_path = (data.get("java_path") or "").strip()
     if not java_path:
         return jsonify({"error": "java_path is required"}), 400
-    count = code_scan.scan_and_index(java_path)
-    return jsonify({"count": count, "path": java_path, "documents_indexed": count})
+    return _start_ingest(java_path, data)
+
+@bp.get("/ingest/jobs")
+def ingest_jobs():
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 200)
+    return jsonify({"jobs": get_jobs().list(limit)})
+
+@bp.get("/ingest/jobs/<job_id>")
+def ingest_job(job_id: str):
+    job = get_jobs().get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job)
+
+@bp.post("/ingest/jobs/<job_id>/cancel")
+def cancel_ingest_job(job_id: str):
+    job = get_jobs().cancel(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+import os
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Coroutine, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# A single background event loop per process lets sync (Flask/WSGI) callers share non-blocking I/O
+_LOOP: asyncio.AbstractEventLoop | None = None
+_LOOP_THREAD: threading.Thread | None = None
+_LOOP_PID: int | None = None
+_LOCK = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _LOOP, _LOOP_THREAD, _LOOP_PID
+    pid = os.getpid()
+    if _LOOP is not None and _LOOP_PID == pid:
+        return _LOOP
+    with _LOCK:
+        # The loop thread does not survive fork; start a fresh one in the child
+        if _LOOP is None or _LOOP_PID != pid:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="rca-event-loop", daemon=True)
+            thread.start()
+            _LOOP, _LOOP_THREAD, _LOOP_PID = loop, thread, pid
+    return _LOOP
+
+
+def run(coro: Coroutine[Any, Any, T], timeout: float | None = None) -> T:
+    """Run ``coro`` on the shared background loop and block the calling thread for its result."""
+    loop = get_loop()
+    if threading.current_thread() is _LOOP_THREAD:
+        coro.close()
+        raise RuntimeError("aio.run() called from the event loop thread; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+def iter_async(agen: AsyncIterator[T]) -> Iterator[T]:
+    """Drive an async generator on the shared loop, yielding its items to a sync (WSGI) caller.
+
+    Closing the returned iterator early (e.g. the client disconnected) closes ``agen`` on the loop.
+    """
+    loop = get_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
@@ -1,93 +1,531 @@
 from __future__ import annotations
 import os
 import re
+import json
 import hashlib
 import logging
 import time
-from typing import List, Dict
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator, Iterable, Tuple, Callable
 from ..config import settings
-from .vector_store import get_collection, upsert_documents
+from .vector_store import (
+    count_documents, upsert_documents, delete_documents, index_spans, delete_spans, on_reset, reset_collection,
+)
+from .embeddings import embedding_signature
+from .shard_index import DEFAULT_SHARD
+from .java_parser import Method, parse_methods, parse_package, enclosing_method
 
 
 LOG_PATTERN = re.compile(settings.LOG_REGEX)
+# Bumped when snippet metadata changes so existing manifests trigger one full rescan
+MANIFEST_VERSION = 5
+_STRING_LITERAL = re.compile(r'"((?:[^"\\\n]|\\.)*)"')
 logger = logging.getLogger(__name__)
+# Collection resets seen by this process; a scan that spans one doesn't save its manifest
+_RESETS = 0
 
 
-def _read_file(fp: str) -> List[str]:
-    with open(fp, "r", encoding="utf-8", errors="ignore") as f:
-        return f.readlines()
+class ScanCancelled(Exception):
+    """Raised by a scan_and_index progress callback to stop the scan."""
 
 
-def _extract_snippets(java_path: str) -> List[Dict]:
-    logger.info("Scanning Java path for log statements: %s", java_path)
-    snippets: List[Dict] = []
-    java_files = 0
-    total_matches = 0
-    for root, _, files in os.walk(java_path):
+def _iter_source_files(java_path: str) -> Iterator[str]:
+    exts = tuple(e.strip() for e in settings.FILE_EXTS if e.strip())
+    excluded = {d.strip() for d in settings.EXCLUDE_DIRS if d.strip()}
+    for root, dirs, files in os.walk(java_path):
+        dirs[:] = [d for d in dirs if d not in excluded]
         for fn in files:
-            if not fn.endswith(".java"):
+            if fn.endswith(exts):
+                yield os.path.join(root, fn)
+
+
+def _line_offsets(text: str) -> List[int]:
+    # Start offset of every line, built once per file so line lookups are a bisect instead of a prefix rescan
+    offsets = [0]
+    find = text.find
+    idx = find("\n")
+    while idx != -1:
+        offsets.append(idx + 1)
+        idx = find("\n", idx + 1)
+    return offsets
+
+
+def _call_end(text: str, open_idx: int) -> int | None:
+    """Return the index just past the ``)`` balancing ``text[open_idx]``, skipping literals and comments."""
+    depth = 0
+    i = open_idx
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        elif c == '"':
+            if text.startswith('"""', i):
+                close = text.find('"""', i + 3)
+                if close == -1:
+                    return None
+                i = close + 3
                 continue
-            fp = os.path.join(root, fn)
-            java_files += 1
-            try:
-                lines = _read_file(fp)
-            except Exception as e:
-                logger.warning("Failed to read file %s: %s", fp, e)
+            i += 1
+            while i < n and text[i] != '"' and text[i] != "\n":
+                i += 2 if text[i] == "\\" else 1
+        elif c == "'":
+            i += 1
+            while i < n and text[i] != "'" and text[i] != "\n":
+                i += 2 if text[i] == "\\" else 1
+        elif c == "/" and i + 1 < n:
+            nxt = text[i + 1]
+            if nxt == "/":
+                nl = text.find("\n", i)
+                i = n if nl == -1 else nl
+                continue
+            if nxt == "*":
+                close = text.find("*/", i + 2)
+                if close == -1:
+                    return None
+                i = close + 2
                 continue
+        i += 1
+    return None
+
+
+def _first_argument(call: str) -> str:
+    """Text of the first argument of ``call`` (``.error("...", x)`` -> ``"..."``)."""
+    open_idx = call.find("(")
+    if open_idx == -1:
+        return ""
+    depth, i, n = 0, open_idx + 1, len(call)
+    while i < n:
+        c = call[i]
+        if c in "([{":
+            depth += 1
+        elif c in ")]}":
+            if depth == 0:
+                break
+            depth -= 1
+        elif c == "," and depth == 0:
+            break
+        elif c in "\"'":
+            i += 1
+            while i < n and call[i] != c and call[i] != "\n":
+                i += 2 if call[i] == "\\" else 1
+        i += 1
+    return call[open_idx + 1:i]
+
+
+def log_format(call: str) -> str:
+    """Format string of a logger call with non-literal pieces as ``{}``.
+
+    ``"Failed for " + id + " with code {}"`` -> ``Failed for {} with code {}``.
+    """
+    arg = _first_argument(call)
+    out, pos, found = [], 0, False
+    for m in _STRING_LITERAL.finditer(arg):
+        if arg[pos:m.start()].strip(" \t\r\n+"):
+            out.append("{}")
+        out.append(m.group(1).replace('\\"', '"').replace("\\\\", "\\"))
+        pos, found = m.end(), True
+    if not found:
+        return ""
+    if arg[pos:].strip(" \t\r\n+"):
+        out.append("{}")
+    return "".join(out)
+
+
+def _snippet(fp: str, lines: List[str], start: int, end: int, calls: List[Dict[str, Any]], method: Method | None, package: str) -> Dict:
+    symbol = f"Symbol: {method.symbol}\n" if method else ""
+    matches = "".join(f"Match: {c['text']}\n" for c in calls)
+    snippet_text = f"File: {fp}\nLines: {start}-{end}\n{symbol}{matches}\nContext:\n{''.join(lines[start:end])}"
+    formats = [f for f in dict.fromkeys(c["format"] for c in calls) if f]
+    metadata: Dict[str, Any] = {
+        "file": fp,
+        "range": f"{start}-{end}",
+        "type": "java_method" if method else "java_log_context",
+        "levels": ",".join(sorted({c["level"] for c in calls if c["level"]})),
+        # One format per line; the literal index splits them back out
+        "log_format": "\n".join(formats),
+        "line_start": start + 1,
+        "line_end": end,
+        "call_lines": ",".join(str(c["line"] + 1) for c in calls),
+    }
+    if package:
+        metadata["package"] = package
+    if method:
+        metadata.update({"package": method.package, "class": method.class_name, "method": method.name, "symbol": method.symbol})
+    return {"id": hashlib.sha1(snippet_text.encode("utf-8")).hexdigest(), "text": snippet_text, "metadata": metadata}
+
+
+def _file_snippets(fp: str, lines: List[str]) -> List[Dict]:
+    """One document per method containing logger calls, plus a CONTEXT_WINDOW slice per call outside any method."""
+    return _file_documents(fp, lines)[0]
+
+
+def _file_documents(fp: str, lines: List[str]) -> Tuple[List[Dict], List[Dict]]:
+    """``(snippets, spans)``: the documents to embed (see ``_file_snippets``), and one frame-index-only
+    document per method without logger calls, so stack frames into it (the usual throw site) resolve too."""
+    joined = "".join(lines)
+    offsets = _line_offsets(joined)
+    methods = parse_methods(joined)
+    package = parse_package(joined)
+    starts = [m.start for m in methods]
+    by_method: Dict[int, Tuple[Method, List[Dict[str, Any]]]] = {}
+    snippets: List[Dict] = []
+    # LOG_PATTERN only needs to locate the call head; the argument list is found by paren balancing
+    for match in LOG_PATTERN.finditer(joined):
+        start_idx = match.start()
+        open_idx = joined.find("(", start_idx, match.end())
+        end_idx = _call_end(joined, open_idx) if open_idx != -1 else None
+        if end_idx is None:
+            end_idx = match.end()
+        line_no = bisect_right(offsets, start_idx) - 1
+        message_group = joined[start_idx:end_idx]
+        call = {
+            "line": line_no,
+            "text": message_group,
+            "level": (match.group(1) or "").lower() if match.re.groups else "",
+            "format": log_format(message_group),
+        }
+        method = enclosing_method(methods, line_no, starts)
+        if method is not None:
+            by_method.setdefault(id(method), (method, []))[1].append(call)
+            continue
+        start = max(0, line_no - settings.CONTEXT_WINDOW)
+        end = min(len(lines), line_no + settings.CONTEXT_WINDOW)
+        snippets.append(_snippet(fp, lines, start, end, [call], None, package))
+
+    for method, calls in by_method.values():
+        start, end = method.start, min(method.end, len(lines))
+        if end - start > settings.METHOD_MAX_LINES:
+            # Very long methods: keep the stretch around the logger calls
+            start = max(start, calls[0]["line"] - settings.CONTEXT_WINDOW)
+            end = min(end, calls[-1]["line"] + settings.CONTEXT_WINDOW + 1)
+        snippets.append(_snippet(fp, lines, start, end, calls, method, package))
+    spans = [
+        _snippet(fp, lines, m.start, min(m.end, len(lines)), [], m, package)
+        for m in methods if id(m) not in by_method
+    ]
+    return snippets, spans
+
+
+def _scan_file(task: Tuple[str, str | None]) -> Dict[str, Any]:
+    # Runs in scan worker processes: hash the file and extract snippets unless the hash is already known
+    fp, known_sha1 = task
+    try:
+        with open(fp, "rb") as f:
+            raw = f.read()
+    except Exception as e:
+        return {"file": fp, "error": str(e)}
+    digest = hashlib.sha1(raw).hexdigest()
+    if known_sha1 == digest:
+        return {"file": fp, "sha1": digest, "unchanged": True}
+    lines = raw.decode("utf-8", errors="ignore").splitlines(keepends=True)
+    snippets, spans = _file_documents(fp, lines)
+    return {
+        "file": fp, "sha1": digest, "unchanged": False,
+        "snippets": list({s["id"]: s for s in snippets}.values()),
+        "spans": list({s["id"]: s for s in spans}.values()),
+    }
+
+
+def _scan_workers() -> int:
+    return settings.SCAN_WORKERS if settings.SCAN_WORKERS > 0 else (os.cpu_count() or 1)
+
+
+def _iter_scan_results(tasks: Iterable[Tuple[str, str | None]], workers: int | None = None) -> Iterator[Dict[str, Any]]:
+    """Scan files across a process pool, yielding per-file results in submission order.
+
+    At most ``workers * 4`` files are in flight, so memory stays bounded regardless of repo size.
+    """
+    workers = workers or _scan_workers()
+    if workers <= 1:
+        for task in tasks:
+            yield _scan_file(task)
+        return
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending: deque = deque()
+        for task in tasks:
+            pending.append(pool.submit(_scan_file, task))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # A cancelled scan closes this generator early: drop queued files nobody will read, and wait
+        # only for the ones already being parsed so no worker outlives the scan
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_snippets(java_path: str, workers: int | None = None) -> Iterator[Dict]:
+    for result in _iter_scan_results(((fp, None) for fp in _iter_source_files(java_path)), workers):
+        if result.get("error"):
+            logger.warning("Failed to read file %s: %s", result["file"], result["error"])
+            continue
+        yield from result["snippets"]
+
+
+def _manifest_path() -> str:
+    if settings.SCAN_MANIFEST_PATH:
+        return settings.SCAN_MANIFEST_PATH
+    # Kept next to (not inside) CHROMA_DIR, one manifest per collection
+    parent = os.path.dirname(os.path.abspath(settings.CHROMA_DIR))
+    return os.path.join(parent, f"{settings.CHROMA_COLLECTION}.manifest.json")
+
+
+def _empty_manifest(embedding: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "version": MANIFEST_VERSION, "collection": settings.CHROMA_COLLECTION, "shard_by": settings.SHARD_BY,
+        "embedding": embedding, "files": {},
+    }
+
 
-            joined = "".join(lines)
-            # find log invocation positions by regex on joined text, then map to line numbers
-            for match in LOG_PATTERN.finditer(joined):
-                # Find the starting index and map to an approximate line number
-                start_idx = match.start()
-                # Approx line via counting newlines up to start_idx
-                prefix = joined[:start_idx]
-                approx_line = prefix.count("\n")
-
-                start = max(0, approx_line - settings.CONTEXT_WINDOW)
-                end = min(len(lines), approx_line + settings.CONTEXT_WINDOW)
-                context = "".join(lines[start:end])
-                message_group = match.group(0)
-                snippet_text = f"File: {fp}\nLines: {start}-{end}\nMatch: {message_group}\n\nContext:\n{context}"
-                doc_id = hashlib.sha1(snippet_text.encode("utf-8")).hexdigest()
-                snippets.append({
-                    "id": doc_id,
-                    "text": snippet_text,
-                    "metadata": {
-                        "file": fp,
-                        "range": f"{start}-{end}",
-                        "type": "java_log_context"
-                    }
-                })
-                total_matches += 1
-            if total_matches:
-                logger.debug("File %s: cumulative matches so far: %d", fp, total_matches)
-    logger.info("Completed scan. Java files: %d, matches: %d, snippets: %d", java_files, total_matches, len(snippets))
-    return snippets
-
-
-def scan_and_index(java_path: str | None = None) -> int:
+def _load_manifest(embedding: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+    """The saved manifest (or an empty one for another index layout), and whether it was built with another embedding."""
+    path = _manifest_path()
+    if not os.path.exists(path):
+        return _empty_manifest(embedding), False
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception as e:
+        logger.warning("Ignoring unreadable scan manifest %s: %s", path, e)
+        return _empty_manifest(embedding), False
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("collection") != settings.CHROMA_COLLECTION:
+        return _empty_manifest(embedding), False
+    if manifest.get("embedding") != embedding:
+        logger.info("Embedding changed from %s to %s; rescanning all files", manifest.get("embedding"), embedding)
+        # Manifests written before the embedding was recorded just rescan
+        return _empty_manifest(embedding), "embedding" in manifest
+    if manifest.get("shard_by", "") != settings.SHARD_BY:
+        # Every document moves to another shard; upserts re-home them
+        logger.info("SHARD_BY changed to %r; rescanning all files", settings.SHARD_BY)
+        return _empty_manifest(embedding), False
+    return manifest, False
+
+
+def _save_manifest(manifest: Dict[str, Any]) -> None:
+    path = _manifest_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def _clear_manifest() -> None:
+    global _RESETS
+    _RESETS += 1
+    try:
+        os.remove(_manifest_path())
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("Failed to remove scan manifest after an index reset: %s", e)
+
+
+on_reset(_clear_manifest)
+
+
+def _is_under(fp: str, root: str) -> bool:
+    return fp == root or fp.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def _source_root(fp: str, root: str) -> str:
+    # SHARD_BY=root: the top-level directory under the scanned path (e.g. one per service module)
+    parts = os.path.relpath(fp, root).split(os.sep)
+    return parts[0] if len(parts) > 1 else DEFAULT_SHARD
+
+
+def _progress(phase: str, stats: Dict[str, Any], files_seen: int, upsert_time: float, elapsed: float) -> Dict[str, Any]:
+    scanned = stats["added"] + stats["updated"]
+    return {
+        "phase": phase,
+        "files_seen": files_seen,
+        "files_scanned": scanned,
+        "files_unchanged": stats["skipped"],
+        "snippets_embedded": stats["documents_indexed"],
+        "upsert_docs_per_s": round(stats["documents_indexed"] / upsert_time, 1) if upsert_time else None,
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def scan_and_index(
+    java_path: str | None = None,
+    full: bool = False,
+    progress: Callable[[Dict[str, Any]], None] | None = None,
+) -> Dict[str, Any]:
+    """Incrementally (re)index ``java_path`` and return per-file and document counts.
+
+    ``progress`` is called with a snapshot (see ``_progress``) after every file and upsert batch;
+    raising :class:`ScanCancelled` from it aborts the scan. Batches upserted before a cancel stay in
+    the index, but the manifest is only saved by a completed scan, so the next one redoes those files.
+    """
     # allow override path from UI; fallback to env
     java_path = (java_path or settings.JAVA_CODE_PATH).strip()
+    stats: Dict[str, Any] = {
+        "added": 0, "updated": 0, "deleted": 0, "skipped": 0,
+        "documents_indexed": 0, "documents_deleted": 0,
+    }
     if not java_path:
         logger.error("scan_and_index called with empty java_path")
-        return 0
+        return stats
     if not os.path.exists(java_path):
         logger.error("Provided java_path does not exist: %s", java_path)
-        return 0
+        return stats
 
     start_ts = time.time()
-    logger.info("Starting index build from path: %s", java_path)
-    snippets = _extract_snippets(java_path)
-    if not snippets:
-        logger.warning("No snippets extracted from %s. Check LOG_REGEX or source path.", java_path)
-        return 0
+    root = os.path.abspath(java_path)
+    logger.info("Starting index build from path: %s", root)
 
     try:
-        upsert_documents(snippets)
-        took = time.time() - start_ts
-        logger.info("Indexed %d documents to collection '%s' in %.2fs", len(snippets), settings.CHROMA_COLLECTION, took)
-        return len(snippets)
+        manifest, stale = _load_manifest(embedding_signature())
+        if stale:
+            # Vectors from another provider, model or dimension can't be searched with the current one
+            reset_collection()
     except Exception as e:
-        logger.exception("Failed to upsert documents to vector store: %s", e)
-        return 0
+        logger.exception("Failed to prepare the index: %s", e)
+        stats["error"] = str(e)
+        return stats
+    resets = _RESETS
+    files: Dict[str, Dict[str, Any]] = manifest["files"]
+    if files and not full:
+        # Manifest survives a manual wipe of the index; don't trust it against an empty collection
+        try:
+            if count_documents() == 0:
+                logger.info("Collection '%s' is empty; ignoring scan manifest", settings.CHROMA_COLLECTION)
+                files.clear()
+        except Exception as e:
+            logger.warning("Could not read collection size, ignoring scan manifest: %s", e)
+            files.clear()
+
+    seen = set()
+    new_entries: Dict[str, Dict[str, Any]] = {}
+    stale_ids: List[str] = []
+    stale_spans: List[str] = []
+    stat_cache: Dict[str, os.stat_result] = {}
+    upsert_time = 0.0
+
+    def _report(phase: str) -> None:
+        if progress is not None:
+            progress(_progress(phase, stats, len(seen), upsert_time, time.time() - start_ts))
+
+    def _upsert(docs: List[Dict]) -> None:
+        nonlocal upsert_time
+        t0 = time.perf_counter()
+        upsert_documents(docs)
+        upsert_time += time.perf_counter() - t0
+        stats["documents_indexed"] += len(docs)
+        _report("scanning")
+
+    def _tasks() -> Iterator[Tuple[str, str | None]]:
+        for fp in _iter_source_files(root):
+            seen.add(fp)
+            try:
+                st = os.stat(fp)
+            except OSError as e:
+                logger.warning("Failed to stat file %s: %s", fp, e)
+                continue
+            prev = files.get(fp)
+            if not full and prev and prev["mtime"] == st.st_mtime_ns and prev["size"] == st.st_size:
+                stats["skipped"] += 1
+                continue
+            stat_cache[fp] = st
+            yield fp, (prev["sha1"] if prev and not full else None)
+
+    batch: List[Dict] = []
+    spans: List[Dict] = []
+    try:
+        # Snippets are upserted in batches while later files are still being scanned
+        for result in _iter_scan_results(_tasks()):
+            fp = result["file"]
+            st = stat_cache.pop(fp)
+            if result.get("error"):
+                logger.warning("Failed to read file %s: %s", fp, result["error"])
+                continue
+            prev = files.get(fp)
+            if result["unchanged"]:
+                # Touched but unchanged: refresh stat info only
+                prev["mtime"], prev["size"] = st.st_mtime_ns, st.st_size
+                stats["skipped"] += 1
+                _report("scanning")
+                continue
+            ids = [s["id"] for s in result["snippets"]]
+            span_ids = [s["id"] for s in result["spans"]]
+            new_entries[fp] = {
+                "mtime": st.st_mtime_ns, "size": st.st_size, "sha1": result["sha1"], "ids": ids, "spans": span_ids,
+            }
+            if prev:
+                stats["updated"] += 1
+                stale_ids.extend(set(prev["ids"]) - set(ids))
+                stale_spans.extend(set(prev["spans"]) - set(span_ids))
+            else:
+                stats["added"] += 1
+            if settings.SHARD_BY == "root":
+                for s in result["snippets"]:
+                    s["metadata"]["shard"] = _source_root(fp, root)
+            batch.extend(result["snippets"])
+            spans.extend(result["spans"])
+            if len(spans) >= settings.SCAN_UPSERT_BATCH:
+                # Not embedded: spans only feed the stack-frame index
+                index_spans(spans)
+                spans = []
+            if len(batch) >= settings.SCAN_UPSERT_BATCH:
+                _upsert(batch)
+                batch = []
+            else:
+                _report("scanning")
+        if spans:
+            index_spans(spans)
+        if batch:
+            _upsert(batch)
+    except ScanCancelled:
+        raise
+    except Exception as e:
+        logger.exception("Failed to update vector store: %s", e)
+        stats["error"] = str(e)
+        return stats
+
+    removed = [fp for fp in files if _is_under(fp, root) and fp not in seen]
+    for fp in removed:
+        entry = files.pop(fp)
+        stale_ids.extend(entry["ids"])
+        stale_spans.extend(entry["spans"])
+    stats["deleted"] = len(removed)
+    logger.info(
+        "Scan of %s: %d added, %d updated, %d deleted, %d unchanged files",
+        root, stats["added"], stats["updated"], stats["deleted"], stats["skipped"],
+    )
+
+    _report("deleting")
+    try:
+        if stale_ids:
+            delete_documents(stale_ids)
+        if stale_spans:
+            delete_spans(stale_spans)
+    except Exception as e:
+        logger.exception("Failed to update vector store: %s", e)
+        stats["error"] = str(e)
+        return stats
+
+    files.update(new_entries)
+    if _RESETS != resets:
+        # The collection was dropped mid-scan, taking earlier batches and unchanged files with it
+        logger.warning("Index was reset during the scan; the next scan re-indexes every file")
+    else:
+        try:
+            _save_manifest(manifest)
+        except Exception as e:
+            logger.warning("Failed to write scan manifest: %s", e)
+
+    stats["documents_deleted"] = len(stale_ids)
+    _report("done")
+    took = time.time() - start_ts
+    logger.info("Indexed %d documents (%d deleted) to collection '%s' in %.2fs",
+                stats["documents_indexed"], len(stale_ids), settings.CHROMA_COLLECTION, took)
+    return stats
@@ -0,0 +1,236 @@
+from __future__ import annotations
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Sequence, Tuple
+from ..config import settings
+from .log_templates import LogTemplate, mask
+
+MAX_PROMPT_TEMPLATES = 50
+_ERROR_LEVELS = ("error", "fatal", "severe")
+# code_scan document layout; a Match can span lines (multi-line logger calls)
+_SNIPPET = re.compile(r"File: (?P<file>.*)\nLines: (?P<start>\d+)-(?P<end>\d+)\n(?P<symbols>(?:Symbol: .*\n)*)Match: (?P<matches>[\s\S]*?)\n\nContext:\n")
+
+_ENCODER = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count via tiktoken when installed, else the ~4 chars/token estimate."""
+    global _ENCODER
+    if _ENCODER is None:
+        try:
+            import tiktoken
+            _ENCODER = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _ENCODER = False
+    if _ENCODER:
+        return len(_ENCODER.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def is_error(log: Dict[str, Any]) -> bool:
+    return str(log.get("level", "")).lower() in _ERROR_LEVELS or "exception" in str(log.get("message", "")).lower()
+
+
+@dataclass
+class PackedContext:
+    logs: str
+    templates: str
+    contexts: str
+    included_contexts: List[str] = field(default_factory=list)
+    report: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class _Snippet:
+    file: str | None
+    start: int
+    end: int
+    matches: List[str]
+    lines: List[str]
+    distance: float
+    error: bool
+    text: str = ""
+    symbols: List[str] = field(default_factory=list)
+    # resolved from a stack frame in the logs rather than by similarity
+    frame: bool = False
+
+    def render(self) -> str:
+        if self.file is None:
+            return self.text
+        symbols = "".join(f"Symbol: {s}\n" for s in self.symbols)
+        matches = "".join(f"Match: {m}\n" for m in self.matches)
+        return f"File: {self.file}\nLines: {self.start}-{self.end}\n{symbols}{matches}\nContext:\n{''.join(self.lines)}"
+
+
+def _parse(hit: Dict[str, Any]) -> _Snippet:
+    doc = hit.get("document", "")
+    distance = hit.get("distance")
+    distance = float(distance) if distance is not None else 1.0
+    m = _SNIPPET.match(doc)
+    if not m:
+        return _Snippet(None, 0, 0, [], [], distance, bool(hit.get("error")), doc, frame=hit.get("source") == "frame")
+    matches = m.group("matches").split("\nMatch: ")
+    return _Snippet(
+        m.group("file"), int(m.group("start")), int(m.group("end")), matches,
+        doc[m.end():].splitlines(keepends=True), distance, bool(hit.get("error")),
+        symbols=[line[len("Symbol: "):] for line in m.group("symbols").splitlines()],
+        frame=hit.get("source") == "frame",
+    )
+
+
+def _merge(snippets: List[_Snippet]) -> Tuple[List[_Snippet], int, int]:
+    """Collapse snippets of the same file whose line ranges overlap or touch; returns (snippets, deduped, merged)."""
+    by_file: Dict[str, List[_Snippet]] = {}
+    out: List[_Snippet] = []
+    for s in snippets:
+        if s.file is None:
+            out.append(s)
+        else:
+            by_file.setdefault(s.file, []).append(s)
+    deduped = merged = 0
+    for group in by_file.values():
+        group.sort(key=lambda s: (s.start, s.end))
+        cur = group[0]
+        for s in group[1:]:
+            if s.start > cur.end:
+                out.append(cur)
+                cur = s
+                continue
+            if s.end <= cur.end:
+                deduped += 1
+            else:
+                merged += 1
+                # Context lines map to line numbers start..end-1, so the tail past cur.end is appended
+                cur.lines = cur.lines + s.lines[cur.end - s.start:]
+                cur.end = s.end
+            cur.matches += [x for x in s.matches if x not in cur.matches]
+            cur.symbols += [x for x in s.symbols if x not in cur.symbols]
+            cur.distance = min(cur.distance, s.distance)
+            cur.error = cur.error or s.error
+            cur.frame = cur.frame or s.frame
+        out.append(cur)
+    return out, deduped, merged
+
+
+def _collapse_logs(logs: Sequence[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], int]]:
+    # Consecutive lines with the same level, logger and masked message become one line with a repeat count
+    runs: List[Tuple[Dict[str, Any], int]] = []
+    prev_key = None
+    for l in logs:
+        key = (l.get("level"), l.get("logger"), mask(str(l.get("message") or "")))
+        if runs and key == prev_key:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((l, 1))
+        prev_key = key
+    return runs
+
+
+def _log_line(l: Dict[str, Any], repeats: int) -> str:
+    ts = l.get("ts") or l.get("timestamp")
+    line = f"[{ts}] {l.get('level')} {l.get('logger')}: {l.get('message')}"
+    return line if repeats == 1 else f"{line}  (x{repeats} similar consecutive lines)"
+
+
+def _pack_logs(logs: Sequence[Dict[str, Any]], budget: int) -> Tuple[str, Dict[str, Any]]:
+    runs = _collapse_logs(logs)
+    lines = [_log_line(l, n) for l, n in runs]
+    costs = [count_tokens(x) + 1 for x in lines]
+    report = {"lines": len(logs), "collapsed": len(logs) - len(runs), "included": len(runs), "omitted": 0}
+    if sum(costs) <= budget:
+        return "\n".join(lines), report
+
+    # Over budget: keep errors first, then lines nearest an error, then the first/last lines
+    errors = [i for i, (l, _) in enumerate(runs) if is_error(l)]
+    level = lambda l: 0 if is_error(l) else 1 if str(l.get("level", "")).lower().startswith("warn") else 2
+    near = lambda i: min((abs(i - e) for e in errors), default=0)
+    edge = lambda i: min(i, len(runs) - 1 - i)
+    order = sorted(range(len(runs)), key=lambda i: (level(runs[i][0]), near(i), edge(i)))
+    keep, used = set(), 0
+    for i in order:
+        if used + costs[i] <= budget:
+            keep.add(i)
+            used += costs[i]
+    out, gap = [], 0
+    for i, line in enumerate(lines):
+        if i in keep:
+            if gap:
+                out.append(f"... ({gap} lines omitted)")
+                gap = 0
+            out.append(line)
+        else:
+            gap += runs[i][1]
+    if gap:
+        out.append(f"... ({gap} lines omitted)")
+    report["included"] = len(keep)
+    report["omitted"] = sum(runs[i][1] for i in range(len(runs)) if i not in keep)
+    return "\n".join(out), report
+
+
+def _pack_templates(templates: Sequence[LogTemplate], budget: int) -> Tuple[str, int]:
+    if not templates:
+        return "", 0
+    ranked = sorted(templates, key=lambda t: -t.count)[:MAX_PROMPT_TEMPLATES]
+    rows, used = [], 0
+    for t in ranked:
+        row = f"{t.count}x {t.text}"
+        cost = count_tokens(row) + 1
+        if used + cost > budget:
+            break
+        rows.append(row)
+        used += cost
+    if not rows:
+        return "", 0
+    return "\nLog Templates (occurrences x template, variable parts masked):\n" + "\n".join(rows) + "\n", len(rows)
+
+
+def _pack_snippets(hits: Sequence[Dict[str, Any] | str], budget: int) -> Tuple[str, List[str], Dict[str, Any]]:
+    snippets = [_parse(h if isinstance(h, dict) else {"document": h}) for h in hits]
+    candidates = len(snippets)
+    snippets, deduped, merged = _merge(snippets)
+    # Stack-frame hits first, then error-linked snippets, then by retrieval distance (lower is closer)
+    snippets.sort(key=lambda s: (not s.frame, not s.error, s.distance))
+    included, used, dropped, frames = [], 0, 0, 0
+    for s in snippets:
+        text = s.render()
+        cost = count_tokens(text) + 2
+        if used + cost > budget:
+            dropped += 1
+            continue
+        included.append(text)
+        used += cost
+        frames += s.frame
+    report = {
+        "candidates": candidates, "deduped": deduped, "merged": merged,
+        "included": len(included), "frames": frames, "dropped": dropped,
+    }
+    return "\n---\n".join(included), included, report
+
+
+def pack_context(
+    logs: Sequence[Dict[str, Any]],
+    hits: Sequence[Dict[str, Any] | str],
+    templates: Sequence[LogTemplate] | None = None,
+    budget: int | None = None,
+    reserved: int = 0,
+) -> PackedContext:
+    """Fit logs, templates and retrieved snippets into ``budget`` prompt tokens.
+
+    ``hits`` are query_similar items (``document``/``metadata``/``distance``, optionally ``error``
+    and ``source``) or bare document strings. ``reserved`` is the token cost of the fixed prompt
+    text. Logs get RCA_PROMPT_LOG_SHARE of the budget, templates what they need up to a tenth, and
+    snippets the rest plus anything the logs left unused.
+    """
+    budget = budget or settings.RCA_PROMPT_TOKEN_BUDGET
+    available = max(0, budget - reserved)
+    log_text, log_report = _pack_logs(logs, int(available * settings.RCA_PROMPT_LOG_SHARE))
+    template_text, template_rows = _pack_templates(templates or [], available // 10)
+    rest = available - count_tokens(log_text) - count_tokens(template_text)
+    ctx_text, included, ctx_report = _pack_snippets(hits, max(0, rest))
+    report = {
+        "budget": budget,
+        "logs": log_report,
+        "templates": {"total": len(templates or []), "included": template_rows},
+        "contexts": ctx_report,
+    }
+    return PackedContext(log_text, template_text, ctx_text, included, report)
@@ -1,42 +1,271 @@
 from __future__ import annotations
-from typing import List, Dict, Any
-from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
+import os
+import logging
+import threading
+from typing import List, Dict, Any, Iterable, Iterator, Sequence, Tuple
+from datetime import datetime, date, timedelta
 from ..config import settings
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# One engine (and connection pool) per process, rebuilt after fork so workers never share sockets
+_ENGINE = None
+_ENGINE_PID: int | None = None
+_ENGINE_LOCK = threading.Lock()
+_POOL_COUNTERS = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidations": 0}
+
+
+def _engine_kwargs(url) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {"pool_pre_ping": True}
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        return kwargs
+    kwargs.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    if settings.DB_STATEMENT_TIMEOUT_MS and backend == "postgresql":
+        kwargs["connect_args"] = {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    return kwargs
+
+
+def _instrument(eng) -> None:
+    from sqlalchemy import event
+
+    def _count(name):
+        def _listener(*_):
+            _POOL_COUNTERS[name] += 1
+        return _listener
+
+    event.listen(eng, "connect", _count("connects"))
+    event.listen(eng, "checkout", _count("checkouts"))
+    event.listen(eng, "checkin", _count("checkins"))
+    event.listen(eng, "invalidate", _count("invalidations"))
+    if settings.DB_STATEMENT_TIMEOUT_MS and eng.dialect.name in ("mysql", "mariadb"):
+        @event.listens_for(eng, "connect")
+        def _set_timeout(dbapi_conn, _record):
+            cur = dbapi_conn.cursor()
+            try:
+                cur.execute(f"SET SESSION MAX_EXECUTION_TIME={int(settings.DB_STATEMENT_TIMEOUT_MS)}")
+            finally:
+                cur.close()
 
 
 def _engine():
+    global _ENGINE, _ENGINE_PID
     if not settings.DB_URL:
         return None
-    return create_engine(settings.DB_URL, pool_pre_ping=True)
+    pid = os.getpid()
+    if _ENGINE is not None and _ENGINE_PID == pid:
+        return _ENGINE
+    with _ENGINE_LOCK:
+        if _ENGINE is not None and _ENGINE_PID != pid:
+            # Inherited from the parent (e.g. Gunicorn preload): drop the pool without closing parent sockets
+            _ENGINE.dispose(close=False)
+            _ENGINE_PID = pid
+        if _ENGINE is None:
+            # SQLAlchemy is imported on first use, keeping it off the app's import path
+            from sqlalchemy import create_engine
+            from sqlalchemy.engine import make_url
+            url = make_url(settings.DB_URL)
+            _ENGINE = create_engine(url, **_engine_kwargs(url))
+            _instrument(_ENGINE)
+            _ENGINE_PID = pid
+            logger.info("Created DB engine for %s", url.render_as_string(hide_password=True))
+    return _ENGINE
+
+
+def _after_fork_in_child() -> None:
+    if _ENGINE is not None:
+        _ENGINE.dispose(close=False)
+        globals()["_ENGINE_PID"] = os.getpid()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def ping() -> bool:
+    """Open one pooled connection and run ``SELECT 1``; False when no DB is configured."""
+    eng = _engine()
+    if eng is None:
+        return False
+    from sqlalchemy import text
+
+    with eng.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return True
+
 
+def pool_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = dict(_POOL_COUNTERS)
+    eng = _ENGINE
+    if eng is None:
+        return stats
+    pool = eng.pool
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            stats[name] = fn()
+    stats["status"] = pool.status()
+    return stats
+
+
+# Fixed per process so dummy logs fingerprint the same across requests (see rca_cache)
+_DUMMY_BASE = datetime.utcnow()
+
+
+def _dummy_logs(correlation_id: str) -> List[Dict[str, Any]]:
+    base = _DUMMY_BASE
+    mk = lambda i, lvl, msg, logger: {
+        "ts": (base + timedelta(seconds=i)).isoformat() + "Z",
+        "row_id": i + 1,
+        "level": lvl,
+        "logger": logger,
+        "message": msg,
+        "correlation_id": correlation_id,
+    }
+    return [
+        mk(0, "INFO", f"Received request with correlation {correlation_id}", "com.example.api.Gateway"),
+        mk(1, "INFO", "Calling UserService.getUserDetails", "com.example.service.UserService"),
+        mk(2, "WARN", "Cache miss for userId=42", "com.example.cache.UserCache"),
+        mk(3, "ERROR", "NullPointerException at UserAssembler.map(User.java:87)", "com.example.assembler.UserAssembler"),
+        mk(4, "INFO", "Request completed with status=500", "com.example.api.Gateway"),
+    ]
+
+
+def _value(v: Any) -> Any:
+    # ISO timestamps keep rows JSON/NDJSON friendly and usable as the `after` cursor
+    return v.isoformat() if isinstance(v, (datetime, date)) else v
+
+
+def _row_to_log(row) -> Dict[str, Any]:
+    return {k: _value(v) for k, v in row.items()}
+
+
+def log_cursor(log: Dict[str, Any]) -> str:
+    """Keyset cursor for the rows after ``log``: ``<ts>|<row id>``, or just ``<ts>`` without a row id."""
+    if log.get("row_id") is None:
+        return str(log.get("ts"))
+    return f"{log.get('ts')}|{log.get('row_id')}"
+
+
+def _parse_cursor(after: str) -> Tuple[str, Any]:
+    # A bare timestamp (no row id) pages strictly after that timestamp
+    ts, sep, row_id = after.rpartition("|")
+    if not sep:
+        return after, None
+    return ts, int(row_id) if row_id.lstrip("-").isdigit() else row_id
+
+
+def _row_id_sql() -> Tuple[str, str]:
+    # (select item, ORDER BY tiebreaker) for COL_ROW_ID; both empty when no row id column is configured
+    col = settings.COL_ROW_ID
+    return (f",\n            {col} AS row_id", f", {col} ASC") if col else ("", "")
+
+
+def _after(log: Dict[str, Any], ts: str, row_id: Any) -> bool:
+    if row_id is None:
+        return log["ts"] > ts
+    return (log["ts"], log["row_id"]) > (ts, row_id)
+
+
+def _stream(eng, statements: Iterable[Tuple[Any, Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+    with eng.connect() as conn:
+        for sql, params in statements:
+            # Server-side cursor where the driver supports it; rows are buffered LOG_FETCH_BATCH at a time
+            result = conn.execution_options(stream_results=True, yield_per=settings.LOG_FETCH_BATCH).execute(sql, params)
+            for row in result.mappings():
+                yield _row_to_log(row)
 
-def fetch_logs_by_correlation(correlation_id: str) -> List[Dict[str, Any]]:
+
+def iter_logs_by_correlation(
+    correlation_id: str,
+    after: str | None = None,
+    limit: int | None = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield logs for a correlation ID in (timestamp, row id) order without materializing the result set.
+
+    ``after`` is a keyset cursor from :func:`log_cursor`: only rows after that (timestamp, row id)
+    are returned, so rows sharing a timestamp across a page boundary are neither skipped nor repeated.
+    Without ``COL_ROW_ID`` rows are ordered and paged by timestamp alone, and a page that ends inside
+    a run of equal timestamps skips the rest of that run.
+    """
     if not correlation_id:
-        return []
+        return
     # Development mode: return dummy logs when enabled or DB not configured
     if settings.USE_DUMMY_LOGS or not settings.DB_URL:
-        base = datetime.utcnow()
-        mk = lambda i, lvl, msg, logger: {
-            "ts": (base + timedelta(seconds=i)).isoformat() + "Z",
-            "level": lvl,
-            "logger": logger,
-            "message": msg,
-            "correlation_id": correlation_id,
-        }
-        return [
-            mk(0, "INFO", f"Received request with correlation {correlation_id}", "com.example.api.Gateway"),
-            mk(1, "INFO", "Calling UserService.getUserDetails", "com.example.service.UserService"),
-            mk(2, "WARN", "Cache miss for userId=42", "com.example.cache.UserCache"),
-            mk(3, "ERROR", "NullPointerException at UserAssembler.map(User.java:87)", "com.example.assembler.UserAssembler"),
-            mk(4, "INFO", "Request completed with status=500", "com.example.api.Gateway"),
-        ]
+        logs = _dummy_logs(correlation_id)
+        if after:
+            logs = [l for l in logs if _after(l, *_parse_cursor(after))]
+        yield from (logs[:limit] if limit else logs)
+        return
 
     eng = _engine()
     if not eng:
         # DB URL present but engine not created; return empty
-        return []
+        return
+
+    params: Dict[str, Any] = {"cid": correlation_id}
+    where = f"{settings.COL_CORRELATION_ID} = :cid"
+    if after:
+        ts, row_id = _parse_cursor(after)
+        params["after"] = ts
+        if row_id is None or not settings.COL_ROW_ID:
+            where += f" AND {settings.COL_TIMESTAMP} > :after"
+        else:
+            # Expanded row-value comparison: (ts, id) > (:after, :after_id)
+            where += (f" AND ({settings.COL_TIMESTAMP} > :after"
+                      f" OR ({settings.COL_TIMESTAMP} = :after AND {settings.COL_ROW_ID} > :after_id))")
+            params["after_id"] = row_id
+    limit_clause = ""
+    if limit:
+        limit_clause = "LIMIT :limit"
+        params["limit"] = int(limit)
+    from sqlalchemy import text
+
+    row_id, tiebreak = _row_id_sql()
+    sql = text(
+        f"""
+        SELECT 
+            {settings.COL_TIMESTAMP} AS ts,
+            {settings.COL_LEVEL} AS level,
+            {settings.COL_LOGGER} AS logger,
+            {settings.COL_MESSAGE} AS message,
+            {settings.COL_CORRELATION_ID} AS correlation_id{row_id}
+        FROM {settings.LOG_TABLE}
+        WHERE {where}
+        ORDER BY {settings.COL_TIMESTAMP} ASC{tiebreak}
+        {limit_clause}
+        """
+    )
+    yield from metrics.timed_iter(_stream(eng, [(sql, params)]), "db_fetch")
+
+
+def iter_logs_by_correlations(correlation_ids: Sequence[str]) -> Iterator[Dict[str, Any]]:
+    """Yield logs for many correlation IDs, ordered by correlation ID, timestamp and row id.
+
+    One ``WHERE correlation_id IN (...)`` query per LOG_IN_BATCH ids, streamed like
+    :func:`iter_logs_by_correlation`.
+    """
+    ids = list(dict.fromkeys(cid for cid in correlation_ids if cid))
+    if not ids:
+        return
+    if settings.USE_DUMMY_LOGS or not settings.DB_URL:
+        for cid in ids:
+            yield from _dummy_logs(cid)
+        return
+
+    eng = _engine()
+    if not eng:
+        return
+    from sqlalchemy import bindparam, text
 
+    row_id, tiebreak = _row_id_sql()
     sql = text(
         f"""
         SELECT 
@@ -44,13 +273,73 @@ def fetch_logs_by_correlation(correlation_id: str) -> List[Dict[str, Any]]:
             {settings.COL_LEVEL} AS level,
             {settings.COL_LOGGER} AS logger,
             {settings.COL_MESSAGE} AS message,
-            {settings.COL_CORRELATION_ID} AS correlation_id
+            {settings.COL_CORRELATION_ID} AS correlation_id{row_id}
+        FROM {settings.LOG_TABLE}
+        WHERE {settings.COL_CORRELATION_ID} IN :cids
+        ORDER BY {settings.COL_CORRELATION_ID} ASC, {settings.COL_TIMESTAMP} ASC{tiebreak}
+        """
+    ).bindparams(bindparam("cids", expanding=True))
+    step = max(1, settings.LOG_IN_BATCH)
+    statements = ((sql, {"cids": ids[i:i + step]}) for i in range(0, len(ids), step))
+    yield from metrics.timed_iter(_stream(eng, statements), "db_fetch")
+
+
+def fetch_logs_by_correlation(
+    correlation_id: str,
+    after: str | None = None,
+    limit: int | None = None,
+) -> List[Dict[str, Any]]:
+    return list(iter_logs_by_correlation(correlation_id, after=after, limit=limit))
+
+
+class LogFingerprint:
+    """Row count, latest timestamp and highest row id of a correlation ID's logs.
+
+    Logs are append-only, so any added or removed row changes it. Without ``COL_ROW_ID`` it is just
+    the count and latest timestamp, which misses a delete paired with an insert at an older timestamp. Built from streamed rows
+    (``update`` per row, costing nothing extra during analysis) or with one aggregate query
+    (:func:`logs_fingerprint`); both give the same ``hexdigest``.
+    """
+
+    def __init__(self, count: int = 0, max_ts: Any = None, max_row_id: Any = None):
+        self.count = count
+        self.max_ts = max_ts
+        self.max_row_id = max_row_id
+
+    def update(self, log: Dict[str, Any]) -> None:
+        self.count += 1
+        ts, row_id = log.get("ts"), log.get("row_id")
+        if ts is not None and (self.max_ts is None or ts > self.max_ts):
+            self.max_ts = ts
+        if row_id is not None and (self.max_row_id is None or row_id > self.max_row_id):
+            self.max_row_id = row_id
+
+    def hexdigest(self) -> str:
+        if self.max_row_id is None:
+            return f"{self.count}|{self.max_ts}"
+        return f"{self.count}|{self.max_ts}|{self.max_row_id}"
+
+
+def logs_fingerprint(correlation_id: str) -> str:
+    """:class:`LogFingerprint` of the current logs of a correlation ID, from one aggregate query."""
+    if settings.USE_DUMMY_LOGS or not settings.DB_URL:
+        fp = LogFingerprint()
+        for log in iter_logs_by_correlation(correlation_id):
+            fp.update(log)
+        return fp.hexdigest()
+    eng = _engine()
+    if not eng or not correlation_id:
+        return LogFingerprint().hexdigest()
+    from sqlalchemy import text
+
+    max_row_id = f"MAX({settings.COL_ROW_ID})" if settings.COL_ROW_ID else "NULL"
+    sql = text(
+        f"""
+        SELECT COUNT(*) AS n, MAX({settings.COL_TIMESTAMP}) AS max_ts, {max_row_id} AS max_row_id
         FROM {settings.LOG_TABLE}
         WHERE {settings.COL_CORRELATION_ID} = :cid
-        ORDER BY {settings.COL_TIMESTAMP} ASC
         """
     )
     with eng.connect() as conn:
-        rows = conn.execute(sql, {"cid": correlation_id}).mappings().all()
-    logs = [dict(r) for r in rows]
-    return logs
+        row = conn.execute(sql, {"cid": correlation_id}).mappings().one()
+    return LogFingerprint(row["n"], _value(row["max_ts"]), row["max_row_id"]).hexdigest()
@@ -0,0 +1,175 @@
+from __future__ import annotations
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Callable, Sequence
+from ..config import settings
+
+
+logger = logging.getLogger(__name__)
+
+_CACHE: "EmbeddingCache | None" = None
+_CACHE_LOCK = threading.Lock()
+_SQL_CHUNK = 500
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _pack(vec: Sequence[float]) -> array:
+    # float32 rows of the local engine's arrays copy as raw bytes; provider lists convert per item
+    if getattr(vec, "dtype", None) is not None:
+        return array("f", vec.astype("float32", copy=False).tobytes())
+    return array("f", vec)
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache: in-process LRU in front of a SQLite table.
+
+    Entries are keyed by (provider, model, sha1(text)), where model is ``embeddings.cache_model``
+    (the model plus every other setting that changes its vectors), so switching embedding models
+    or endpoints never serves vectors computed by another model. Vectors are held as compact float32 ``array("f")``
+    rows, in memory and on disk.
+    """
+
+    def __init__(self, path: str | None, lru_size: int):
+        self.path = path
+        self.lru_size = max(0, lru_size)
+        self._lru: "OrderedDict[Tuple[str, str, str], array]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self.lru_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " provider TEXT NOT NULL, model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (provider, model, key))"
+            )
+            self._conn.commit()
+
+    def _remember(self, k: Tuple[str, str, str], vec: array) -> None:
+        if not self.lru_size:
+            return
+        self._lru[k] = vec
+        self._lru.move_to_end(k)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, provider: str, model: str, texts: Sequence[str]) -> List[array | None]:
+        keys = [_text_key(t) for t in texts]
+        out: List[array | None] = [None] * len(texts)
+        pending: Dict[str, List[int]] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vec = self._lru.get((provider, model, key))
+                if vec is not None:
+                    self._lru.move_to_end((provider, model, key))
+                    out[i] = vec
+                    self.lru_hits += 1
+                else:
+                    pending.setdefault(key, []).append(i)
+            if pending and self._conn is not None:
+                wanted = list(pending)
+                for j in range(0, len(wanted), _SQL_CHUNK):
+                    chunk = wanted[j:j + _SQL_CHUNK]
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE provider = ? AND model = ? "
+                        f"AND key IN ({','.join('?' * len(chunk))})",
+                        [provider, model, *chunk],
+                    ).fetchall()
+                    for key, blob in rows:
+                        vec = array("f", blob)
+                        self._remember((provider, model, key), vec)
+                        for i in pending.pop(key):
+                            out[i] = vec
+                            self.disk_hits += 1
+            self.misses += sum(len(v) for v in pending.values())
+        return out
+
+    def put_many(self, provider: str, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        rows = []
+        with self._lock:
+            for t, vec in zip(texts, vectors):
+                key = _text_key(t)
+                packed = _pack(vec)
+                self._remember((provider, model, key), packed)
+                rows.append((provider, model, key, packed.tobytes()))
+            if rows and self._conn is not None:
+                try:
+                    self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning("Failed to persist %d embeddings to cache: %s", len(rows), e)
+
+    def stats(self) -> Dict[str, int]:
+        hits = self.lru_hits + self.disk_hits
+        return {
+            "hits": hits,
+            "misses": self.misses,
+            "lru_hits": self.lru_hits,
+            "disk_hits": self.disk_hits,
+            "lru_entries": len(self._lru),
+        }
+
+
+def get_cache() -> EmbeddingCache | None:
+    global _CACHE
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                try:
+                    _CACHE = EmbeddingCache(settings.EMBEDDING_CACHE_PATH or None, settings.EMBEDDING_CACHE_LRU_SIZE)
+                except sqlite3.Error as e:
+                    logger.warning("Embedding cache at %s unavailable, using memory only: %s", settings.EMBEDDING_CACHE_PATH, e)
+                    _CACHE = EmbeddingCache(None, settings.EMBEDDING_CACHE_LRU_SIZE)
+    return _CACHE
+
+
+def cached_embed(
+    provider: str,
+    model: str,
+    texts: List[str],
+    compute: Callable[[List[str]], Sequence[Sequence[float] | None]],
+) -> Sequence[Sequence[float] | None]:
+    """Serve ``texts`` from the cache and embed only the distinct misses with ``compute``.
+
+    ``compute`` may return None for items it failed to embed; those are not cached. When nothing
+    was cached or repeated, its result (e.g. one float32 array) is returned as is.
+    """
+    cache = get_cache()
+    if cache is None:
+        return compute(texts)
+    out = cache.get_many(provider, model, texts)
+    misses: Dict[str, List[int]] = {}
+    for i, vec in enumerate(out):
+        if vec is None:
+            misses.setdefault(texts[i], []).append(i)
+    if not misses:
+        return out
+    uniq = list(misses)
+    computed = compute(uniq)
+    ok_texts, ok_vecs = [], []
+    for t, vec in zip(uniq, computed):
+        if vec is None:
+            continue
+        ok_texts.append(t)
+        ok_vecs.append(vec)
+        for i in misses[t]:
+            out[i] = vec
+    cache.put_many(provider, model, ok_texts, ok_vecs)
+    if len(uniq) == len(texts) and len(ok_vecs) == len(uniq):
+        return computed
+    return out
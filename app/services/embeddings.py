@@ -1,55 +1,209 @@
 from __future__ import annotations
-from typing import List
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Dict, Any, Sequence, Tuple
 from ..config import settings
-import json
-import requests
+from . import metrics
+from .embedding_cache import cached_embed
+from .local_embedder import get_embedder
 
-# Lazy imports to speed startup
-_ST_MODEL = None
+if TYPE_CHECKING:
+    import numpy as np
 
+# Lazy imports (numpy, sentence_transformers, requests) to speed startup
+_OLLAMA_SESSION: "requests.Session | None" = None
+# Set once an Ollama server without the batch /api/embed endpoint (< 0.3) is detected
+_OLLAMA_LEGACY = False
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+logger = logging.getLogger(__name__)
 
-def _ensure_st_model():
-    global _ST_MODEL
-    if _ST_MODEL is None:
-        from sentence_transformers import SentenceTransformer
-        _ST_MODEL = SentenceTransformer(settings.ST_EMBEDDING_MODEL)
-    return _ST_MODEL
 
+def _ollama_session() -> "requests.Session":
+    global _OLLAMA_SESSION
+    if _OLLAMA_SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        # Keep-alive pool sized for the concurrent batch requests
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, settings.OLLAMA_EMBED_CONCURRENCY))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _OLLAMA_SESSION = session
+    return _OLLAMA_SESSION
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
+
+def _ollama_post(url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    # Retry connection errors, timeouts and 429/5xx with exponential backoff; other errors raise immediately
+    import requests
+    attempt = 0
+    while True:
+        try:
+            resp = _ollama_session().post(url, json=payload, timeout=settings.OLLAMA_TIMEOUT)
+            if resp.status_code not in _RETRY_STATUS or attempt >= settings.OLLAMA_MAX_RETRIES:
+                resp.raise_for_status()
+                return resp.json()
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= settings.OLLAMA_MAX_RETRIES:
+                raise
+        time.sleep(settings.OLLAMA_RETRY_BACKOFF * (2 ** attempt))
+        attempt += 1
+
+
+def _ollama_embed_batch(texts: List[str], base_url: str, model: str) -> List[List[float]]:
+    import requests
+    global _OLLAMA_LEGACY
+    if not _OLLAMA_LEGACY:
+        try:
+            data = _ollama_post(f"{base_url}/api/embed", {"model": model, "input": texts})
+            vectors = data.get("embeddings") or []
+            if len(vectors) != len(texts):
+                raise ValueError(f"Ollama returned {len(vectors)} embeddings for {len(texts)} inputs")
+            return vectors
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            logger.info("Ollama at %s has no /api/embed; using per-text /api/embeddings", base_url)
+            _OLLAMA_LEGACY = True
+    vectors = []
+    for t in texts:
+        data = _ollama_post(f"{base_url}/api/embeddings", {"model": model, "prompt": t})
+        vec = data.get("embedding") or data.get("data", [{}])[0].get("embedding")
+        if not vec:
+            raise ValueError("No embedding in Ollama response")
+        vectors.append(vec)
+    return vectors
+
+
+def ollama_embed(texts: List[str], base_url: str | None = None, model: str | None = None) -> List[List[float] | None]:
+    """Embed ``texts`` via Ollama in concurrent batches; items of batches that still fail after retries are None."""
+    base = (base_url or settings.OLLAMA_BASE_URL).rstrip("/")
+    model = model or settings.OLLAMA_EMBEDDING_MODEL
+    size = max(1, settings.OLLAMA_EMBED_BATCH_SIZE)
+    batches = [texts[i:i + size] for i in range(0, len(texts), size)]
+
+    def _run(batch: List[str]) -> List[List[float] | None]:
+        try:
+            return _ollama_embed_batch(batch, base, model)
+        except Exception as e:
+            logger.warning("Ollama embedding batch of %d failed: %s", len(batch), e)
+            return [None] * len(batch)
+
+    workers = min(max(1, settings.OLLAMA_EMBED_CONCURRENCY), len(batches))
+    if workers <= 1:
+        results = [_run(b) for b in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run, batches))
+    return [v for batch in results for v in batch]
+
+
+def _st_embed(texts: List[str]) -> "np.ndarray":
+    # Length-bucketed batches into one float32 array (see local_embedder)
+    return get_embedder().encode(texts)
+
+
+def _openai_embed(texts: List[str]) -> List[List[float] | None]:
+    try:
+        from openai import OpenAI
+        client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None)
+        resp = client.embeddings.create(model=settings.OPENAI_EMBEDDING_MODEL, input=texts)
+        return [d.embedding for d in resp.data]
+    except Exception as e:
+        logger.warning("OpenAI embeddings failed, falling back to local model: %s", e)
+        return [None] * len(texts)
+
+
+def _timed(provider: str, compute):
+    # Times the provider call only, i.e. the cache misses (stage "embed" in GET /metrics)
+    def _run(texts: List[str]):
+        with metrics.timer("embed", provider=provider):
+            return compute(texts)
+    return _run
+
+
+def _matrix(vectors: Sequence[Any]) -> "np.ndarray":
+    # One C-contiguous float32 array for the vector store, whatever mix of arrays and lists came in
+    import numpy as np
+    if isinstance(vectors, np.ndarray):
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    if not len(vectors):
+        return np.empty((0, 0), dtype=np.float32)
+    out = np.empty((len(vectors), len(vectors[0])), dtype=np.float32)
+    for i, vec in enumerate(vectors):
+        out[i] = vec
+    return out
+
+
+def _fill_with_st(texts: List[str], vectors: List[Any], provider: str) -> "np.ndarray":
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        # Fall back to the local model for failed items, in a single encode call
+        metrics.inc("embedding_fallbacks_total", len(missing), provider=provider)
+        local = cached_embed("st", cache_model("st"), [texts[i] for i in missing], _timed("st_fallback", _st_embed))
+        for i, vec in zip(missing, local):
+            vectors[i] = vec
+    return _matrix(vectors)
+
+
+def cache_model(provider: str) -> str:
+    """Model part of the embedding cache key: every setting besides the text that determines the vector.
+
+    Remote models are qualified by their endpoint, since another server can serve different
+    weights under the same model name; the local model by its backend, exported file and
+    quantization (see ``LocalEmbedder.key``).
+    """
+    if provider == "ollama":
+        return f"{settings.OLLAMA_EMBEDDING_MODEL}@{settings.OLLAMA_BASE_URL.rstrip('/')}"
+    if provider == "openai":
+        base = (settings.OPENAI_BASE_URL or "").rstrip("/")
+        return f"{settings.OPENAI_EMBEDDING_MODEL}@{base}" if base else settings.OPENAI_EMBEDDING_MODEL
+    return get_embedder().key
+
+
+def active_provider() -> Tuple[str, str]:
+    """``(provider, cache model)`` that :func:`embed_texts` embeds new texts with."""
+    if settings.USE_OLLAMA_EMBEDDINGS:
+        return "ollama", cache_model("ollama")
+    if settings.USE_OPENAI_EMBEDDINGS and settings.OPENAI_API_KEY:
+        return "openai", cache_model("openai")
+    return "st", cache_model("st")
+
+
+def embedding_signature() -> Dict[str, Any]:
+    """Provider, model and dimension of new embeddings; an index built under another signature is stale."""
+    provider, model = active_provider()
+    # One cached probe embedding after the first call
+    return {"provider": provider, "model": model, "dim": int(embed_texts(["dimension probe"]).shape[1])}
+
+
+def embed_texts(texts: List[str]) -> "np.ndarray":
+    """Embeddings of ``texts`` as a C-contiguous ``(len(texts), dim)`` float32 array."""
+    # Every provider goes through the content-addressed cache keyed by (provider, cache_model(provider), sha1(text))
     # 1) Ollama embeddings (preferred per config)
     if settings.USE_OLLAMA_EMBEDDINGS:
-        vectors: List[List[float]] = []
-        base = settings.OLLAMA_BASE_URL.rstrip("/")
-        url = f"{base}/api/embeddings"
-        for t in texts:
-            try:
-                resp = requests.post(url, json={
-                    "model": settings.OLLAMA_EMBEDDING_MODEL,
-                    "prompt": t
-                }, timeout=60)
-                resp.raise_for_status()
-                data = resp.json()
-                vec = data.get("embedding") or data.get("data", [{}])[0].get("embedding")
-                if not vec:
-                    raise ValueError("No embedding in Ollama response")
-                vectors.append(vec)
-            except Exception:
-                # If any failure, fall back to local model for that item
-                model = _ensure_st_model()
-                e = model.encode([t], convert_to_numpy=False, normalize_embeddings=True)[0]
-                vectors.append(e.tolist() if hasattr(e, 'tolist') else list(e))
-        return vectors
+        vectors = cached_embed("ollama", cache_model("ollama"), texts, _timed("ollama", ollama_embed))
+        return _fill_with_st(texts, vectors, "ollama")
 
     if settings.USE_OPENAI_EMBEDDINGS and settings.OPENAI_API_KEY:
-        try:
-            from openai import OpenAI
-            client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None)
-            resp = client.embeddings.create(model=settings.OPENAI_EMBEDDING_MODEL, input=texts)
-            return [d.embedding for d in resp.data]
-        except Exception:
-            # Fallback to local
-            pass
-    model = _ensure_st_model()
-    vecs = model.encode(texts, convert_to_numpy=False, normalize_embeddings=True)
-    return [v.tolist() if hasattr(v, 'tolist') else list(v) for v in vecs]
+        vectors = cached_embed("openai", cache_model("openai"), texts, _timed("openai", _openai_embed))
+        return _fill_with_st(texts, vectors, "openai")
+    return _matrix(cached_embed("st", cache_model("st"), texts, _timed("st", _st_embed)))
+
+
+def warm_up() -> List[str]:
+    """Load the embedding models ahead of the first request, bypassing the cache; returns the providers warmed."""
+    warmed = []
+    if settings.USE_OLLAMA_EMBEDDINGS:
+        # Ollama loads a model into memory on its first request
+        if ollama_embed(["warm-up"])[0] is not None:
+            warmed.append("ollama")
+    elif settings.USE_OPENAI_EMBEDDINGS and settings.OPENAI_API_KEY:
+        import openai  # noqa: F401  (SDK import only, no API call)
+        warmed.append("openai")
+    # The local model is either the provider or the fallback for failed remote batches
+    _st_embed(["warm-up"])
+    if settings.ST_PROCESSES != 1:
+        get_embedder().start_pool()
+    warmed.append("st")
+    return warmed
@@ -0,0 +1,190 @@
+from __future__ import annotations
+import os
+import re
+import json
+import sqlite3
+import logging
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import List, Dict, Any, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# `at [module/]com.x.Foo$Inner.bar(Foo.java:123)`; Java 9+ frames may carry `java.base@17/` or `app//` prefixes
+_FRAME = re.compile(r"\bat\s+(?:[\w.@\-]*/)*(?P<cls>[A-Za-z_$][\w$.]*)\.(?P<method>[\w$<>\-]+)\((?P<file>[\w$\-]+\.(?:java|kt)):(?P<line>\d+)\)")
+_INDEX: "FrameIndex | None" = None
+_INDEX_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Frame:
+    # Fully-qualified binary class name, as printed in the frame
+    class_name: str
+    method: str
+    file: str
+    line: int
+
+    @property
+    def text(self) -> str:
+        return f"{self.class_name}.{self.method}({self.file}:{self.line})"
+
+
+def parse_frames(message: str) -> List[Frame]:
+    """Stack frames in a log message, top of the stack first."""
+    if ".java:" not in message and ".kt:" not in message:
+        return []
+    return [
+        Frame(m.group("cls"), m.group("method"), m.group("file"), int(m.group("line")))
+        for m in _FRAME.finditer(message)
+    ]
+
+
+class FrameIndex:
+    """Direct lookup from stack frames to the method snippets that contain them.
+
+    Keyed by (fully-qualified class, file name); each key holds the sorted line spans of its
+    indexed methods, so a frame resolves with one dict probe and a bisect. Rows live in SQLite next
+    to the vector index; the in-memory map is rebuilt when the index version changes.
+    """
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._conn_pid: int | None = None
+        self._loaded_version: str | None = None
+        # (class, file) -> (span starts, [(start, end, id)]) with 1-based inclusive lines
+        self._spans: Dict[Tuple[str, str], Tuple[List[int], List[Tuple[int, int, str]]]] = {}
+        self._size = 0
+        self.lookups = 0
+        self.hits = 0
+
+    def _db(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        if self._conn is None or self._conn_pid != pid:
+            if self.path:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path or ":memory:", check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS frames ("
+                " id TEXT PRIMARY KEY, class TEXT NOT NULL, file TEXT NOT NULL,"
+                " line_start INTEGER NOT NULL, line_end INTEGER NOT NULL, document TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            conn.commit()
+            self._conn, self._conn_pid = conn, pid
+        return self._conn
+
+    # -- writes (indexing) -------------------------------------------------------------------
+
+    def add(self, docs: Sequence[Dict[str, Any]]) -> None:
+        # Only method documents know their class; call-context windows outside methods are skipped
+        rows = []
+        for d in docs:
+            meta = d.get("metadata") or {}
+            if not meta.get("class") or not meta.get("line_start"):
+                continue
+            owner = f"{meta['package']}.{meta['class']}" if meta.get("package") else meta["class"]
+            rows.append((
+                d["id"], owner, os.path.basename(meta.get("file", "")),
+                int(meta["line_start"]), int(meta["line_end"]), d["text"], json.dumps(meta),
+            ))
+        if not rows:
+            return
+        with self._lock:
+            db = self._db()
+            db.executemany("INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            db.commit()
+
+    def remove(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            db = self._db()
+            db.executemany("DELETE FROM frames WHERE id = ?", [(i,) for i in ids])
+            db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM frames")
+            db.commit()
+            self._loaded_version = None
+
+    # -- reads (retrieval) -------------------------------------------------------------------
+
+    def _ensure_loaded(self, version: str) -> None:
+        if self._loaded_version == version:
+            return
+        spans: Dict[Tuple[str, str], List[Tuple[int, int, str]]] = {}
+        rows = self._db().execute("SELECT id, class, file, line_start, line_end FROM frames").fetchall()
+        for doc_id, owner, file, start, end in rows:
+            spans.setdefault((owner, file), []).append((start, end, doc_id))
+        self._spans = {}
+        for key, group in spans.items():
+            group.sort()
+            self._spans[key] = ([s for s, _, _ in group], group)
+        self._size = len(rows)
+        self._loaded_version = version
+        logger.info("Loaded %d method spans for stack-frame lookup", len(rows))
+
+    def _find(self, frame: Frame) -> str | None:
+        owner = frame.class_name
+        while True:
+            entry = self._spans.get((owner, frame.file))
+            if entry is not None:
+                starts, group = entry
+                idx = bisect_right(starts, frame.line) - 1
+                if idx >= 0 and group[idx][0] <= frame.line <= group[idx][1]:
+                    return group[idx][2]
+            # Anonymous classes and lambdas (Foo$1, Foo$bar$1) live inside a method of the outer class
+            if "$" not in owner:
+                return None
+            owner = owner.rsplit("$", 1)[0]
+
+    def load(self, version: str) -> None:
+        """Load the in-memory index for ``version`` now rather than on the first lookup."""
+        with self._lock:
+            self._ensure_loaded(version)
+
+    def resolve(self, frames: Sequence[Frame], version: str) -> List[Tuple[Frame, str]]:
+        """``(frame, snippet id)`` for every frame that falls inside an indexed method."""
+        with self._lock:
+            self._ensure_loaded(version)
+            self.lookups += len(frames)
+            out = []
+            for frame in frames:
+                doc_id = self._find(frame)
+                if doc_id is not None:
+                    out.append((frame, doc_id))
+            self.hits += len(out)
+            return out
+
+    def documents(self, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        ids = list(dict.fromkeys(ids))
+        with self._lock:
+            db = self._db()
+            for j in range(0, len(ids), 500):
+                chunk = ids[j:j + 500]
+                for doc_id, document, metadata in db.execute(
+                    f"SELECT id, document, metadata FROM frames WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ):
+                    out[doc_id] = {"id": doc_id, "document": document, "metadata": json.loads(metadata)}
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return {"methods": self._size, "lookups": self.lookups, "hits": self.hits}
+
+
+def get_index(path: str) -> FrameIndex:
+    global _INDEX
+    if _INDEX is None or _INDEX.path != path:
+        with _INDEX_LOCK:
+            if _INDEX is None or _INDEX.path != path:
+                _INDEX = FrameIndex(path)
+    return _INDEX
+
+
+def peek_index() -> FrameIndex | None:
+    return _INDEX
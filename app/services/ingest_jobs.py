@@ -0,0 +1,237 @@
+from __future__ import annotations
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List
+from ..config import settings
+from . import code_scan
+
+try:
+    import fcntl
+except ImportError:  # Windows: the in-process guard below still applies
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = ("queued", "running")
+_JOBS: "IngestJobs | None" = None
+_JOBS_LOCK = threading.Lock()
+_LOCAL_GUARD = threading.Lock()
+_KEEP_JOBS = 200
+
+
+class IngestBusy(RuntimeError):
+    """Another ingest holds the collection; ``job`` is its record when known."""
+
+    def __init__(self, job: Dict[str, Any] | None):
+        super().__init__(f"An ingest is already running for collection '{settings.CHROMA_COLLECTION}'")
+        self.job = job
+
+
+class _CollectionLock:
+    # flock on a file next to the scan manifest, so the guard holds across Gunicorn workers;
+    # the kernel drops it if the owning process dies
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: int | None = None
+
+    def acquire(self) -> bool:
+        if fcntl is None:
+            return _LOCAL_GUARD.acquire(blocking=False)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if fcntl is None:
+            _LOCAL_GUARD.release()
+        elif self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class IngestJobs:
+    """Background ``scan_and_index`` runs with progress reporting and cancellation.
+
+    Jobs run one at a time on a local worker thread (the scan itself fans out to the
+    SCAN_WORKERS process pool). Job records live in SQLite at INGEST_JOBS_PATH so any worker
+    process can report status or request a cancel; the running scan polls for the cancel flag
+    whenever it publishes progress (at most every INGEST_PROGRESS_INTERVAL seconds).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+        self._futures: Dict[str, Future] = {}
+        self._cancel: Dict[str, threading.Event] = {}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, collection TEXT NOT NULL, path TEXT NOT NULL, full INTEGER NOT NULL,"
+                " status TEXT NOT NULL, created REAL NOT NULL, started REAL, finished REAL,"
+                " progress TEXT, result TEXT, error TEXT, cancel_requested INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        for key in ("progress", "result"):
+            if key in fields:
+                fields[key] = json.dumps(fields[key])
+        with self._lock:
+            db = self._db()
+            db.execute(
+                f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                [*fields.values(), job_id],
+            )
+            db.commit()
+
+    def _row(self, row) -> Dict[str, Any]:
+        keys = ("id", "collection", "path", "full", "status", "created", "started", "finished",
+                "progress", "result", "error", "cancel_requested")
+        job = dict(zip(keys, row))
+        job["full"] = bool(job["full"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        with self._lock:
+            row = self._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db().execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row(r) for r in rows]
+
+    def active(self) -> Dict[str, Any] | None:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT * FROM jobs WHERE collection = ? AND status IN (?, ?) ORDER BY created DESC LIMIT 1",
+                (settings.CHROMA_COLLECTION, *ACTIVE),
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def submit(self, java_path: str, full: bool = False) -> Dict[str, Any]:
+        """Queue an ingest of ``java_path``; raises :class:`IngestBusy` if one is already running."""
+        guard = _CollectionLock(os.path.join(
+            os.path.dirname(code_scan._manifest_path()), f"{settings.CHROMA_COLLECTION}.ingest.lock",
+        ))
+        if not guard.acquire():
+            raise IngestBusy(self.active())
+        try:
+            now = time.time()
+            job_id = uuid.uuid4().hex
+            with self._lock:
+                db = self._db()
+                # Holding the lock means no live process owns these; they died mid-scan
+                db.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'interrupted', finished = ?"
+                    " WHERE collection = ? AND status IN (?, ?)",
+                    (now, settings.CHROMA_COLLECTION, *ACTIVE),
+                )
+                db.execute(
+                    "INSERT INTO jobs (id, collection, path, full, status, created) VALUES (?, ?, ?, ?, 'queued', ?)",
+                    (job_id, settings.CHROMA_COLLECTION, java_path, int(full), now),
+                )
+                db.execute(
+                    "DELETE FROM jobs WHERE id NOT IN (SELECT id FROM jobs ORDER BY created DESC LIMIT ?)",
+                    (_KEEP_JOBS,),
+                )
+                db.commit()
+            self._cancel[job_id] = threading.Event()
+            self._futures = {k: f for k, f in self._futures.items() if not f.done()}
+            self._futures[job_id] = self._executor.submit(self._run, job_id, java_path, full, guard)
+        except BaseException:
+            guard.release()
+            raise
+        return self.get(job_id)
+
+    def cancel(self, job_id: str) -> Dict[str, Any] | None:
+        job = self.get(job_id)
+        if job is None or job["status"] not in ACTIVE:
+            return job
+        self._update(job_id, cancel_requested=1)
+        event = self._cancel.get(job_id)
+        if event is not None:
+            event.set()
+        return self.get(job_id)
+
+    def wait(self, job_id: str, timeout: float | None = None) -> Dict[str, Any] | None:
+        # Only jobs submitted by this process can be awaited
+        future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout=timeout)
+        return self.get(job_id)
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        if self._cancel[job_id].is_set():
+            return True
+        with self._lock:
+            row = self._db().execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _run(self, job_id: str, java_path: str, full: bool, guard: _CollectionLock) -> None:
+        last = 0.0
+
+        def _progress(snapshot: Dict[str, Any]) -> None:
+            nonlocal last
+            now = time.monotonic()
+            if snapshot["phase"] == "scanning" and now - last < settings.INGEST_PROGRESS_INTERVAL:
+                return
+            last = now
+            self._update(job_id, progress=snapshot)
+            if self._cancel_requested(job_id):
+                raise code_scan.ScanCancelled()
+
+        try:
+            if self._cancel_requested(job_id):
+                raise code_scan.ScanCancelled()
+            self._update(job_id, status="running", started=time.time())
+            stats = code_scan.scan_and_index(java_path, full=full, progress=_progress)
+            status = "failed" if stats.get("error") else "succeeded"
+            self._update(job_id, status=status, result=stats, error=stats.get("error"), finished=time.time())
+            logger.info("Ingest job %s %s: %s", job_id, status, stats)
+        except code_scan.ScanCancelled:
+            self._update(job_id, status="cancelled", finished=time.time())
+            logger.info("Ingest job %s cancelled", job_id)
+        except Exception as e:
+            logger.exception("Ingest job %s failed", job_id)
+            self._update(job_id, status="failed", error=str(e), finished=time.time())
+        finally:
+            guard.release()
+            self._cancel.pop(job_id, None)
+
+
+def get_jobs() -> IngestJobs:
+    global _JOBS
+    # The worker thread doesn't survive a fork; each process gets its own runner
+    if _JOBS is None or _JOBS.pid != os.getpid():
+        with _JOBS_LOCK:
+            if _JOBS is None or _JOBS.pid != os.getpid():
+                _JOBS = IngestJobs(settings.INGEST_JOBS_PATH)
+    return _JOBS
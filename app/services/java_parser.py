@@ -0,0 +1,163 @@
+from __future__ import annotations
+import re
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import List
+
+
+# Declarations that open a type body; Kotlin's `companion object` has no name
+_TYPE_DECL = re.compile(r"\b(?:class|interface|enum|record|object)\s+([A-Za-z_]\w*)|\bcompanion\s+object\b")
+_CALL_NAME = re.compile(r"([A-Za-z_]\w*)\s*(?:<[^>]*>\s*)?\(")
+_KOTLIN_FUN = re.compile(r"\bfun\s+(?:<[^>]*>\s*)?(?:[\w.]+\.)?([A-Za-z_]\w*)\s*\(")
+_PACKAGE = re.compile(r"^\s*package\s+([\w.]+)", re.MULTILINE)
+_COMMENTS = re.compile(r"//[^\n]*|/\*[\s\S]*?\*/")
+_NOT_METHODS = {
+    "if", "for", "while", "switch", "catch", "synchronized", "try", "return", "new", "else", "do",
+    "when", "super", "this", "throw", "assert",
+}
+
+
+@dataclass
+class Method:
+    package: str
+    # Binary name within the package (Outer$Inner), as in stack frames
+    class_name: str
+    name: str
+    # 0-based, half-open line span from the declaration (after annotations/comments) to the closing brace
+    start: int
+    end: int
+
+    @property
+    def symbol(self) -> str:
+        owner = f"{self.package}.{self.class_name}" if self.package else self.class_name
+        return f"{owner}.{self.name}"
+
+
+def parse_package(text: str) -> str:
+    """The file's ``package`` declaration, or "" for the default package."""
+    m = _PACKAGE.search(text)
+    return m.group(1) if m else ""
+
+
+def _header_start(text: str, start: int, end: int) -> int:
+    # Skip whitespace and comments before a declaration so spans start at the first real token
+    i = start
+    while i < end:
+        if text[i].isspace():
+            i += 1
+        elif text.startswith("//", i):
+            nl = text.find("\n", i)
+            i = end if nl == -1 else nl + 1
+        elif text.startswith("/*", i):
+            close = text.find("*/", i + 2)
+            i = end if close == -1 else close + 2
+        else:
+            break
+    return i
+
+
+def _method_name(header: str) -> str | None:
+    header = _COMMENTS.sub(" ", header)
+    # Last match: expression-bodied `fun a() = 1` needs no `;`, so it can share the header
+    funs = list(_KOTLIN_FUN.finditer(header))
+    if funs:
+        return funs[-1].group(1)
+    # Field initializers (`Runnable r = new Runnable() {`) and lambdas are not declarations
+    paren = header.find("(")
+    if paren == -1 or "=" in header[:paren] or "->" in header:
+        return None
+    for m in _CALL_NAME.finditer(header):
+        name = m.group(1)
+        if name in _NOT_METHODS:
+            return None
+        # Skip annotation arguments like @RequestMapping("/x")
+        if header[:m.start()].rstrip().endswith("@"):
+            continue
+        return name
+    return None
+
+
+def parse_methods(text: str) -> List[Method]:
+    """Method/constructor spans of a Java or Kotlin source file.
+
+    A brace-matching scan that skips string/char literals (including text blocks and raw strings)
+    and comments. Bodies directly inside a class/interface/enum/object body whose header looks like
+    a declaration become methods; anything nested (lambdas, anonymous classes, local blocks) belongs
+    to the enclosing method. Kotlin ``init`` blocks are reported as ``init``.
+    """
+    package = parse_package(text)
+    offsets = [0]
+    for m in re.finditer("\n", text):
+        offsets.append(m.end())
+    line_of = lambda idx: bisect_right(offsets, idx) - 1
+
+    methods: List[Method] = []
+    # Stack entries: ("class", name) | ("method", name, header_start, class_name) | ("block",)
+    stack: list = []
+    header_start = 0
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if c == '"':
+            if text.startswith('"""', i):
+                close = text.find('"""', i + 3)
+                i = n if close == -1 else close + 3
+                continue
+            i += 1
+            while i < n and text[i] != '"' and text[i] != "\n":
+                i += 2 if text[i] == "\\" else 1
+        elif c == "'":
+            i += 1
+            while i < n and text[i] != "'" and text[i] != "\n":
+                i += 2 if text[i] == "\\" else 1
+        elif c == "/" and text.startswith("//", i):
+            nl = text.find("\n", i)
+            i = n if nl == -1 else nl
+            continue
+        elif c == "/" and text.startswith("/*", i):
+            close = text.find("*/", i + 2)
+            i = n if close == -1 else close + 2
+            continue
+        elif c == ";":
+            header_start = i + 1
+        elif c == "{":
+            header = text[header_start:i]
+            in_type_body = not stack or stack[-1][0] == "class"
+            type_decl = _TYPE_DECL.search(_COMMENTS.sub(" ", header)) if in_type_body else None
+            enclosing = next((f[1] for f in reversed(stack) if f[0] == "class"), "")
+            if type_decl:
+                # JVM binary names (Outer$Inner), as they appear in stack frames
+                name = type_decl.group(1) or "Companion"
+                stack.append(("class", f"{enclosing}${name}" if enclosing else name))
+            elif in_type_body and stack:
+                name = _method_name(header)
+                if name is None and re.fullmatch(r"\s*init\s*", _COMMENTS.sub(" ", header)):
+                    name = "init"
+                if name:
+                    stack.append(("method", name, _header_start(text, header_start, i), enclosing))
+                else:
+                    stack.append(("block",))
+            else:
+                stack.append(("block",))
+            header_start = i + 1
+        elif c == "}":
+            if stack:
+                frame = stack.pop()
+                if frame[0] == "method":
+                    methods.append(Method(package, frame[3], frame[1], line_of(frame[2]), line_of(i) + 1))
+            header_start = i + 1
+        i += 1
+    methods.sort(key=lambda m: m.start)
+    return methods
+
+
+def enclosing_method(methods: List[Method], line: int, starts: List[int] | None = None) -> Method | None:
+    """Method whose span contains 0-based ``line``; ``starts`` caches ``[m.start for m in methods]``.
+
+    Recorded spans never overlap (only bodies directly in a type body are methods), so the
+    candidate is the last method starting at or before ``line``.
+    """
+    idx = bisect_right(starts if starts is not None else [m.start for m in methods], line) - 1
+    if idx >= 0 and methods[idx].start <= line < methods[idx].end:
+        return methods[idx]
+    return None
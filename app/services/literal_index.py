@@ -0,0 +1,252 @@
+from __future__ import annotations
+import os
+import re
+import json
+import math
+import sqlite3
+import logging
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Sequence, Tuple
+from ..config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Placeholders in logger format strings: SLF4J {}, printf %s/%d/..., Kotlin $name / ${expr}
+_PLACEHOLDER = re.compile(r"\{\}|%[-#+ 0,(]*\d*(?:\.\d+)?[sdfxXoeEgGbBchn%]|\$\{[^}]*\}|\$[A-Za-z_]\w*")
+_TOKEN = re.compile(r"[A-Za-z][A-Za-z0-9_]{2,}")
+_INDEX: "LiteralIndex | None" = None
+_INDEX_LOCK = threading.Lock()
+
+
+def tokenize(text: str) -> List[str]:
+    return [t.lower() for t in _TOKEN.findall(text)]
+
+
+def _constant_chars(literal: str) -> int:
+    return sum(len(p.strip()) for p in _PLACEHOLDER.split(literal))
+
+
+def _segments(literal: str) -> List[str]:
+    # Constant parts between placeholders; outer whitespace is ignored like the message's
+    parts = _PLACEHOLDER.split(literal.strip())
+    if len(parts) == 1:
+        return parts
+    # Adjacent placeholders leave empty middle parts, which constrain nothing
+    return [parts[0], *(p for p in parts[1:-1] if p), parts[-1]]
+
+
+def fullmatch(parts: Sequence[str], message: str) -> bool:
+    """True when ``message`` is the literal with ``parts`` as its constant text and anything at the placeholders.
+
+    Linear scan with no backtracking: the first part must prefix and the last suffix the message,
+    and each middle part is taken at its earliest occurrence after the previous one (leftmost
+    placement is optimal when the gaps match anything).
+    """
+    text = message.strip()
+    if len(parts) == 1:
+        return text == parts[0]
+    first, last = parts[0], parts[-1]
+    end = len(text) - len(last)
+    if end < len(first) or not text.startswith(first) or not text.endswith(last):
+        return False
+    pos = len(first)
+    for part in parts[1:-1]:
+        pos = text.find(part, pos, end)
+        if pos < 0:
+            return False
+        pos += len(part)
+    return True
+
+
+class LiteralIndex:
+    """Inverted index over the log-format literals of indexed snippets.
+
+    Exact lookups fullmatch a log message against the literals sharing its rarest token (format
+    placeholders become wildcards); ``bm25`` ranks literals by token overlap for partial matches.
+    Rows live in SQLite next to the vector index; the in-memory postings are rebuilt when the
+    index version changes.
+    """
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._conn_pid: int | None = None
+        self._loaded_version: str | None = None
+        self._ids: List[str] = []
+        self._literals: List[str] = []
+        # Split on first probe; most literals are never a candidate
+        self._parts: List[List[str] | None] = []
+        self._constants: List[int] = []
+        self._anchors: Dict[str, List[int]] = {}
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        self.exact_hits = 0
+        self.lookups = 0
+
+    def _db(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        if self._conn is None or self._conn_pid != pid:
+            if self.path:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path or ":memory:", check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Pre-method-index layout (one literal per document); rebuilt by the forced rescan
+            conn.execute("DROP TABLE IF EXISTS literals")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, document TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS formats (id TEXT NOT NULL, literal TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS formats_id ON formats (id)")
+            conn.commit()
+            self._conn, self._conn_pid = conn, pid
+        return self._conn
+
+    # -- writes (indexing) -------------------------------------------------------------------
+
+    def add(self, docs: Sequence[Dict[str, Any]]) -> None:
+        # metadata["log_format"] holds one format per line (a method document can have several calls)
+        doc_rows, format_rows = [], []
+        for d in docs:
+            meta = d.get("metadata") or {}
+            literals = [l for l in (meta.get("log_format") or "").split("\n") if _constant_chars(l)]
+            if literals:
+                doc_rows.append((d["id"], d["text"], json.dumps(meta)))
+                format_rows += [(d["id"], l) for l in literals]
+        if not doc_rows:
+            return
+        with self._lock:
+            db = self._db()
+            db.executemany("DELETE FROM formats WHERE id = ?", [(r[0],) for r in doc_rows])
+            db.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?, ?)", doc_rows)
+            db.executemany("INSERT INTO formats VALUES (?, ?)", format_rows)
+            db.commit()
+
+    def remove(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            db = self._db()
+            db.executemany("DELETE FROM formats WHERE id = ?", [(i,) for i in ids])
+            db.executemany("DELETE FROM docs WHERE id = ?", [(i,) for i in ids])
+            db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM formats")
+            db.execute("DELETE FROM docs")
+            db.commit()
+            self._loaded_version = None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM formats").fetchone()[0]
+
+    # -- reads (retrieval) -------------------------------------------------------------------
+
+    def _ensure_loaded(self, version: str) -> None:
+        if self._loaded_version == version:
+            return
+        rows = self._db().execute("SELECT id, literal FROM formats").fetchall()
+        ids, literals, constants, lengths = [], [], [], []
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for i, (doc_id, literal) in enumerate(rows):
+            ids.append(doc_id)
+            literals.append(literal)
+            constants.append(_constant_chars(literal))
+            tf = Counter(tokenize(_PLACEHOLDER.sub(" ", literal)))
+            lengths.append(sum(tf.values()))
+            for tok, n in tf.items():
+                postings.setdefault(tok, []).append((i, n))
+        anchors: Dict[str, List[int]] = {}
+        for i, (doc_id, literal) in enumerate(rows):
+            toks = set(tokenize(_PLACEHOLDER.sub(" ", literal)))
+            if toks:
+                # Index each literal under its rarest token: a message can only fullmatch the
+                # literal if it contains every constant token, so one bucket probe per token suffices
+                rarest = min(toks, key=lambda t: len(postings[t]))
+                anchors.setdefault(rarest, []).append(i)
+        self._ids, self._literals, self._constants, self._lengths = ids, literals, constants, lengths
+        self._parts = [None] * len(ids)
+        self._postings, self._anchors = postings, anchors
+        self._loaded_version = version
+        logger.info("Loaded %d log-format literals", len(ids))
+
+    def load(self, version: str) -> None:
+        """Load the in-memory index for ``version`` now rather than on the first lookup."""
+        with self._lock:
+            self._ensure_loaded(version)
+
+    def exact(self, message: str, version: str) -> List[str]:
+        """Ids of snippets whose literal fullmatches ``message``, longest constant text first."""
+        with self._lock:
+            self._ensure_loaded(version)
+            self.lookups += 1
+            found = []
+            for tok in set(tokenize(message)):
+                for i in self._anchors.get(tok, ()):
+                    if self._constants[i] < settings.LITERAL_MIN_CHARS:
+                        continue
+                    parts = self._parts[i]
+                    if parts is None:
+                        parts = self._parts[i] = _segments(self._literals[i])
+                    if fullmatch(parts, message):
+                        found.append((self._constants[i], i))
+            if found:
+                self.exact_hits += 1
+            return list(dict.fromkeys(self._ids[i] for _, i in sorted(found, reverse=True)))
+
+    def bm25(self, text: str, version: str, top_k: int, k1: float = 1.2, b: float = 0.75) -> List[Tuple[str, float]]:
+        with self._lock:
+            self._ensure_loaded(version)
+            n = len(self._ids)
+            if not n:
+                return []
+            avg = sum(self._lengths) / n or 1.0
+            scores: Dict[int, float] = {}
+            for tok in set(tokenize(text)):
+                posting = self._postings.get(tok)
+                # Tokens in most literals carry ~zero idf but dominate the cost; skip them
+                if not posting or (n > 100 and len(posting) * 2 > n):
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for i, tf in posting:
+                    norm = tf + k1 * (1 - b + b * self._lengths[i] / avg)
+                    scores[i] = scores.get(i, 0.0) + idf * tf * (k1 + 1) / norm
+            # A document scores as its best-matching literal
+            best: Dict[str, float] = {}
+            for i, score in scores.items():
+                doc_id = self._ids[i]
+                if score > best.get(doc_id, 0.0):
+                    best[doc_id] = score
+            return sorted(best.items(), key=lambda kv: -kv[1])[:top_k]
+
+    def documents(self, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        ids = list(dict.fromkeys(ids))
+        with self._lock:
+            db = self._db()
+            for j in range(0, len(ids), 500):
+                chunk = ids[j:j + 500]
+                for doc_id, document, metadata in db.execute(
+                    f"SELECT id, document, metadata FROM docs WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ):
+                    out[doc_id] = {"id": doc_id, "document": document, "metadata": json.loads(metadata)}
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return {"literals": len(self._ids), "lookups": self.lookups, "exact_hits": self.exact_hits}
+
+
+def get_index(path: str) -> LiteralIndex:
+    global _INDEX
+    if _INDEX is None or _INDEX.path != path:
+        with _INDEX_LOCK:
+            if _INDEX is None or _INDEX.path != path:
+                _INDEX = LiteralIndex(path)
+    return _INDEX
+
+
+def peek_index() -> LiteralIndex | None:
+    return _INDEX
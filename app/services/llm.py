@@ -1,85 +1,242 @@
 from __future__ import annotations
-from typing import List, Dict, Any
+import time
+import asyncio
+import weakref
+from typing import List, Dict, Any, Sequence, AsyncIterator
 from ..config import settings
+from . import aio, metrics
+from .log_templates import LogTemplate
+from .context_packer import PackedContext, pack_context, count_tokens
 
+# One AsyncOpenAI client (and HTTP connection pool) per event loop
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
 
-def generate_rca(logs: List[Dict[str, Any]], contexts: List[str]) -> str:
-    prompt = _build_prompt(logs, contexts)
+SYSTEM_PROMPT = (
+    "You are a senior SRE. Generate a professional RCA report in clean Markdown format. Use the following exact sections with detailed, actionable content:\n\n"
+    "# Summary\n"
+    "- Provide a brief overview of the incident and key findings.\n\n"
+    "# Timeline\n"
+    "- List 5-10 key events in chronological order using format: `- **YYYY-MM-DD HH:MM:SS** - [Level] - Logger: Message`\n"
+    "- Use **bold** for timestamps and levels.\n\n"
+    "# Root Cause\n"
+    "- Clearly state the primary cause with evidence from logs/context.\n\n"
+    "# Contributing Factors\n"
+    "- Bullet list of secondary factors (e.g., configuration, dependencies).\n\n"
+    "# Impact\n"
+    "- Describe the business/technical impact with metrics if available.\n\n"
+    "# Affected Components\n"
+    "- List components (e.g., services, classes) with brief descriptions.\n\n"
+    "# Recommended Fix\n"
+    "- Step-by-step remediation actions, including code/config changes.\n\n"
+    "# Preventive Actions\n"
+    "- Long-term measures like monitoring, alerts, and improvements.\n\n"
+    "Use bullet points, **bold** key terms, and keep it concise but specific. Ensure the Markdown renders well in a web UI."
+)
+
+
+def _messages(prompt: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _async_client():
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None)
+        _ASYNC_CLIENTS[loop] = client
+    return client
+
+
+_FAILED_HEADER = "# Summary\n- LLM generation failed."
+_NO_KEY_HEADER = "# Summary\n- LLM is required but no API key is configured."
+
+
+def is_error_report(text: str) -> bool:
+    """True for the placeholder reports returned when the LLM could not be used (never cache these)."""
+    return text.startswith(_FAILED_HEADER) or text.startswith(_NO_KEY_HEADER) or "\n---\nStream interrupted: " in text
+
+
+def _failure_text(e: Exception) -> str:
+    return (
+        _FAILED_HEADER + "\n\n"
+        f"Error: {e}\n\n"
+        "Check OPENAI_BASE_URL, OPENAI_API_KEY, and LLM_MODEL (must be a chat-capable model)."
+    )
+
+
+def _count_usage(resp) -> None:
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return
+    metrics.inc("llm_tokens_total", usage.prompt_tokens or 0, kind="prompt", source="usage")
+    metrics.inc("llm_tokens_total", usage.completion_tokens or 0, kind="completion", source="usage")
+
+
+def _without_llm(logs: List[Dict[str, Any]], contexts: List[str]) -> str:
+    # If LLM is required but no API key is set, report explicitly
+    if settings.REQUIRE_LLM and not settings.OPENAI_API_KEY:
+        return (
+            _NO_KEY_HEADER + "\n\n"
+            "Set OPENAI_API_KEY and (optionally) OPENAI_BASE_URL to a compatible endpoint, and use a chat model in LLM_MODEL."
+        )
+
+    # Fallback simple heuristic summary (only when REQUIRE_LLM is disabled)
+    return _fallback_summary(logs, contexts)
+
+
+def generate_rca(logs: List[Dict[str, Any]], contexts: List[str], templates: Sequence[LogTemplate] | None = None, packed: PackedContext | None = None) -> str:
+    prompt = _build_prompt(logs, contexts, templates, packed)
 
     if settings.OPENAI_API_KEY:
         try:
             from openai import OpenAI
             client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None)
-            resp = client.chat.completions.create(
+            with metrics.timer("llm", mode="sync"):
+                resp = client.chat.completions.create(
+                    model=settings.LLM_MODEL,
+                    messages=_messages(prompt),
+                    temperature=0.2,
+                )
+            metrics.inc("llm_requests_total", outcome="ok")
+            _count_usage(resp)
+            return resp.choices[0].message.content
+        except Exception as e:
+            metrics.inc("llm_requests_total", outcome="error")
+            if settings.REQUIRE_LLM:
+                return _failure_text(e)
+            # else fall through to heuristic
+    else:
+        metrics.inc("llm_requests_total", outcome="no_key")
+
+    return _without_llm(logs, contexts)
+
+
+async def agenerate_rca(logs: List[Dict[str, Any]], contexts: List[str], templates: Sequence[LogTemplate] | None = None, packed: PackedContext | None = None) -> str:
+    """Non-blocking variant of :func:`generate_rca`; the chat call runs on the caller's event loop."""
+    prompt = _build_prompt(logs, contexts, templates, packed)
+
+    if settings.OPENAI_API_KEY:
+        try:
+            with metrics.timer("llm", mode="async"):
+                resp = await _async_client().chat.completions.create(
+                    model=settings.LLM_MODEL,
+                    messages=_messages(prompt),
+                    temperature=0.2,
+                )
+            metrics.inc("llm_requests_total", outcome="ok")
+            _count_usage(resp)
+            return resp.choices[0].message.content
+        except Exception as e:
+            metrics.inc("llm_requests_total", outcome="error")
+            if settings.REQUIRE_LLM:
+                return _failure_text(e)
+    else:
+        metrics.inc("llm_requests_total", outcome="no_key")
+
+    return _without_llm(logs, contexts)
+
+
+async def astream_rca(logs: List[Dict[str, Any]], contexts: List[str], templates: Sequence[LogTemplate] | None = None, packed: PackedContext | None = None) -> AsyncIterator[str]:
+    """Yield the RCA Markdown in pieces as the model produces them (OpenAI ``stream=True``).
+
+    Failures before the first token fall back exactly like :func:`agenerate_rca`; after that the
+    error text is appended to what was already streamed. Streamed responses carry no ``usage``,
+    so their token counts are estimated with :func:`count_tokens`.
+    """
+    prompt = _build_prompt(logs, contexts, templates, packed)
+
+    if settings.OPENAI_API_KEY:
+        started = False
+        t0 = time.perf_counter()
+        pieces: List[str] = []
+        try:
+            stream = await _async_client().chat.completions.create(
                 model=settings.LLM_MODEL,
-                messages=[
-                    {"role": "system", "content": (
-                        "You are a senior SRE. Generate a professional RCA report in clean Markdown format. Use the following exact sections with detailed, actionable content:\n\n"
-                        "# Summary\n"
-                        "- Provide a brief overview of the incident and key findings.\n\n"
-                        "# Timeline\n"
-                        "- List 5-10 key events in chronological order using format: `- **YYYY-MM-DD HH:MM:SS** - [Level] - Logger: Message`\n"
-                        "- Use **bold** for timestamps and levels.\n\n"
-                        "# Root Cause\n"
-                        "- Clearly state the primary cause with evidence from logs/context.\n\n"
-                        "# Contributing Factors\n"
-                        "- Bullet list of secondary factors (e.g., configuration, dependencies).\n\n"
-                        "# Impact\n"
-                        "- Describe the business/technical impact with metrics if available.\n\n"
-                        "# Affected Components\n"
-                        "- List components (e.g., services, classes) with brief descriptions.\n\n"
-                        "# Recommended Fix\n"
-                        "- Step-by-step remediation actions, including code/config changes.\n\n"
-                        "# Preventive Actions\n"
-                        "- Long-term measures like monitoring, alerts, and improvements.\n\n"
-                        "Use bullet points, **bold** key terms, and keep it concise but specific. Ensure the Markdown renders well in a web UI."
-                    )},
-                    {"role": "user", "content": prompt},
-                ],
+                messages=_messages(prompt),
                 temperature=0.2,
+                stream=True,
             )
-            return resp.choices[0].message.content
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    started = True
+                    pieces.append(delta)
+                    yield delta
+            metrics.record("llm", time.perf_counter() - t0, mode="stream")
+            metrics.inc("llm_requests_total", outcome="ok")
+            prompt_tokens = (packed.report.get("prompt_tokens") if packed else None) or count_tokens(SYSTEM_PROMPT) + count_tokens(prompt)
+            metrics.inc("llm_tokens_total", prompt_tokens, kind="prompt", source="estimate")
+            metrics.inc("llm_tokens_total", count_tokens("".join(pieces)), kind="completion", source="estimate")
+            return
         except Exception as e:
+            metrics.inc("llm_requests_total", outcome="error")
+            if started:
+                yield f"\n\n---\nStream interrupted: {e}\n"
+                return
             if settings.REQUIRE_LLM:
-                return (
-                    "# Summary\n- LLM generation failed.\n\n"
-                    f"Error: {e}\n\n"
-                    "Check OPENAI_BASE_URL, OPENAI_API_KEY, and LLM_MODEL (must be a chat-capable model)."
-                )
-            # else fall through to heuristic
+                yield _failure_text(e)
+                return
+    else:
+        metrics.inc("llm_requests_total", outcome="no_key")
 
-    # If LLM is required but no API key is set, report explicitly
-    if settings.REQUIRE_LLM and not settings.OPENAI_API_KEY:
-        return (
-            "# Summary\n- LLM is required but no API key is configured.\n\n"
-            "Set OPENAI_API_KEY and (optionally) OPENAI_BASE_URL to a compatible endpoint, and use a chat model in LLM_MODEL."
-        )
+    yield _without_llm(logs, contexts)
 
-    # Fallback simple heuristic summary (only when REQUIRE_LLM is disabled)
-    return _fallback_summary(logs, contexts)
 
+def warm_up() -> bool:
+    """Import the OpenAI SDK and build the shared event loop's client (no API call)."""
+    if not settings.OPENAI_API_KEY:
+        return False
 
-def _build_prompt(logs: List[Dict[str, Any]], contexts: List[str]) -> str:
-    log_lines = []
-    for l in logs:
-        ts = l.get("ts") or l.get("timestamp")
-        lvl = l.get("level")
-        msg = l.get("message")
-        logger = l.get("logger")
-        log_lines.append(f"[{ts}] {lvl} {logger}: {msg}")
-
-    ctx_sample = "\n---\n".join(contexts[:10])
-
-    prompt = (
-        "You are given application logs with the same correlation ID and retrieved code/log snippets from a Java Spring app.\n"
-        "Generate a precise RCA report using the sections defined in the system message. Follow these guidelines:\n"
-        "- **Timeline**: Extract 5-10 key events in chronological order. Format each as `- **YYYY-MM-DD HH:MM:SS** - [Level] - Logger: Message` (use actual timestamps from logs).\n"
-        "- **Affected Components**: Reference package/class names from context (e.g., com.example.api.Gateway).\n"
-        "- **Recommended Fix & Preventive Actions**: Provide concrete, numbered steps for fixes and long-term measures.\n"
-        "- **Overall**: Keep it professional, use **bold** for emphasis, and ensure clean Markdown that renders well in a web UI.\n\n"
-        "Logs:\n" + "\n".join(log_lines) + "\n\nRetrieved Context:\n" + ctx_sample + "\n"
+    async def _build():
+        _async_client()
+
+    aio.run(_build())
+    return True
+
+
+_PROMPT_HEADER = (
+    "You are given application logs with the same correlation ID and retrieved code/log snippets from a Java Spring app.\n"
+    "Generate a precise RCA report using the sections defined in the system message. Follow these guidelines:\n"
+    "- **Timeline**: Extract 5-10 key events in chronological order. Format each as `- **YYYY-MM-DD HH:MM:SS** - [Level] - Logger: Message` (use actual timestamps from logs).\n"
+    "- **Affected Components**: Reference package/class names from context (e.g., com.example.api.Gateway).\n"
+    "- **Recommended Fix & Preventive Actions**: Provide concrete, numbered steps for fixes and long-term measures.\n"
+    "- **Overall**: Keep it professional, use **bold** for emphasis, and ensure clean Markdown that renders well in a web UI.\n\n"
+)
+
+
+def pack_prompt(
+    logs: List[Dict[str, Any]],
+    contexts: Sequence[Dict[str, Any] | str],
+    templates: Sequence[LogTemplate] | None = None,
+) -> PackedContext:
+    """Pack logs/templates/snippets into RCA_PROMPT_TOKEN_BUDGET; ``report`` gains the final prompt size."""
+    with metrics.timer("prompt_build"):
+        reserved = count_tokens(SYSTEM_PROMPT) + count_tokens(_PROMPT_HEADER) + 16
+        packed = pack_context(logs, contexts, templates, reserved=reserved)
+        packed.report["prompt_tokens"] = count_tokens(SYSTEM_PROMPT) + count_tokens(_render_prompt(packed))
+    return packed
+
+
+def _render_prompt(packed: PackedContext) -> str:
+    return (
+        _PROMPT_HEADER
+        + "Logs:\n" + packed.logs + "\n" + packed.templates + "\nRetrieved Context:\n" + packed.contexts + "\n"
     )
-    return prompt
+
+
+def _build_prompt(
+    logs: List[Dict[str, Any]],
+    contexts: Sequence[Dict[str, Any] | str],
+    templates: Sequence[LogTemplate] | None = None,
+    packed: PackedContext | None = None,
+) -> str:
+    return _render_prompt(packed or pack_prompt(logs, contexts, templates))
 
 
 def _fallback_summary(logs: List[Dict[str, Any]], contexts: List[str]) -> str:
@@ -0,0 +1,164 @@
+"""Local Sentence-Transformers embedding engine for CPU nodes.
+
+Texts are sorted by length and encoded ST_BATCH_SIZE at a time, so each batch pads to similar
+lengths, and every batch is written straight into one preallocated C-contiguous float32 array
+in input order (no per-vector Python lists). ST_BACKEND picks the inference backend (torch, onnx,
+openvino; the latter two need Sentence-Transformers >= 3.2 with its onnx/openvino extras) and
+ST_MODEL_FILE a specific exported file, e.g. an int8-quantized ``onnx/model_qint8_avx512_vnni.onnx``.
+ST_QUANTIZE applies dynamic int8 quantization to the torch model's Linear layers instead. With
+ST_PROCESSES > 1, inputs of at least one batch per process go to a multi-process encode pool,
+started on first use and stopped at exit.
+"""
+from __future__ import annotations
+import os
+import atexit
+import logging
+import threading
+from typing import Any, Sequence
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+_EMBEDDER: "LocalEmbedder | None" = None
+_EMBEDDER_CONFIG: tuple | None = None
+_EMBEDDER_LOCK = threading.Lock()
+
+
+def _supports_backends() -> bool:
+    # Sentence-Transformers >= 3.2 takes backend/model_kwargs; read from package metadata to avoid importing torch
+    from importlib.metadata import PackageNotFoundError, version
+    try:
+        major, minor = (int(p) for p in version("sentence-transformers").split(".")[:2])
+    except (PackageNotFoundError, ValueError):
+        return True
+    return (major, minor) >= (3, 2)
+
+
+class LocalEmbedder:
+    def __init__(self, model_name: str, backend: str = "torch", model_file: str | None = None,
+                 batch_size: int = 64, processes: int = 1, quantize: bool = False):
+        self.model_name = model_name
+        self.backend = (backend or "torch").lower()
+        self.model_file = model_file
+        if (self.backend != "torch" or model_file) and not _supports_backends():
+            # Resolved before ``key`` is first read, so every vector is cached under the variant that computed it
+            logger.warning("Sentence-Transformers < 3.2 cannot load %s with backend=%s, file=%s; using torch",
+                           model_name, self.backend, model_file)
+            self.backend, self.model_file = "torch", None
+        self.batch_size = max(1, batch_size)
+        self.processes = processes if processes > 0 else (os.cpu_count() or 1)
+        self.quantize = quantize
+        self._model = None
+        self._pool = None
+        self._pool_pid: int | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def key(self) -> str:
+        """Model name plus the inference variant (backend, exported file, int8), for embedding cache keys."""
+        variant = [self.backend] if self.backend != "torch" else []
+        if self.model_file:
+            variant.append(self.model_file)
+        if self.quantize and self.backend == "torch":
+            variant.append("int8")
+        return f"{self.model_name}[{','.join(variant)}]" if variant else self.model_name
+
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                # Concurrent first calls load the model once
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+        kwargs: dict[str, Any] = {}
+        if self.backend != "torch":
+            kwargs["backend"] = self.backend
+        if self.model_file:
+            kwargs["model_kwargs"] = {"file_name": self.model_file}
+        model = SentenceTransformer(self.model_name, **kwargs)
+        if self.quantize and self.backend == "torch":
+            import torch
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info("Loaded local embedding model %s (backend=%s%s)", self.model_name, self.backend,
+                    ", int8 dynamic" if self.quantize and self.backend == "torch" else "")
+        return model
+
+    def _get_pool(self, model):
+        pid = os.getpid()
+        if self._pool is not None and self._pool_pid == pid:
+            return self._pool
+        with self._lock:
+            # A pool inherited over fork belongs to the parent; start our own
+            if self._pool is None or self._pool_pid != pid:
+                self._pool = model.start_multi_process_pool(target_devices=["cpu"] * self.processes)
+                self._pool_pid = pid
+                atexit.register(self._stop_pool, model, self._pool, pid)
+                logger.info("Started local embedding pool with %d processes", self.processes)
+        return self._pool
+
+    @staticmethod
+    def _stop_pool(model, pool, pid: int) -> None:
+        if os.getpid() == pid:
+            model.stop_multi_process_pool(pool)
+
+    def start_pool(self) -> None:
+        if self.processes > 1:
+            self._get_pool(self.model())
+
+    def encode(self, texts: Sequence[str]):
+        """L2-normalized embeddings of ``texts`` as a C-contiguous ``(len(texts), dim)`` float32 array."""
+        import numpy as np
+        n = len(texts)
+        if not n:
+            return np.empty((0, 0), dtype=np.float32)
+        model = self.model()
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=n)
+        # Longest first, like Sentence-Transformers itself, so the largest batch is allocated up front
+        order = np.argsort(-lengths, kind="stable")
+        if self.processes > 1 and n >= self.batch_size * self.processes:
+            vecs = self._encode_pool(model, [texts[i] for i in order])
+            out = np.empty(vecs.shape, dtype=np.float32)
+            out[order] = vecs
+            return out
+        out = None
+        for start in range(0, n, self.batch_size):
+            idx = order[start:start + self.batch_size]
+            vecs = model.encode([texts[i] for i in idx], batch_size=len(idx), convert_to_numpy=True,
+                                normalize_embeddings=True, show_progress_bar=False)
+            if out is None:
+                out = np.empty((n, vecs.shape[1]), dtype=np.float32)
+            out[idx] = vecs
+        return out
+
+    def _encode_pool(self, model, texts: Sequence[str]):
+        import numpy as np
+        pool = self._get_pool(model)
+        if hasattr(model, "encode_multi_process"):
+            vecs = model.encode_multi_process(texts, pool, batch_size=self.batch_size, normalize_embeddings=True)
+        else:
+            # Sentence-Transformers >= 5 folds the pool into encode()
+            vecs = model.encode(texts, pool=pool, batch_size=self.batch_size, convert_to_numpy=True,
+                                normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(vecs, dtype=np.float32)
+
+
+def get_embedder() -> LocalEmbedder:
+    global _EMBEDDER, _EMBEDDER_CONFIG
+    config = (settings.ST_EMBEDDING_MODEL, settings.ST_BACKEND, settings.ST_MODEL_FILE,
+              settings.ST_BATCH_SIZE, settings.ST_PROCESSES, settings.ST_QUANTIZE)
+    if _EMBEDDER is None or _EMBEDDER_CONFIG != config:
+        with _EMBEDDER_LOCK:
+            if _EMBEDDER is None or _EMBEDDER_CONFIG != config:
+                _EMBEDDER = LocalEmbedder(
+                    settings.ST_EMBEDDING_MODEL,
+                    backend=settings.ST_BACKEND,
+                    model_file=settings.ST_MODEL_FILE,
+                    batch_size=settings.ST_BATCH_SIZE,
+                    processes=settings.ST_PROCESSES,
+                    quantize=settings.ST_QUANTIZE,
+                )
+                _EMBEDDER_CONFIG = config
+    return _EMBEDDER
@@ -0,0 +1,73 @@
+from __future__ import annotations
+import re
+from dataclasses import dataclass
+from typing import List, Dict, Tuple
+
+
+WILDCARD = "<*>"
+
+# Applied in order; quoted values and UUIDs go first so their digits aren't masked piecemeal
+_MASKS: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<UUID>"),
+    (re.compile(r"\"[^\"]*\"|'[^']*'"), "<STR>"),
+    (re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b"), "<IP>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)(?=[0-9a-fA-F]*[a-fA-F])[0-9a-fA-F]{8,}\b"), "<HEX>"),
+    (re.compile(r"(?<![\w.])[-+]?\d+(?:\.\d+)?(?![\w.])"), "<NUM>"),
+]
+_SPLIT = re.compile(r"\s+")
+
+
+def mask(message: str) -> str:
+    for pattern, repl in _MASKS:
+        message = pattern.sub(repl, message)
+    return message
+
+
+@dataclass
+class LogTemplate:
+    id: int
+    tokens: List[str]
+    count: int = 0
+    example: str = ""
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.tokens)
+
+
+def _is_variable(token: str) -> bool:
+    return token == WILDCARD or (token.startswith("<") and token.endswith(">")) or any(c.isdigit() for c in token)
+
+
+class TemplateMiner:
+    """Drain-style online template miner.
+
+    Messages are masked, tokenized, and routed by (token count, first token) to a small set of
+    candidate templates; a message joins the most similar candidate when at least ``threshold``
+    of its tokens match, and differing positions become ``<*>``.
+    """
+
+    def __init__(self, threshold: float = 0.5):
+        self.threshold = threshold
+        self.templates: List[LogTemplate] = []
+        self._groups: Dict[Tuple[int, str], List[LogTemplate]] = {}
+
+    def add(self, message: str) -> LogTemplate:
+        tokens = _SPLIT.split(mask(message).strip()) if message else [""]
+        head = WILDCARD if _is_variable(tokens[0]) else tokens[0]
+        group = self._groups.setdefault((len(tokens), head), [])
+
+        best, best_sim = None, -1.0
+        for tpl in group:
+            same = sum(1 for a, b in zip(tpl.tokens, tokens) if a == b)
+            sim = same / len(tokens)
+            if sim > best_sim:
+                best, best_sim = tpl, sim
+        if best is None or best_sim < self.threshold:
+            best = LogTemplate(id=len(self.templates), tokens=tokens, example=message)
+            self.templates.append(best)
+            group.append(best)
+        else:
+            best.tokens = [a if a == b else WILDCARD for a, b in zip(best.tokens, tokens)]
+        best.count += 1
+        return best
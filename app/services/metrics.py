@@ -0,0 +1,188 @@
+"""In-process stage timers and counters, rendered as Prometheus text for GET /metrics.
+
+Stage timings go to the ``logrca_stage_seconds`` histogram (labelled by ``stage`` plus e.g.
+``provider``) and, inside a :func:`collect` block, into a per-request :class:`Breakdown` that
+/analyze returns as ``timings``. The active breakdown rides a ContextVar, so tasks created and
+``asyncio.to_thread`` calls made inside the block report into it as well. Everything here is per
+process: with several Gunicorn workers a scrape sees the worker that served it.
+"""
+from __future__ import annotations
+import math
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+PREFIX = "logrca_"
+_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_HELP = {
+    "stage_seconds": "Wall time per pipeline stage",
+    "embedding_fallbacks_total": "Texts re-embedded with the local model after a provider failed",
+    "llm_requests_total": "RCA chat completions by outcome",
+    "llm_tokens_total": "LLM tokens (source=usage from the API response, estimate when streaming)",
+    "analyze_requests_total": "/analyze requests by result-cache status",
+    "shard_queries_total": "Sharded vector queries by route (routed by logger, or global fallback)",
+}
+
+_Labels = Tuple[Tuple[str, str], ...]
+_LOCK = threading.Lock()
+_COUNTERS: Dict[str, Dict[_Labels, float]] = {}
+# name -> labels -> [bucket counts..., +Inf count, sum]
+_HISTOGRAMS: Dict[str, Dict[_Labels, List[float]]] = {}
+
+
+class Breakdown:
+    """Milliseconds per stage for one request; concurrent calls of a stage are summed."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self._ms: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._ms[key] = self._ms.get(key, 0.0) + seconds * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            out = {f"{k}_ms": round(v, 1) for k, v in sorted(self._ms.items())}
+        out["total_ms"] = round((time.perf_counter() - self.t0) * 1000, 1)
+        return out
+
+
+_CURRENT: ContextVar[Breakdown | None] = ContextVar("rca_breakdown", default=None)
+
+
+def _key(labels: Dict[str, Any]) -> _Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels: Any) -> None:
+    key = _key(labels)
+    with _LOCK:
+        series = _COUNTERS.setdefault(name, {})
+        series[key] = series.get(key, 0.0) + value
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    key = _key(labels)
+    with _LOCK:
+        series = _HISTOGRAMS.setdefault(name, {})
+        row = series.get(key)
+        if row is None:
+            row = series[key] = [0.0] * (len(_BUCKETS) + 2)
+        row[bisect_left(_BUCKETS, value)] += 1
+        row[-1] += value
+
+
+def record(stage: str, seconds: float, **labels: Any) -> None:
+    """One stage observation: the histogram plus the active breakdown (key ``stage_<label values>``)."""
+    observe("stage_seconds", seconds, stage=stage, **labels)
+    breakdown = _CURRENT.get()
+    if breakdown is not None:
+        breakdown.add("_".join([stage, *(str(v) for v in labels.values())]), seconds)
+
+
+@contextmanager
+def timer(stage: str, **labels: Any) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - t0, **labels)
+
+
+def timed_iter(items: Iterable[T], stage: str, **labels: Any) -> Iterator[T]:
+    """Yield from ``items``, recording only the time spent producing them (not the consumer's)."""
+    elapsed = 0.0
+    it = iter(items)
+    try:
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - t0
+            yield item
+    finally:
+        close = getattr(it, "close", None)
+        if close is not None:
+            close()
+        record(stage, elapsed, **labels)
+
+
+@contextmanager
+def collect(breakdown: Breakdown | None = None) -> Iterator[Breakdown]:
+    """Collect the stages recorded in this context (and its tasks/threads) into ``breakdown`` (or a new one)."""
+    breakdown = breakdown or Breakdown()
+    token = _CURRENT.set(breakdown)
+    try:
+        yield breakdown
+    finally:
+        _CURRENT.reset(token)
+
+
+def _fmt_labels(labels: _Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def _gauges(prefix: str, value: Any, out: List[Tuple[str, float]]) -> None:
+    if isinstance(value, (bool, int, float)):
+        out.append((prefix, float(value)))
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            _gauges(f"{prefix}_{k}", v, out)
+
+
+def render(stats: Dict[str, Any] | None = None) -> str:
+    """Prometheus text exposition (format 0.0.4) of every counter and histogram.
+
+    Numeric leaves of ``stats`` (the GET /api/stats payload: cache, index and pool counters) are
+    appended as gauges named ``logrca_<section>_<key>``.
+    """
+    lines: List[str] = []
+    with _LOCK:
+        counters = {n: dict(s) for n, s in _COUNTERS.items()}
+        histograms = {n: {k: list(r) for k, r in s.items()} for n, s in _HISTOGRAMS.items()}
+    for name in sorted(counters):
+        full = PREFIX + name
+        if name in _HELP:
+            lines.append(f"# HELP {full} {_HELP[name]}")
+        lines.append(f"# TYPE {full} counter")
+        for labels, value in sorted(counters[name].items()):
+            lines.append(f"{full}{_fmt_labels(labels)} {_fmt_value(value)}")
+    for name in sorted(histograms):
+        full = PREFIX + name
+        if name in _HELP:
+            lines.append(f"# HELP {full} {_HELP[name]}")
+        lines.append(f"# TYPE {full} histogram")
+        for labels, row in sorted(histograms[name].items()):
+            cumulative = 0.0
+            for bound, count in zip(_BUCKETS + (math.inf,), row[:-1]):
+                cumulative += count
+                lines.append(f"{full}_bucket{_fmt_labels(labels, (('le', _fmt_value(bound)),))} {_fmt_value(cumulative)}")
+            lines.append(f"{full}_sum{_fmt_labels(labels)} {_fmt_value(row[-1])}")
+            lines.append(f"{full}_count{_fmt_labels(labels)} {_fmt_value(cumulative)}")
+    gauges: List[Tuple[str, float]] = []
+    for section, value in (stats or {}).items():
+        _gauges(PREFIX + section, value, gauges)
+    for name, value in gauges:
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_fmt_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,293 @@
+from __future__ import annotations
+import os
+import json
+import sqlite3
+import logging
+import threading
+from typing import List, Dict, Any, Sequence
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+_INITIAL_CAPACITY = 1024
+# Rows scored per matmul block, bounding the float32 working set for fp16/int8 indexes
+_BLOCK_ROWS = 65536
+
+
+class DimensionMismatch(ValueError):
+    pass
+
+
+class MmapIndex:
+    """Flat vector index in memory-mapped files, with documents/metadata in SQLite alongside.
+
+    Layout under ``path``: ``header.json`` (dim, dtype, rows, capacity, generation),
+    ``vectors.bin`` (capacity x dim of ``dtype``), ``scales.bin`` (float32 per row, int8 only),
+    ``live.bin`` (uint8 per row) and ``meta.sqlite3``. Vectors are L2-normalized on write, so a
+    search is one matrix multiply; distances are squared L2 (``2 - 2 * cosine``), matching
+    Chroma's default space. Searches map the files read-only, so every worker process shares the
+    same page-cache pages; a writer bumps ``generation`` and readers remap when it changes.
+    """
+
+    def __init__(self, path: str, dtype: str = "float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector dtype {dtype!r}; expected one of {sorted(DTYPES)}")
+        self.path = path
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        self._header: Dict[str, Any] | None = None
+        self._header_mtime: int | None = None
+        self._vectors: np.ndarray | None = None
+        self._scales: np.ndarray | None = None
+        self._live: np.ndarray | None = None
+        self._writable = False
+        self._conn: sqlite3.Connection | None = None
+        self._conn_pid: int | None = None
+        # Generation to continue from after a reset, so readers always see it change
+        self._generation_floor = 0
+        os.makedirs(path, exist_ok=True)
+
+    # -- files -----------------------------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _db(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        if self._conn is None or self._conn_pid != pid:
+            conn = sqlite3.connect(self._file("meta.sqlite3"), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                " row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, document TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            conn.commit()
+            self._conn, self._conn_pid = conn, pid
+        return self._conn
+
+    def _read_header(self) -> Dict[str, Any] | None:
+        try:
+            mtime = os.stat(self._file("header.json")).st_mtime_ns
+        except OSError:
+            self._header = self._header_mtime = None
+            self._vectors = self._scales = self._live = None
+            return None
+        if mtime != self._header_mtime:
+            with open(self._file("header.json"), "r", encoding="utf-8") as f:
+                header = json.load(f)
+            if self._header is None or header["generation"] != self._header.get("generation"):
+                # Another process (or a reset) changed the files; remap on next access
+                self._vectors = self._scales = self._live = None
+            self._header, self._header_mtime = header, mtime
+        return self._header
+
+    def _write_header(self, header: Dict[str, Any]) -> None:
+        header["generation"] = header.get("generation", 0) + 1
+        tmp = self._file(f"header.json.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(tmp, self._file("header.json"))
+        self._header = header
+        self._header_mtime = os.stat(self._file("header.json")).st_mtime_ns
+
+    def _map(self, header: Dict[str, Any], writable: bool) -> None:
+        if self._vectors is not None and (self._writable or not writable) and len(self._live) >= header["capacity"]:
+            return
+        mode = "r+" if writable else "r"
+        cap, dim = header["capacity"], header["dim"]
+        self._vectors = np.memmap(self._file("vectors.bin"), dtype=DTYPES[header["dtype"]], mode=mode, shape=(cap, dim))
+        self._live = np.memmap(self._file("live.bin"), dtype=np.uint8, mode=mode, shape=(cap,))
+        self._scales = (
+            np.memmap(self._file("scales.bin"), dtype=np.float32, mode=mode, shape=(cap,))
+            if header["dtype"] == "int8" else None
+        )
+        self._writable = writable
+
+    def _allocate(self, dim: int, capacity: int, header: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        header = dict(header or {"dim": dim, "dtype": self.dtype, "rows": 0, "generation": 0})
+        itemsize = np.dtype(DTYPES[header["dtype"]]).itemsize
+        files = {"vectors.bin": capacity * dim * itemsize, "live.bin": capacity}
+        if header["dtype"] == "int8":
+            files["scales.bin"] = capacity * 4
+        for name, size in files.items():
+            # Growing a file keeps existing bytes; readers' shorter maps stay valid until they remap
+            with open(self._file(name), "ab") as f:
+                f.truncate(size)
+        header["capacity"] = capacity
+        self._vectors = self._scales = self._live = None
+        return header
+
+    # -- writes ----------------------------------------------------------------------------
+
+    def reset(self) -> None:
+        with self._lock:
+            gen = (self._read_header() or {}).get("generation", 0)
+            self._vectors = self._scales = self._live = None
+            for name in ("vectors.bin", "scales.bin", "live.bin", "header.json"):
+                try:
+                    os.remove(self._file(name))
+                except FileNotFoundError:
+                    pass
+            db = self._db()
+            db.execute("DELETE FROM docs")
+            db.commit()
+            self._header = self._header_mtime = None
+            self._generation_floor = gen
+
+    def upsert(self, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Dict[str, Any]], embeddings) -> None:
+        vecs = np.asarray(embeddings, dtype=np.float32)
+        if vecs.ndim != 2 or len(vecs) != len(ids):
+            raise ValueError(f"Expected {len(ids)} embeddings, got array of shape {vecs.shape}")
+        if not len(ids):
+            return
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs = vecs / np.where(norms == 0, 1, norms)
+        with self._lock:
+            header = self._read_header()
+            if header is None:
+                header = self._allocate(vecs.shape[1], max(_INITIAL_CAPACITY, len(ids)))
+                header["generation"] = self._generation_floor
+            elif header["dim"] != vecs.shape[1]:
+                raise DimensionMismatch(f"Index has dimension {header['dim']}, got {vecs.shape[1]}")
+            db = self._db()
+            existing = dict(self._rows_for(db, ids))
+            self._map(header, writable=True)
+            free = np.flatnonzero(self._live[:header["rows"]] == 0)
+            rows, next_free, end = [], 0, header["rows"]
+            for doc_id in ids:
+                if doc_id in existing:
+                    rows.append(existing[doc_id])
+                elif next_free < len(free):
+                    rows.append(int(free[next_free]))
+                    next_free += 1
+                else:
+                    rows.append(end)
+                    end += 1
+                existing[doc_id] = rows[-1]
+            if end > header["capacity"]:
+                header = self._allocate(header["dim"], max(end, header["capacity"] * 2), header)
+                self._map(header, writable=True)
+            rows_arr = np.asarray(rows, dtype=np.int64)
+            if header["dtype"] == "int8":
+                scale = np.abs(vecs).max(axis=1) / 127.0
+                scale[scale == 0] = 1.0
+                self._vectors[rows_arr] = np.round(vecs / scale[:, None]).astype(np.int8)
+                self._scales[rows_arr] = scale
+            else:
+                self._vectors[rows_arr] = vecs.astype(DTYPES[header["dtype"]])
+            self._live[rows_arr] = 1
+            self._vectors.flush()
+            self._live.flush()
+            if self._scales is not None:
+                self._scales.flush()
+            db.executemany(
+                "INSERT OR REPLACE INTO docs (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [(r, i, d, json.dumps(m or {})) for r, i, d, m in zip(rows, ids, documents, metadatas)],
+            )
+            db.commit()
+            header["rows"] = max(header["rows"], end)
+            self._write_header(header)
+
+    def delete(self, ids: Sequence[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            header = self._read_header()
+            if header is None:
+                return
+            db = self._db()
+            rows = [r for _, r in self._rows_for(db, ids)]
+            if not rows:
+                return
+            self._map(header, writable=True)
+            self._live[np.asarray(rows, dtype=np.int64)] = 0
+            self._live.flush()
+            db.executemany("DELETE FROM docs WHERE row = ?", [(r,) for r in rows])
+            db.commit()
+            self._write_header(header)
+
+    @staticmethod
+    def _rows_for(db: sqlite3.Connection, ids: Sequence[str]):
+        out = []
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            out += db.execute(f"SELECT id, row FROM docs WHERE id IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+        return out
+
+    # -- reads -----------------------------------------------------------------------------
+
+    def count(self) -> int:
+        with self._lock:
+            if self._read_header() is None:
+                return 0
+            return self._db().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    @property
+    def dim(self) -> int | None:
+        header = self._read_header()
+        return header["dim"] if header else None
+
+    def search(self, embeddings, top_k: int) -> List[List[Dict[str, Any]]]:
+        q = np.asarray(embeddings, dtype=np.float32)
+        if q.ndim != 2 or not len(q):
+            return []
+        with self._lock:
+            header = self._read_header()
+            if header is None or header["rows"] == 0:
+                return [[] for _ in range(len(q))]
+            if header["dim"] != q.shape[1]:
+                raise DimensionMismatch(f"Index has dimension {header['dim']}, query has {q.shape[1]}")
+            self._map(header, writable=self._writable)
+            vectors, scales, live = self._vectors, self._scales, self._live
+            rows = header["rows"]
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        q = q / np.where(norms == 0, 1, norms)
+        k = max(1, min(top_k, rows))
+
+        best_scores = np.full((len(q), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(q), 0), dtype=np.int64)
+        for start in range(0, rows, _BLOCK_ROWS):
+            stop = min(rows, start + _BLOCK_ROWS)
+            block = vectors[start:stop]
+            if block.dtype != np.float32:
+                block = block.astype(np.float32)
+            scores = q @ block.T
+            if scales is not None:
+                scores *= scales[start:stop]
+            scores[:, live[start:stop] == 0] = -np.inf
+            # Keep a running top-k across blocks
+            scores = np.concatenate([best_scores, scores], axis=1)
+            idx = np.concatenate([best_rows, np.broadcast_to(np.arange(start, stop), (len(q), stop - start))], axis=1)
+            kk = min(k, scores.shape[1])
+            part = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            best_scores = np.take_along_axis(scores, part, axis=1)
+            best_rows = np.take_along_axis(idx, part, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+
+        wanted = sorted({int(r) for r, s in zip(best_rows.ravel(), best_scores.ravel()) if np.isfinite(s)})
+        docs: Dict[int, tuple] = {}
+        with self._lock:
+            db = self._db()
+            for i in range(0, len(wanted), 500):
+                chunk = wanted[i:i + 500]
+                for row, doc_id, document, metadata in db.execute(
+                    f"SELECT row, id, document, metadata FROM docs WHERE row IN ({','.join('?' * len(chunk))})", chunk
+                ):
+                    docs[row] = (doc_id, document, json.loads(metadata))
+        results: List[List[Dict[str, Any]]] = []
+        for qi in range(len(q)):
+            group = []
+            for r, s in zip(best_rows[qi], best_scores[qi]):
+                hit = docs.get(int(r))
+                if hit is None or not np.isfinite(s):
+                    continue
+                group.append({"id": hit[0], "document": hit[1], "metadata": hit[2], "distance": max(0.0, float(2.0 - 2.0 * s))})
+            results.append(group)
+        return results
@@ -1,28 +1,527 @@
 from __future__ import annotations
-from typing import Dict, Any, List
-from . import db_ingest
-from .vector_store import query_similar
-from .llm import generate_rca
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Tuple, AsyncIterator, Iterator, Iterable, Callable
+from ..config import settings
+from . import aio, db_ingest, metrics
+from .vector_store import query_hybrid, index_version, lookup_frames
+from .frame_index import parse_frames
+from .rca_cache import CachedRca, get_cache
+from .llm import agenerate_rca, astream_rca, is_error_report, pack_prompt
+from .context_packer import PackedContext, is_error
+from .log_templates import TemplateMiner, LogTemplate
 
+_DONE = object()
+# Distinct logger names kept per template for shard routing
+_MAX_LOGGERS = 8
+logger = logging.getLogger(__name__)
 
-def analyze_correlation(correlation_id: str) -> Dict[str, Any]:
-    logs = db_ingest.fetch_logs_by_correlation(correlation_id)
+# Timings of completed /analyze/stream runs, reported in GET /api/stats
+_STREAM_STATS: Dict[str, Any] = {"streams": 0, "last": None, "ttfb_ms_sum": 0.0, "ttft_ms_sum": 0.0, "total_ms_sum": 0.0}
+_STREAM_LOCK = threading.Lock()
 
-    # Retrieve contexts using log messages as queries
-    queries = [l.get("message", "") for l in logs if l.get("message")]
-    retrieved: List[str] = []
-    if queries:
-        results = query_similar(queries, top_k=5)
-        for group in results:
-            for item in group[:2]:  # take top 2 per log
-                retrieved.append(item.get("document", ""))
 
-    rca_text = generate_rca(logs, retrieved)
+@dataclass
+class AnalysisContext:
+    logs: List[Dict[str, Any]]
+    log_count: int
+    templates: List[LogTemplate]
+    retrieved: List[str]
+    # retrieval items behind ``retrieved`` (same order), flagged when retrieved for an error line
+    hits: List[Dict[str, Any]]
+    # db_ingest.LogFingerprint of the fetched rows, checked against the cached entry
+    fingerprint: str
 
+
+def _produce(
+    rows: Callable[[], Iterable[Dict[str, Any]]],
+    queue: asyncio.Queue,
+    loop,
+    stop: threading.Event,
+    fingerprint: db_ingest.LogFingerprint | None = None,
+) -> None:
+    # Runs in a worker thread: drains the DB cursor and hands rows over in RCA_CHUNK_SIZE chunks
+    # until the consumer sets ``stop`` (see _stop_producer)
+    put = lambda item: asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+    chunk: List[Dict[str, Any]] = []
+    it = iter(rows())
+    try:
+        for l in it:
+            if fingerprint is not None:
+                fingerprint.update(l)
+            chunk.append(l)
+            if len(chunk) >= settings.RCA_CHUNK_SIZE:
+                if stop.is_set():
+                    return
+                put(chunk)
+                chunk = []
+        if chunk and not stop.is_set():
+            put(chunk)
+    finally:
+        # Closing the generator releases the DB cursor and connection now, not at garbage collection
+        close = getattr(it, "close", None)
+        if close is not None:
+            close()
+        if not stop.is_set():
+            put(_DONE)
+
+
+async def _stop_producer(producer: asyncio.Future, queue: asyncio.Queue, stop: threading.Event) -> None:
+    """Stop a _produce thread whose consumer gave up, and wait for it to close its cursor."""
+    stop.set()
+    # Frees a put blocked on the full queue; with ``stop`` set no further put is made
+    while not queue.empty():
+        queue.get_nowait()
+    await asyncio.wait([producer])
+
+
+class _Collector:
+    """Template mining, stack-frame resolution and retrieval over a stream of log chunks.
+
+    ``add`` feeds one row; ``flush`` (after each chunk) resolves the chunk's stack frames and sends
+    the templates first seen in it to query_hybrid in the background, unless a frame already
+    resolved them, with the loggers seen for each (SHARD_BY routing). ``results`` waits for the
+    lookups and returns the hits per template id.
+    """
+
+    def __init__(self):
+        self.miner = TemplateMiner()
+        self.error_templates: set = set()
+        self.retrieval_queries = 0
+        self._known = 0
+        self._pending_frames: List[Tuple[int, bool, list]] = []
+        self._frame_hits: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        self._loggers: Dict[int, Dict[str, None]] = {}
+        self._lookups: List[Tuple[List[LogTemplate], asyncio.Future]] = []
+        self._limiter = asyncio.Semaphore(max(1, settings.RCA_RETRIEVAL_CONCURRENCY))
+
+    async def _retrieve(self, batch: List[LogTemplate]) -> List[List[Dict[str, Any]]]:
+        async with self._limiter:
+            # Template text is embedded; the raw example is matched against log-format literals
+            return await asyncio.to_thread(
+                query_hybrid, [t.text for t in batch], 5, [t.example for t in batch],
+                [list(self._loggers.get(t.id, ())) for t in batch],
+            )
+
+    def add(self, log: Dict[str, Any]) -> LogTemplate | None:
+        if not log.get("message"):
+            return None
+        tpl = self.miner.add(log["message"])
+        loggers = self._loggers.setdefault(tpl.id, {})
+        if log.get("logger") and len(loggers) < _MAX_LOGGERS:
+            loggers[log["logger"]] = None
+        error = is_error(log)
+        if error:
+            self.error_templates.add(tpl.id)
+        frames = parse_frames(log["message"]) if settings.STACK_FRAME_LOOKUP else []
+        if frames:
+            self._pending_frames.append((tpl.id, error, frames))
+        return tpl
+
+    async def flush(self) -> None:
+        if self._pending_frames:
+            framed, self._pending_frames = self._pending_frames, []
+            # O(1) per frame, but the first call may load the index from SQLite
+            groups = await asyncio.to_thread(lookup_frames, [f for _, _, f in framed], settings.STACK_FRAME_MAX_PER_LOG)
+            for (tpl_id, error, _), group in zip(framed, groups):
+                for item in group:
+                    hit = self._frame_hits.setdefault(tpl_id, {}).setdefault(item["document"], {**item, "error": error})
+                    hit["error"] = hit["error"] or error
+        fresh = [t for t in self.miner.templates[self._known:] if t.id not in self._frame_hits]
+        self._known = len(self.miner.templates)
+        if fresh:
+            self.retrieval_queries += len(fresh)
+            self._lookups.append((fresh, asyncio.ensure_future(self._retrieve(fresh))))
+
+    def cancel(self) -> None:
+        for _, task in self._lookups:
+            task.cancel()
+
+    async def results(self) -> Dict[int, List[Dict[str, Any]]]:
+        """Hits per template id: its stack-frame hits, then its top 2 retrieval items."""
+        out = {tpl_id: list(hits.values()) for tpl_id, hits in self._frame_hits.items()}
+        batches = await asyncio.gather(*(task for _, task in self._lookups))
+        for (batch, _), results in zip(self._lookups, batches):
+            for tpl, group in zip(batch, results):
+                out.setdefault(tpl.id, []).extend(group[:2])
+        return out
+
+
+def _collect_hits(per_template: Dict[int, List[Dict[str, Any]]], template_ids: Iterable[int], error_templates: set) -> List[Dict[str, Any]]:
+    # Frame hits lead, then retrieval hits in template order (first-seen, i.e. the order of lines)
+    template_ids = list(template_ids)
+    hits: Dict[str, Dict[str, Any]] = {}
+    for frames in (True, False):
+        for tpl_id in template_ids:
+            for item in per_template.get(tpl_id, ()):
+                if (item.get("source") == "frame") != frames:
+                    continue
+                error = item["error"] if "error" in item else tpl_id in error_templates
+                doc = item.get("document", "")
+                hit = hits.get(doc)
+                if hit is None:
+                    hits[doc] = {**item, "error": error}
+                else:
+                    hit["error"] = hit["error"] or error
+                    if (item.get("distance") or 0) < (hit.get("distance") or 0):
+                        hit["distance"] = item["distance"]
+    return list(hits.values())
+
+
+async def _gather_context(correlation_id: str) -> AnalysisContext:
+    """Fetch, template and retrieve concurrently.
+
+    The DB cursor is drained in a worker thread and handed over in RCA_CHUNK_SIZE chunks; each
+    chunk's previously unseen templates are sent to query_hybrid right away, so retrieval for
+    early chunks overlaps with fetching (and embedding) later ones. Lines carrying stack frames
+    that resolve to indexed methods (STACK_FRAME_LOOKUP) are answered from the frame index first,
+    and their templates skip query_hybrid.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=4)
+    fingerprint = db_ingest.LogFingerprint()
+    rows = lambda: db_ingest.iter_logs_by_correlation(correlation_id)
+    stop = threading.Event()
+    producer = asyncio.ensure_future(asyncio.to_thread(_produce, rows, queue, loop, stop, fingerprint))
+
+    # Consume the log stream once: every line feeds the template miner, but only the first and
+    # last RCA_MAX_LOGS/2 lines are kept verbatim for the prompt and response
+    keep = max(2, settings.RCA_MAX_LOGS)
+    head: List[Dict[str, Any]] = []
+    tail: deque = deque(maxlen=keep - keep // 2)
+    collector = _Collector()
+    log_count = 0
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is _DONE:
+                break
+            for l in chunk:
+                log_count += 1
+                collector.add(l)
+                if len(head) < keep // 2:
+                    head.append(l)
+                else:
+                    tail.append(l)
+            await collector.flush()
+        await producer
+    except BaseException:
+        collector.cancel()
+        await _stop_producer(producer, queue, stop)
+        raise
+
+    templates = collector.miner.templates
+    hits = _collect_hits(await collector.results(), (t.id for t in templates), collector.error_templates)
+    return AnalysisContext(head + list(tail), log_count, templates, [h["document"] for h in hits], hits, fingerprint.hexdigest())
+
+
+def _summary(correlation_id: str, ctx: AnalysisContext, packed: PackedContext) -> Dict[str, Any]:
     return {
         "correlation_id": correlation_id,
-        "log_count": len(logs),
-        "logs": logs,
-        "context_count": len(retrieved),
-        "rca": rca_text,
+        "log_count": ctx.log_count,
+        "logs": ctx.logs,
+        "logs_truncated": ctx.log_count > len(ctx.logs),
+        "template_count": len(ctx.templates),
+        "templates": [{"template": t.text, "count": t.count} for t in ctx.templates],
+        "context_count": len(ctx.retrieved),
+        "frame_hits": sum(1 for h in ctx.hits if h.get("source") == "frame"),
+        "prompt": packed.report,
+    }
+
+
+def _cache_key(correlation_id: str) -> Tuple[str, str, str]:
+    return (correlation_id, index_version(), settings.LLM_MODEL)
+
+
+async def _cache_lookup(correlation_id: str, key: Tuple[str, str, str]) -> CachedRca | None:
+    # One aggregate query fingerprints the current logs; retrieval and the LLM are skipped on a hit
+    cache = get_cache()
+    with metrics.timer("cache_lookup"):
+        fingerprint = await asyncio.to_thread(db_ingest.logs_fingerprint, correlation_id)
+        return cache.get(key, fingerprint)
+
+
+async def _analyze(correlation_id: str) -> CachedRca:
+    with metrics.timer("gather_context"):
+        ctx = await _gather_context(correlation_id)
+    packed = pack_prompt(ctx.logs, ctx.hits, ctx.templates)
+    rca_text = await agenerate_rca(ctx.logs, ctx.retrieved, ctx.templates, packed)
+    return CachedRca(ctx.fingerprint, {**_summary(correlation_id, ctx, packed), "rca": rca_text}, packed.included_contexts)
+
+
+def _store(key: Tuple[str, str, str], entry: CachedRca) -> None:
+    # LLM failures are not cached so the next request retries
+    if not is_error_report(entry.result["rca"]):
+        get_cache().put(key, entry)
+
+
+async def analyze_correlation_async(correlation_id: str, force: bool = False) -> Dict[str, Any]:
+    """RCA for one correlation ID; ``timings`` breaks the request down per stage (see metrics).
+
+    Stage times of concurrent calls (retrieval batches, embedding) are summed, so they can add up
+    to more than ``total_ms``; ``gather_context_ms`` is the wall time of fetch plus retrieval.
+    """
+    with metrics.collect() as breakdown:
+        result = await _analyze_cached(correlation_id, force)
+    timings = breakdown.as_dict()
+    status = result.get("cache") or "disabled"
+    metrics.inc("analyze_requests_total", cache=status)
+    metrics.record("analyze", timings["total_ms"] / 1000, cache=status)
+    return {**result, "timings": timings}
+
+
+async def _analyze_cached(correlation_id: str, force: bool) -> Dict[str, Any]:
+    cache = get_cache()
+    if cache is None:
+        return (await _analyze(correlation_id)).result
+    key = _cache_key(correlation_id)
+    if force:
+        cache.bypass()
+        entry = await _analyze(correlation_id)
+        _store(key, entry)
+        return {**entry.result, "cache": "bypass"}
+
+    async def _lookup_or_analyze() -> Tuple[CachedRca, str]:
+        entry = await _cache_lookup(correlation_id, key)
+        if entry is not None:
+            return entry, "hit"
+        entry = await _analyze(correlation_id)
+        _store(key, entry)
+        return entry, "miss"
+
+    # Identical concurrent requests share one lookup/analysis
+    (entry, status), joined = await cache.coalesce(key, _lookup_or_analyze)
+    return {**entry.result, "cache": "coalesced" if joined else status}
+
+
+def analyze_correlation(correlation_id: str, force: bool = False) -> Dict[str, Any]:
+    # Sync entry point: runs on the shared background loop so concurrent requests overlap their I/O
+    return aio.run(analyze_correlation_async(correlation_id, force=force))
+
+
+@dataclass
+class _BatchEntry:
+    head: List[Dict[str, Any]] = field(default_factory=list)
+    tail: deque = field(default_factory=deque)
+    log_count: int = 0
+    # template id -> lines of this correlation ID
+    counts: Counter = field(default_factory=Counter)
+    # error template ids in first-seen order
+    errors: Dict[int, None] = field(default_factory=dict)
+
+
+async def analyze_batch_async(correlation_ids: List[str]) -> Dict[str, Any]:
+    """RCA for many correlation IDs with shared fetching, retrieval and LLM calls.
+
+    Logs for all IDs come from ``IN (...)`` queries (LOG_IN_BATCH ids each) and feed one template
+    miner, so a message pattern is embedded and searched once however many IDs contain it. IDs are
+    clustered by failure signature (their set of error templates, or all templates when they have
+    no errors) and each cluster gets one LLM call, built from the first member's logs, the
+    cluster's template counts and the union of its members' retrieved snippets. Results are not
+    cached per ID; ``stats.timings`` is the per-stage breakdown.
+    """
+    with metrics.collect() as breakdown:
+        out = await _analyze_batch(correlation_ids)
+    out["stats"]["timings"] = breakdown.as_dict()
+    metrics.record("analyze_batch", out["stats"]["timings"]["total_ms"] / 1000)
+    return out
+
+
+async def _analyze_batch(correlation_ids: List[str]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    ids = list(dict.fromkeys(str(cid) for cid in correlation_ids if cid))
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=4)
+    stop = threading.Event()
+    producer = asyncio.ensure_future(asyncio.to_thread(_produce, lambda: db_ingest.iter_logs_by_correlations(ids), queue, loop, stop))
+
+    keep = max(2, settings.RCA_MAX_LOGS)
+    entries = {cid: _BatchEntry(tail=deque(maxlen=keep - keep // 2)) for cid in ids}
+    collector = _Collector()
+    rows = 0
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is _DONE:
+                break
+            for l in chunk:
+                entry = entries.get(str(l.get("correlation_id")))
+                if entry is None:
+                    continue
+                rows += 1
+                entry.log_count += 1
+                tpl = collector.add(l)
+                if tpl is not None:
+                    entry.counts[tpl.id] += 1
+                    if is_error(l):
+                        entry.errors[tpl.id] = None
+                if len(entry.head) < keep // 2:
+                    entry.head.append(l)
+                else:
+                    entry.tail.append(l)
+            await collector.flush()
+        await producer
+    except BaseException:
+        collector.cancel()
+        await _stop_producer(producer, queue, stop)
+        raise
+    per_template = await collector.results()
+    templates = collector.miner.templates
+
+    clusters: Dict[Tuple[int, ...], List[str]] = {}
+    for cid in ids:
+        entry = entries[cid]
+        if entry.log_count:
+            signature = tuple(sorted(entry.errors)) or tuple(sorted(entry.counts))
+            clusters.setdefault(signature, []).append(cid)
+
+    limiter = asyncio.Semaphore(max(1, settings.RCA_BATCH_LLM_CONCURRENCY))
+
+    async def _cluster_rca(number: int, signature: Tuple[int, ...], members: List[str]) -> Dict[str, Any]:
+        counts: Counter = Counter()
+        errors: set = set()
+        for cid in members:
+            counts.update(entries[cid].counts)
+            errors.update(entries[cid].errors)
+        cluster_templates = [
+            LogTemplate(id=t.id, tokens=t.tokens, count=counts[t.id], example=t.example) for t in templates if counts[t.id]
+        ]
+        hits = _collect_hits(per_template, (t.id for t in cluster_templates), errors)
+        first = entries[members[0]]
+        logs = first.head + list(first.tail)
+        packed = pack_prompt(logs, hits, cluster_templates)
+        async with limiter:
+            rca_text = await agenerate_rca(logs, [h["document"] for h in hits], cluster_templates, packed)
+        return {
+            "cluster": number,
+            "signature": [templates[i].text for i in signature],
+            "correlation_ids": members,
+            "representative": members[0],
+            "log_count": sum(entries[cid].log_count for cid in members),
+            "logs": logs,
+            "template_count": len(cluster_templates),
+            "context_count": len(hits),
+            "frame_hits": sum(1 for h in hits if h.get("source") == "frame"),
+            "contexts": packed.included_contexts,
+            "prompt": packed.report,
+            "rca": rca_text,
+        }
+
+    results = await asyncio.gather(*(_cluster_rca(i, sig, members) for i, (sig, members) in enumerate(clusters.items())))
+    cluster_of = {cid: c["cluster"] for c in results for cid in c["correlation_ids"]}
+    per_id = [
+        {
+            "correlation_id": cid,
+            "cluster": cluster_of.get(cid),
+            "log_count": entries[cid].log_count,
+            "logs_truncated": entries[cid].log_count > len(entries[cid].head) + len(entries[cid].tail),
+            "template_count": len(entries[cid].counts),
+            "error_templates": [templates[i].text for i in entries[cid].errors],
+        }
+        for cid in ids
+    ]
+    stats = {
+        "ids": len(ids),
+        "ids_without_logs": sum(1 for cid in ids if not entries[cid].log_count),
+        "log_rows": rows,
+        "db_queries": -(-len(ids) // max(1, settings.LOG_IN_BATCH)),
+        "templates": len(templates),
+        "retrieval_queries": collector.retrieval_queries,
+        "llm_calls": len(results),
+        "total_ms": round((time.perf_counter() - t0) * 1000, 1),
     }
+    logger.info("Batch RCA for %d ids: %d clusters, %d retrieval queries in %.1fms",
+                len(ids), len(results), collector.retrieval_queries, stats["total_ms"])
+    return {"results": per_id, "clusters": list(results), "stats": stats}
+
+
+def analyze_batch(correlation_ids: List[str]) -> Dict[str, Any]:
+    return aio.run(analyze_batch_async(correlation_ids))
+
+
+async def stream_analysis(correlation_id: str, force: bool = False) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Yield ``(event, data)`` pairs: one ``context`` event, then ``token`` events, then ``done``.
+
+    ``done`` carries the stream timings: ``ttfb_ms`` (start to the context event, the first byte
+    the client sees), ``ttft_ms`` (start to the first LLM token), ``total_ms`` and the per-stage
+    ``stages`` breakdown. A cached analysis is replayed as a single token event.
+    """
+    t0 = time.perf_counter()
+    ms = lambda: round((time.perf_counter() - t0) * 1000, 1)
+    # Bound per step only: each step of the generator runs in a fresh copy of the caller's context
+    breakdown = metrics.Breakdown()
+    cache = get_cache()
+    key = _cache_key(correlation_id)
+    entry = None
+    if cache is not None:
+        if force:
+            cache.bypass()
+        else:
+            with metrics.collect(breakdown):
+                entry = await _cache_lookup(correlation_id, key)
+
+    if entry is not None:
+        summary = {k: v for k, v in entry.result.items() if k != "rca"}
+        yield "context", {**summary, "contexts": entry.contexts, "cache": "hit"}
+        ttfb = ms()
+        yield "token", {"text": entry.result["rca"]}
+        timings = {"ttfb_ms": ttfb, "ttft_ms": ms(), "total_ms": ms(), "chars": len(entry.result["rca"]), "cached": True,
+                   "stages": breakdown.as_dict()}
+        _record_stream(timings)
+        yield "done", timings
+        return
+
+    with metrics.collect(breakdown):
+        with metrics.timer("gather_context"):
+            ctx = await _gather_context(correlation_id)
+        packed = pack_prompt(ctx.logs, ctx.hits, ctx.templates)
+    summary = _summary(correlation_id, ctx, packed)
+    ttfb = ms()
+    status = None if cache is None else ("bypass" if force else "miss")
+    yield "context", {**summary, "contexts": packed.included_contexts, "cache": status}
+
+    ttft = None
+    pieces: List[str] = []
+    async for piece in astream_rca(ctx.logs, ctx.retrieved, ctx.templates, packed):
+        if ttft is None:
+            ttft = ms()
+        pieces.append(piece)
+        yield "token", {"text": piece}
+
+    rca_text = "".join(pieces)
+    if cache is not None:
+        _store(key, CachedRca(ctx.fingerprint, {**summary, "rca": rca_text}, packed.included_contexts))
+    # astream_rca records its histogram sample itself, outside this breakdown
+    breakdown.add("llm_stream", (ms() - ttfb) / 1000)
+    timings = {"ttfb_ms": ttfb, "ttft_ms": ttft, "total_ms": ms(), "chars": len(rca_text), "cached": False,
+               "stages": breakdown.as_dict()}
+    _record_stream(timings)
+    logger.info("Streamed RCA for %s: ttfb=%.1fms ttft=%sms total=%.1fms", correlation_id, ttfb, ttft, timings["total_ms"])
+    yield "done", timings
+
+
+def iter_analysis_events(correlation_id: str, force: bool = False) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # Sync entry point for the SSE route; events are produced on the shared background loop
+    return aio.iter_async(stream_analysis(correlation_id, force=force))
+
+
+def _record_stream(timings: Dict[str, Any]) -> None:
+    with _STREAM_LOCK:
+        _STREAM_STATS["streams"] += 1
+        _STREAM_STATS["last"] = timings
+        for key in ("ttfb_ms", "ttft_ms", "total_ms"):
+            if timings.get(key) is not None:
+                _STREAM_STATS[f"{key}_sum"] += timings[key]
+
+
+def stream_stats() -> Dict[str, Any]:
+    with _STREAM_LOCK:
+        n = _STREAM_STATS["streams"]
+        out: Dict[str, Any] = {"streams": n, "last": _STREAM_STATS["last"]}
+        for key in ("ttfb_ms", "ttft_ms", "total_ms"):
+            out[f"avg_{key}"] = round(_STREAM_STATS[f"{key}_sum"] / n, 1) if n else None
+    return out
@@ -0,0 +1,119 @@
+from __future__ import annotations
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from ..config import settings
+
+
+_CACHE: "RcaCache | None" = None
+_CACHE_LOCK = threading.Lock()
+
+# (correlation_id, index version, LLM model); the log fingerprint is checked against the entry
+Key = Tuple[str, str, str]
+
+
+@dataclass
+class CachedRca:
+    fingerprint: str
+    result: Dict[str, Any]
+    contexts: List[str] = field(default_factory=list)
+    created: float = field(default_factory=time.monotonic)
+
+
+class RcaCache:
+    """TTL + LRU cache of finished analyses with coalescing of identical in-flight requests.
+
+    An entry is served only while its log fingerprint matches the logs currently in the DB, so
+    a hit is valid for (correlation_id, log fingerprint, index version, LLM_MODEL).
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: "OrderedDict[Key, CachedRca]" = OrderedDict()
+        self._inflight: Dict[Key, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.coalesced = 0
+        self.bypassed = 0
+
+    def get(self, key: Key, fingerprint: str) -> CachedRca | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if (self.ttl and time.monotonic() - entry.created > self.ttl) or entry.fingerprint != fingerprint:
+                # Expired, or logs for the correlation ID changed since the analysis
+                del self._entries[key]
+                self.stale += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def bypass(self) -> None:
+        with self._lock:
+            self.bypassed += 1
+
+    def put(self, key: Key, entry: CachedRca) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def coalesce(self, key: Key, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run ``compute`` unless the same key is already running; returns (result, joined)."""
+        with self._lock:
+            running = self._inflight.get(key)
+            if running is None:
+                running = self._inflight[key] = Future()
+                owner = True
+            else:
+                self.coalesced += 1
+                owner = False
+        if not owner:
+            # Shielded so a disconnecting joiner never cancels the shared computation
+            return await asyncio.shield(asyncio.wrap_future(running)), True
+        try:
+            result = await compute()
+        except BaseException as e:
+            running.set_exception(e)
+            # Mark retrieved so an exception nobody joined isn't logged as unhandled
+            running.exception()
+            raise
+        else:
+            running.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "coalesced": self.coalesced,
+            "bypassed": self.bypassed,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+        }
+
+
+def get_cache() -> RcaCache | None:
+    global _CACHE
+    if not settings.RCA_CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = RcaCache(settings.RCA_CACHE_SIZE, settings.RCA_CACHE_TTL)
+    return _CACHE
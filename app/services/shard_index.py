@@ -0,0 +1,169 @@
+from __future__ import annotations
+import os
+import sqlite3
+import logging
+import threading
+from typing import List, Dict, Any, Sequence, Tuple
+from ..config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Documents without a package (or, with SHARD_BY=root, directly under the scanned path)
+DEFAULT_SHARD = "default"
+_INDEX: "ShardIndex | None" = None
+_INDEX_LOCK = threading.Lock()
+
+
+def package_prefix(name: str, depth: int | None = None) -> str:
+    """The first SHARD_PACKAGE_DEPTH dot-separated segments of a package or logger name."""
+    depth = settings.SHARD_PACKAGE_DEPTH if depth is None else depth
+    return ".".join(name.split(".")[:max(1, depth)]) if name else ""
+
+
+def shard_for(meta: Dict[str, Any]) -> Tuple[str, str]:
+    """``(shard, package prefix)`` of a document: its ``shard`` metadata (SHARD_BY=root), else its package prefix."""
+    prefix = package_prefix(meta.get("package") or "")
+    return meta.get("shard") or prefix or DEFAULT_SHARD, prefix
+
+
+class ShardIndex:
+    """Which shard collection holds each document, and which shards hold each package prefix.
+
+    ``route`` maps a logger name to shards by the longest package prefix (up to
+    SHARD_PACKAGE_DEPTH segments) that indexed documents share with it. Rows live in SQLite next
+    to the vector index; the in-memory routing table is rebuilt when the index version changes.
+    """
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._conn_pid: int | None = None
+        self._loaded_version: str | None = None
+        # package prefix -> shards holding documents of that prefix
+        self._routes: Dict[str, List[str]] = {}
+        self._sizes: Dict[str, int] = {}
+        self.routed = 0
+        self.unrouted = 0
+
+    def _db(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        if self._conn is None or self._conn_pid != pid:
+            if self.path:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path or ":memory:", check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, shard TEXT NOT NULL, prefix TEXT NOT NULL)")
+            conn.commit()
+            self._conn, self._conn_pid = conn, pid
+        return self._conn
+
+    def _lookup(self, db: sqlite3.Connection, ids: Sequence[str]) -> Dict[str, str]:
+        out: Dict[str, str] = {}
+        for j in range(0, len(ids), 500):
+            chunk = list(ids[j:j + 500])
+            out.update(db.execute(f"SELECT id, shard FROM docs WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+        return out
+
+    # -- writes (indexing) -------------------------------------------------------------------
+
+    def add(self, docs: Sequence[Dict[str, Any]]) -> Tuple[Dict[str, List[int]], Dict[str, List[str]]]:
+        """Record ``docs``; returns their positions grouped by shard, and ids that left another shard."""
+        groups: Dict[str, List[int]] = {}
+        rows = []
+        for pos, d in enumerate(docs):
+            shard, prefix = shard_for(d.get("metadata") or {})
+            groups.setdefault(shard, []).append(pos)
+            rows.append((d["id"], shard, prefix))
+        moved: Dict[str, List[str]] = {}
+        with self._lock:
+            db = self._db()
+            previous = self._lookup(db, [r[0] for r in rows])
+            for doc_id, shard, _ in rows:
+                old = previous.get(doc_id)
+                if old is not None and old != shard:
+                    moved.setdefault(old, []).append(doc_id)
+            db.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?, ?)", rows)
+            db.commit()
+        return groups, moved
+
+    def remove(self, ids: Sequence[str]) -> Dict[str, List[str]]:
+        """Forget ``ids``; returns the known ones grouped by the shard that held them."""
+        with self._lock:
+            db = self._db()
+            groups: Dict[str, List[str]] = {}
+            for doc_id, shard in self._lookup(db, ids).items():
+                groups.setdefault(shard, []).append(doc_id)
+            db.executemany("DELETE FROM docs WHERE id = ?", [(i,) for i in ids])
+            db.commit()
+        return groups
+
+    def clear(self) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM docs")
+            db.commit()
+            self._loaded_version = None
+
+    # -- reads (retrieval) -------------------------------------------------------------------
+
+    def _ensure_loaded(self, version: str) -> None:
+        if self._loaded_version == version:
+            return
+        routes: Dict[str, List[str]] = {}
+        sizes: Dict[str, int] = {}
+        for shard, prefix, n in self._db().execute("SELECT shard, prefix, COUNT(*) FROM docs GROUP BY shard, prefix"):
+            sizes[shard] = sizes.get(shard, 0) + n
+            if prefix:
+                routes.setdefault(prefix, []).append(shard)
+        self._routes, self._sizes = routes, sizes
+        self._loaded_version = version
+        logger.info("Loaded %d shards, %d routable package prefixes", len(sizes), len(routes))
+
+    def load(self, version: str) -> None:
+        """Load the routing table for ``version`` now rather than on the first lookup."""
+        with self._lock:
+            self._ensure_loaded(version)
+
+    def shards(self, version: str) -> List[str]:
+        with self._lock:
+            self._ensure_loaded(version)
+            return sorted(self._sizes)
+
+    def route(self, loggers: Sequence[str], version: str) -> List[str]:
+        """Shards matching any of ``loggers`` by longest package prefix; [] when none match."""
+        with self._lock:
+            self._ensure_loaded(version)
+            out: Dict[str, None] = {}
+            for name in loggers:
+                parts = (name or "").split(".")[:max(1, settings.SHARD_PACKAGE_DEPTH)]
+                for n in range(len(parts), 0, -1):
+                    shards = self._routes.get(".".join(parts[:n]))
+                    if shards:
+                        out.update(dict.fromkeys(shards))
+                        break
+            if out:
+                self.routed += 1
+            else:
+                self.unrouted += 1
+            return list(out)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "shards": len(self._sizes), "documents": sum(self._sizes.values()),
+            "routed": self.routed, "unrouted": self.unrouted,
+        }
+
+
+def get_index(path: str) -> ShardIndex:
+    global _INDEX
+    if _INDEX is None or _INDEX.path != path:
+        with _INDEX_LOCK:
+            if _INDEX is None or _INDEX.path != path:
+                _INDEX = ShardIndex(path)
+    return _INDEX
+
+
+def peek_index() -> ShardIndex | None:
+    return _INDEX
@@ -1,94 +1,492 @@
 from __future__ import annotations
 import os
-from typing import List, Dict, Any
+import re
+import time
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Sequence
 # Ensure telemetry is disabled before importing chromadb/posthog
 os.environ.setdefault("CHROMA_ANONYMIZED_TELEMETRY", "False")
 os.environ.setdefault("POSTHOG_DISABLED", "1")
 
-import chromadb
-from chromadb.utils import embedding_functions
-from chromadb.errors import InvalidDimensionException
 from ..config import settings
+from . import metrics
 from .embeddings import embed_texts
 
 
-_client = None
-_collection = None
+logger = logging.getLogger(__name__)
 
+_backend: "VectorBackend | None" = None
+_shard_backends: Dict[str, "VectorBackend"] = {}
+_backend_lock = threading.Lock()
+# Called after the collection is dropped, e.g. to invalidate the scan manifest
+_reset_hooks: List[Callable[[], None]] = []
+_shard_pool: ThreadPoolExecutor | None = None
+_shard_pool_pid: int | None = None
 
-def _client_instance():
-    global _client
-    if _client is None:
-        os.makedirs(settings.CHROMA_DIR, exist_ok=True)
-        # Disable Chroma telemetry to avoid posthog capture signature errors
-        try:
-            from chromadb.config import Settings as ChromaSettings
-            _client = chromadb.PersistentClient(
-                path=settings.CHROMA_DIR,
-                settings=ChromaSettings(anonymized_telemetry=False)
-            )
-        except Exception:
-            # Fallback without settings if import path changes
-            os.environ["CHROMA_ANONYMIZED_TELEMETRY"] = "False"
-            _client = chromadb.PersistentClient(path=settings.CHROMA_DIR)
-    return _client
 
+class VectorBackend(ABC):
+    """Storage engine behind vector_store; selected by VECTOR_BACKEND.
 
-def get_collection():
-    global _collection
-    if _collection is None:
-        _collection = _client_instance().get_or_create_collection(name=settings.CHROMA_COLLECTION)
-    return _collection
+    ``query`` returns one list per query embedding of ``{"document", "metadata", "distance"}``
+    dicts, closest first. ``upsert``/``query`` raise :class:`DimensionError` when the embedding
+    size doesn't match what the index was built with.
+    """
 
+    name = "base"
+    # Chroma historically dropped the collection on a query-side mismatch; the mmap index keeps its data
+    reset_on_query_mismatch = False
 
-def _reset_collection():
-    """Delete and recreate the collection (used when embedding dimension changes)."""
-    global _collection
-    client = _client_instance()
-    try:
+    @abstractmethod
+    def upsert(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]], embeddings) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    def query(self, embeddings, top_k: int) -> List[List[Dict[str, Any]]]:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def reset(self) -> None:
+        ...
+
+
+class DimensionError(ValueError):
+    pass
+
+
+class ChromaBackend(VectorBackend):
+    name = "chroma"
+    reset_on_query_mismatch = True
+
+    def __init__(self, collection: str | None = None):
+        self.collection_name = collection or settings.CHROMA_COLLECTION
+        self._client = None
+        self._collection = None
+
+    def _client_instance(self):
+        if self._client is None:
+            import chromadb
+            os.makedirs(settings.CHROMA_DIR, exist_ok=True)
+            # Disable Chroma telemetry to avoid posthog capture signature errors
+            try:
+                from chromadb.config import Settings as ChromaSettings
+                self._client = chromadb.PersistentClient(
+                    path=settings.CHROMA_DIR,
+                    settings=ChromaSettings(anonymized_telemetry=False)
+                )
+            except Exception:
+                # Fallback without settings if import path changes
+                os.environ["CHROMA_ANONYMIZED_TELEMETRY"] = "False"
+                self._client = chromadb.PersistentClient(path=settings.CHROMA_DIR)
+        return self._client
+
+    def collection(self):
+        if self._collection is None:
+            self._collection = self._client_instance().get_or_create_collection(name=self.collection_name)
+        return self._collection
+
+    def reset(self) -> None:
+        """Delete and recreate the collection (used when embedding dimension changes)."""
+        client = self._client_instance()
         try:
-            client.delete_collection(settings.CHROMA_COLLECTION)
+            try:
+                client.delete_collection(self.collection_name)
+            except Exception:
+                pass
+            self._collection = client.get_or_create_collection(name=self.collection_name)
         except Exception:
+            # If something goes wrong, leave the collection as-is so callers can handle gracefully
             pass
-        _collection = client.get_or_create_collection(name=settings.CHROMA_COLLECTION)
-    except Exception:
-        # If something goes wrong, leave _collection as-is so callers can handle gracefully
-        pass
 
+    def upsert(self, ids, texts, metadatas, embeddings) -> None:
+        from chromadb.errors import InvalidDimensionException
+        if hasattr(embeddings, "tolist"):
+            embeddings = embeddings.tolist()
+        try:
+            self.collection().upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+        except InvalidDimensionException as e:
+            raise DimensionError(str(e)) from e
 
-def upsert_documents(docs: List[Dict[str, Any]]):
-    col = get_collection()
-    ids = [d["id"] for d in docs]
-    texts = [d["text"] for d in docs]
-    metadatas = [d.get("metadata", {}) for d in docs]
-    embeddings = embed_texts(texts)
+    def delete(self, ids: List[str], batch_size: int = 500) -> None:
+        col = self.collection()
+        for i in range(0, len(ids), batch_size):
+            col.delete(ids=ids[i:i + batch_size])
+
+    def query(self, embeddings, top_k: int) -> List[List[Dict[str, Any]]]:
+        from chromadb.errors import InvalidDimensionException
+        if hasattr(embeddings, "tolist"):
+            embeddings = embeddings.tolist()
+        try:
+            q = self.collection().query(query_embeddings=embeddings, n_results=top_k, include=["metadatas", "documents", "distances"])
+        except InvalidDimensionException as e:
+            raise DimensionError(str(e)) from e
+        results: List[List[Dict[str, Any]]] = []
+        for i in range(len(embeddings)):
+            group = []
+            for j in range(len(q.get("documents", [[]])[i])):
+                group.append({
+                    "document": q["documents"][i][j],
+                    "metadata": q["metadatas"][i][j],
+                    "distance": q["distances"][i][j],
+                })
+            results.append(group)
+        return results
+
+    def count(self) -> int:
+        return self.collection().count()
+
+
+class MmapBackend(VectorBackend):
+    name = "mmap"
+
+    def __init__(self, collection: str | None = None):
+        from .mmap_index import MmapIndex
+        self.collection_name = collection or settings.CHROMA_COLLECTION
+        self.index = MmapIndex(os.path.join(settings.MMAP_INDEX_DIR, self.collection_name), settings.MMAP_INDEX_DTYPE)
+
+    def upsert(self, ids, texts, metadatas, embeddings) -> None:
+        from .mmap_index import DimensionMismatch
+        try:
+            self.index.upsert(ids, texts, metadatas, embeddings)
+        except DimensionMismatch as e:
+            raise DimensionError(str(e)) from e
+
+    def delete(self, ids: List[str]) -> None:
+        self.index.delete(ids)
+
+    def query(self, embeddings, top_k: int) -> List[List[Dict[str, Any]]]:
+        from .mmap_index import DimensionMismatch
+        try:
+            return self.index.search(embeddings, top_k)
+        except DimensionMismatch as e:
+            raise DimensionError(str(e)) from e
+
+    def count(self) -> int:
+        return self.index.count()
+
+    def reset(self) -> None:
+        self.index.reset()
+
+
+BACKENDS = {"chroma": ChromaBackend, "mmap": MmapBackend}
+
+
+def _new_backend(collection: str | None = None) -> VectorBackend:
+    name = settings.VECTOR_BACKEND.lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown VECTOR_BACKEND {settings.VECTOR_BACKEND!r}; expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](collection)
+
+
+def get_backend() -> VectorBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _new_backend()
+                logger.info("Using %s vector backend", _backend.name)
+    return _backend
+
+
+def shard_collection(shard: str) -> str:
+    """Collection (Chroma) or directory (mmap) name of a shard: ``<CHROMA_COLLECTION>__<shard>``."""
+    name = f"{settings.CHROMA_COLLECTION}__{re.sub(r'[^A-Za-z0-9_.-]+', '-', shard).strip('.-')}"
+    if len(name) > 63:
+        # Chroma allows 3-63 characters
+        name = f"{name[:54]}-{hashlib.sha1(shard.encode('utf-8')).hexdigest()[:8]}"
+    return name
+
+
+def get_shard_backend(shard: str) -> VectorBackend:
+    backend = _shard_backends.get(shard)
+    if backend is None:
+        with _backend_lock:
+            backend = _shard_backends.get(shard)
+            if backend is None:
+                backend = _shard_backends[shard] = _new_backend(shard_collection(shard))
+    return backend
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _shard_pool, _shard_pool_pid
+    pid = os.getpid()
+    if _shard_pool is None or _shard_pool_pid != pid:
+        with _backend_lock:
+            # Worker threads don't survive a fork; the child starts its own pool
+            if _shard_pool is None or _shard_pool_pid != pid:
+                _shard_pool = ThreadPoolExecutor(max_workers=max(1, settings.SHARD_QUERY_CONCURRENCY), thread_name_prefix="shard-query")
+                _shard_pool_pid = pid
+    return _shard_pool
+
+
+def _index_dir() -> str:
+    return settings.MMAP_INDEX_DIR if settings.VECTOR_BACKEND.lower() == "mmap" else settings.CHROMA_DIR
+
+
+def _version_path() -> str:
+    return os.path.join(_index_dir(), f"{settings.CHROMA_COLLECTION}.version")
+
+
+def index_version() -> str:
+    """Opaque token that changes whenever the collection is written; shared by all processes."""
     try:
-        col.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
-    except InvalidDimensionException:
-        # Collection was created with different embedding size; reset and retry once
-        _reset_collection()
-        col = get_collection()
-        col.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+        with open(_version_path(), "r", encoding="utf-8") as f:
+            return f.read().strip() or "0"
+    except OSError:
+        return "0"
+
+
+def _bump_version() -> None:
+    os.makedirs(_index_dir(), exist_ok=True)
+    tmp = f"{_version_path()}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(f"{time.time_ns()}-{os.getpid()}")
+    os.replace(tmp, _version_path())
+
+
+def literal_index():
+    from .literal_index import get_index
+    return get_index(os.path.join(_index_dir(), f"{settings.CHROMA_COLLECTION}.literals.sqlite3"))
+
+
+def frame_index():
+    from .frame_index import get_index
+    return get_index(os.path.join(_index_dir(), f"{settings.CHROMA_COLLECTION}.frames.sqlite3"))
+
+
+def shard_index():
+    from .shard_index import get_index
+    return get_index(os.path.join(_index_dir(), f"{settings.CHROMA_COLLECTION}.shards.sqlite3"))
+
+
+def reset_collection():
+    """Drop every document: the collection (all shards) and the literal/frame/shard indexes."""
+    get_backend().reset()
+    if settings.SHARD_BY:
+        registry = shard_index()
+        for shard in registry.shards(index_version()):
+            get_shard_backend(shard).reset()
+        registry.clear()
+    literal_index().clear()
+    frame_index().clear()
+    _bump_version()
+    for hook in _reset_hooks:
+        hook()
+
+
+def on_reset(hook: Callable[[], None]) -> None:
+    """Run ``hook`` whenever the collection is reset (embedding dimension change)."""
+    _reset_hooks.append(hook)
+
+
+def count_documents() -> int:
+    if settings.SHARD_BY:
+        return sum(get_shard_backend(s).count() for s in shard_index().shards(index_version()))
+    return get_backend().count()
+
+
+def _write(docs: List[Dict[str, Any]], embeddings) -> None:
+    if not settings.SHARD_BY:
+        get_backend().upsert([d["id"] for d in docs], [d["text"] for d in docs], [d.get("metadata", {}) for d in docs], embeddings)
+        return
+    groups, moved = shard_index().add(docs)
+    for shard, ids in moved.items():
+        # Re-homed after a SHARD_BY or package change; drop the copy in the old shard
+        get_shard_backend(shard).delete(ids)
+    for shard, positions in groups.items():
+        group = [docs[p] for p in positions]
+        get_shard_backend(shard).upsert(
+            [d["id"] for d in group], [d["text"] for d in group], [d.get("metadata", {}) for d in group], embeddings[positions],
+        )
+
+
+def upsert_documents(docs: List[Dict[str, Any]]):
+    embeddings = embed_texts([d["text"] for d in docs])
+    with metrics.timer("index_write", backend=get_backend().name):
+        try:
+            _write(docs, embeddings)
+        except DimensionError:
+            # Index was created with a different embedding size; reset and retry once
+            reset_collection()
+            _write(docs, embeddings)
+        literal_index().add(docs)
+        frame_index().add(docs)
+    _bump_version()
 
 
-def query_similar(texts: List[str], top_k: int = 8) -> List[List[Dict[str, Any]]]:
-    col = get_collection()
+def delete_documents(ids: List[str]):
+    if not ids:
+        return
+    if settings.SHARD_BY:
+        for shard, group in shard_index().remove(ids).items():
+            get_shard_backend(shard).delete(group)
+    else:
+        get_backend().delete(ids)
+    literal_index().remove(ids)
+    frame_index().remove(ids)
+    _bump_version()
+
+
+def index_spans(docs: List[Dict[str, Any]]):
+    """Record method documents in the frame index only (no embedding): stack frames resolve to them."""
+    frame_index().add(docs)
+    _bump_version()
+
+
+def delete_spans(ids: List[str]):
+    if not ids:
+        return
+    frame_index().remove(ids)
+    _bump_version()
+
+
+def _query_shards(embeddings, top_k: int, loggers: Sequence[Sequence[str]] | None) -> List[List[Dict[str, Any]]]:
+    # Each query goes to the shards its loggers route to, or to every shard when none match;
+    # shards are searched concurrently and the per-query results merged by distance
+    registry = shard_index()
+    version = index_version()
+    everything = registry.shards(version)
+    targets: Dict[str, List[int]] = {}
+    fallbacks = 0
+    for i in range(len(embeddings)):
+        shards = registry.route(loggers[i], version) if loggers and loggers[i] else []
+        if not shards:
+            fallbacks += 1
+            shards = everything
+        for shard in shards:
+            targets.setdefault(shard, []).append(i)
+    metrics.inc("shard_queries_total", len(embeddings) - fallbacks, route="routed")
+    metrics.inc("shard_queries_total", fallbacks, route="global")
+
+    def _search(shard: str) -> List[List[Dict[str, Any]]]:
+        return get_shard_backend(shard).query(embeddings[targets[shard]], top_k)
+
+    if len(targets) == 1:
+        found = {shard: _search(shard) for shard in targets}
+    else:
+        futures = {shard: _pool().submit(_search, shard) for shard in targets}
+        found = {shard: f.result() for shard, f in futures.items()}
+    merged: List[List[Dict[str, Any]]] = [[] for _ in range(len(embeddings))]
+    for shard, groups in found.items():
+        for i, group in zip(targets[shard], groups):
+            merged[i].extend({**item, "shard": shard} for item in group)
+    return [sorted(group, key=lambda item: item["distance"])[:top_k] for group in merged]
+
+
+def query_similar(texts: List[str], top_k: int = 8, loggers: Sequence[Sequence[str]] | None = None) -> List[List[Dict[str, Any]]]:
+    """Vector search; with SHARD_BY, ``loggers`` (logger names per text) pick the shards to search."""
+    backend = get_backend()
     embeddings = embed_texts(texts)
     try:
-        q = col.query(query_embeddings=embeddings, n_results=top_k, include=["metadatas", "documents", "distances"])
-    except InvalidDimensionException:
-        # Reset and return empty results to keep pipeline running; caller can rebuild index
-        _reset_collection()
+        with metrics.timer("vector_query", backend=backend.name):
+            if settings.SHARD_BY:
+                return _query_shards(embeddings, top_k, loggers)
+            return backend.query(embeddings, top_k)
+    except DimensionError as e:
+        # Return empty results to keep the pipeline running; the caller can rebuild the index
+        logger.warning("Query embeddings don't match the %s index: %s", backend.name, e)
+        if backend.reset_on_query_mismatch:
+            reset_collection()
         return [[] for _ in texts]
 
+
+def query_hybrid(
+    texts: List[str],
+    top_k: int = 8,
+    raw: List[str] | None = None,
+    loggers: Sequence[Sequence[str]] | None = None,
+) -> List[List[Dict[str, Any]]]:
+    """Lexical + vector retrieval over the log-format literal index.
+
+    ``raw`` are the original log messages behind ``texts`` (e.g. template examples). A message that
+    fullmatches an indexed literal is answered from the literal index alone and skips embedding
+    and the ANN query; the rest get vector results fused with BM25 over the literals by reciprocal
+    rank fusion. Falls back to :func:`query_similar` when HYBRID_RETRIEVAL is off. ``loggers``
+    route the vector part to shards (see :func:`query_similar`); literal and BM25 lookups are global.
+    """
+    if not settings.HYBRID_RETRIEVAL:
+        return query_similar(texts, top_k, loggers)
+    raw = raw or texts
+    lit = literal_index()
+    version = index_version()
+    results: List[List[Dict[str, Any]] | None] = [None] * len(texts)
+
+    with metrics.timer("literal_lookup"):
+        for i, message in enumerate(raw):
+            exact = lit.exact(message, version)[:top_k]
+            if exact:
+                docs = lit.documents(exact)
+                results[i] = [{**docs[d], "distance": 0.0, "source": "literal"} for d in exact if d in docs]
+
+    pending = [i for i, r in enumerate(results) if not r]
+    if pending:
+        vector = query_similar([texts[i] for i in pending], top_k, [loggers[i] for i in pending] if loggers else None)
+        with metrics.timer("bm25"):
+            lexical = [lit.bm25(f"{raw[i]} {texts[i]}", version, top_k) for i in pending]
+            lexical_docs = lit.documents([d for group in lexical for d, _ in group])
+        for i, vec_group, lex_group in zip(pending, vector, lexical):
+            results[i] = _rrf(vec_group, [lexical_docs[d] for d, _ in lex_group if d in lexical_docs], top_k)
+    return results
+
+
+def lookup_frames(groups: List[List[Any]], per_group: int = 3) -> List[List[Dict[str, Any]]]:
+    """Method snippets containing each group's stack frames (``frame_index.Frame``, top first).
+
+    Deterministic: no embedding or ANN query. At most ``per_group`` distinct snippets per group,
+    as items with ``source="frame"``, distance 0.0 and the resolved ``frame``.
+    """
+    index = frame_index()
+    version = index_version()
+    with metrics.timer("frame_lookup"):
+        resolved = [index.resolve(frames, version) for frames in groups]
+        docs = index.documents([doc_id for group in resolved for _, doc_id in group])
     results: List[List[Dict[str, Any]]] = []
-    for i in range(len(texts)):
-        group = []
-        for j in range(len(q.get("documents", [[]])[i])):
-            group.append({
-                "document": q["documents"][i][j],
-                "metadata": q["metadatas"][i][j],
-                "distance": q["distances"][i][j],
-            })
-        results.append(group)
+    for group in resolved:
+        items: Dict[str, Dict[str, Any]] = {}
+        for frame, doc_id in group:
+            if doc_id in docs and doc_id not in items and len(items) < per_group:
+                items[doc_id] = {**docs[doc_id], "distance": 0.0, "source": "frame", "frame": frame.text}
+        results.append(list(items.values()))
     return results
+
+
+def warm_up() -> int:
+    """Open the backend(s), map their vectors with one query and load the side indexes; returns the document count."""
+    version = index_version()
+    literal_index().load(version)
+    frame_index().load(version)
+    if settings.SHARD_BY:
+        shard_index().load(version)
+    count = count_documents()
+    if count:
+        query_similar(["warm-up"], 1)
+    return count
+
+
+def _rrf(vector: List[Dict[str, Any]], lexical: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    # Reciprocal rank fusion keyed by document text (Chroma results carry no ids)
+    k = settings.RRF_K
+    scores: Dict[str, float] = {}
+    items: Dict[str, Dict[str, Any]] = {}
+    for source, group in (("vector", vector), ("bm25", lexical)):
+        for rank, item in enumerate(group):
+            doc = item["document"]
+            scores[doc] = scores.get(doc, 0.0) + 1.0 / (k + rank + 1)
+            if doc in items:
+                items[doc]["source"] = "hybrid"
+            else:
+                items[doc] = {**item, "source": source}
+                items[doc].setdefault("distance", None)
+    ranked = sorted(scores, key=lambda d: -scores[d])[:top_k]
+    return [{**items[d], "rrf_score": round(scores[d], 6)} for d in ranked]
@@ -0,0 +1,84 @@
+"""Opt-in warm-up before a worker takes traffic (WARMUP, WARMUP_STEPS).
+
+Each step pays a one-off cost that would otherwise land on the first request: ``db`` opens a
+pooled connection, ``embeddings`` loads the configured provider's model and the local fallback,
+``index`` opens the vector backend, maps its vectors with one query and loads the literal and
+frame indexes, ``llm`` imports the OpenAI SDK and builds the shared loop's client, ``tokenizer``
+loads tiktoken. Steps are best effort: a failure is logged and reported, never raised.
+"""
+from __future__ import annotations
+import time
+import logging
+from typing import Any, Callable, Dict, Iterable
+from ..config import settings
+from . import metrics
+
+STEPS = ("db", "embeddings", "index", "llm", "tokenizer")
+logger = logging.getLogger(__name__)
+
+_REPORT: Dict[str, Any] | None = None
+
+
+def _db() -> Any:
+    from . import db_ingest
+    if settings.USE_DUMMY_LOGS or not settings.DB_URL:
+        return "skipped (no DB)"
+    return db_ingest.ping()
+
+
+def _embeddings() -> Any:
+    from .embeddings import warm_up
+    return warm_up()
+
+
+def _index() -> Any:
+    from .vector_store import warm_up
+    return {"documents": warm_up()}
+
+
+def _llm() -> Any:
+    from .llm import warm_up
+    return warm_up() or "skipped (no OPENAI_API_KEY)"
+
+
+def _tokenizer() -> Any:
+    from .context_packer import count_tokens
+    return count_tokens("warm-up")
+
+
+_RUNNERS: Dict[str, Callable[[], Any]] = {
+    "db": _db, "embeddings": _embeddings, "index": _index, "llm": _llm, "tokenizer": _tokenizer,
+}
+
+
+def warm_up(steps: Iterable[str] | None = None) -> Dict[str, Any]:
+    """Run ``steps`` (default WARMUP_STEPS) in STEPS order; returns per-step results and timings."""
+    global _REPORT
+    wanted = {s.strip() for s in (settings.WARMUP_STEPS if steps is None else steps) if s.strip()}
+    unknown = wanted - set(STEPS)
+    if unknown:
+        logger.warning("Ignoring unknown warm-up steps: %s", ", ".join(sorted(unknown)))
+    t0 = time.perf_counter()
+    report: Dict[str, Any] = {"steps": {}}
+    for name in STEPS:
+        if name not in wanted:
+            continue
+        t = time.perf_counter()
+        try:
+            entry: Dict[str, Any] = {"ok": True, "result": _RUNNERS[name]()}
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+            entry = {"ok": False, "error": str(e)}
+        seconds = time.perf_counter() - t
+        entry["ms"] = round(seconds * 1000, 1)
+        metrics.record("warmup", seconds, step=name)
+        report["steps"][name] = entry
+    report["total_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    logger.info("Warm-up finished in %.1fms: %s", report["total_ms"],
+                ", ".join(f"{n}={e['ms']}ms" + ("" if e["ok"] else " (failed)") for n, e in report["steps"].items()))
+    _REPORT = report
+    return report
+
+
+def last_report() -> Dict[str, Any] | None:
+    return _REPORT
@@ -0,0 +1,5 @@
+"""Benchmark suite entry point; see benchmarks/suite.py (python bench.py --help)."""
+from benchmarks.suite import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Deterministic hashing embedder, so benchmarks don't download or run a model.
+
+Token unigrams and bigrams are hashed into ``dim`` buckets with signed counts and L2-normalized;
+texts sharing words land close together, which keeps retrieval results meaningful. ``install``
+routes the local Sentence-Transformers path (and so the embedding cache) through it.
+"""
+from __future__ import annotations
+import hashlib
+import re
+from typing import List
+
+import numpy as np
+
+_TOKEN = re.compile(r"[A-Za-z0-9_]+")
+
+
+def embed(texts: List[str], dim: int = 384) -> np.ndarray:
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = [t.lower() for t in _TOKEN.findall(text)]
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            out[row, h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    out /= norms
+    return out
+
+
+def install(dim: int = 384) -> None:
+    """Serve every embed_texts call from the hashing embedder (distinct cache key per dim)."""
+    from app.config import settings
+    from app.services import embeddings
+
+    settings.USE_OLLAMA_EMBEDDINGS = False
+    settings.USE_OPENAI_EMBEDDINGS = False
+    settings.ST_EMBEDDING_MODEL = f"bench-hash-{dim}"
+    embeddings._st_embed = lambda texts: embed(texts, dim)
@@ -0,0 +1,108 @@
+"""Stub OpenAI-compatible chat server that streams a canned RCA token by token.
+
+Usage: python -m benchmarks.fake_llm [--port 8089] [--first-token-ms 300] [--token-ms 10]
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=fake.
+"""
+from __future__ import annotations
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_RCA = (
+    "# Summary\n- **NullPointerException** in `UserAssembler.map` failed the request.\n\n"
+    "# Timeline\n- **2024-01-01 00:00:03** - [ERROR] - com.example.assembler.UserAssembler: NPE at User.java:87\n\n"
+    "# Root Cause\n- `user.getProfile()` returned null after a cache miss.\n\n"
+    "# Contributing Factors\n- No null check on the cache-miss path.\n\n"
+    "# Impact\n- Request returned **500**.\n\n"
+    "# Affected Components\n- `UserService`, `UserAssembler`, `UserCache`.\n\n"
+    "# Recommended Fix\n1. Guard `getProfile()` against null.\n\n"
+    "# Preventive Actions\n- Alert on assembler exceptions.\n"
+)
+
+
+def _tokens(text: str):
+    # Roughly word-sized pieces, keeping whitespace attached like real tokenizers do
+    piece = ""
+    for ch in text:
+        piece += ch
+        if ch in " \n":
+            yield piece
+            piece = ""
+    if piece:
+        yield piece
+
+
+def make_handler(first_token_ms: float, token_ms: float, text: str = CANNED_RCA):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *_):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            model = body.get("model", "fake")
+            base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": model}
+            time.sleep(first_token_ms / 1000)
+            if not body.get("stream"):
+                payload = json.dumps({
+                    **base, "object": "chat.completion",
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+
+            def send(delta, finish=None):
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+
+            send({"role": "assistant", "content": ""})
+            for tok in _tokens(text):
+                send({"content": tok})
+                time.sleep(token_ms / 1000)
+            send({}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+
+def serve(port: int = 0, first_token_ms: float = 300, token_ms: float = 10) -> ThreadingHTTPServer:
+    """Start the stub server on a daemon thread; ``port=0`` picks a free port (see ``server_address``)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(first_token_ms, token_ms))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--first-token-ms", type=float, default=300)
+    ap.add_argument("--token-ms", type=float, default=10)
+    args = ap.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.first_token_ms, args.token_ms))
+    print(f"fake LLM listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Micro-benchmark: exact log-format literal lookup and BM25 over the literal index.
+
+Usage: python -m benchmarks.literal_lookup [--literals 50000] [--lookups 20000]
+"""
+from __future__ import annotations
+import argparse
+import random
+import tempfile
+import time
+import os
+
+from app.services.literal_index import LiteralIndex
+
+WORDS = ("order payment user cache session token invoice shipment account refund inventory "
+         "gateway profile request response timeout retry upstream ledger").split()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--literals", type=int, default=50000)
+    ap.add_argument("--lookups", type=int, default=20000)
+    args = ap.parse_args()
+
+    rnd = random.Random(0)
+    docs, messages = [], []
+    for i in range(args.literals):
+        words = rnd.sample(WORDS, 4)
+        literal = f"{words[0].title()} {words[1]} failed for {words[2]}{i} id={{}} after {{}} ms ({words[3]})"
+        docs.append({"id": str(i), "text": literal, "metadata": {"log_format": literal}})
+        if i % max(1, args.literals // 1000) == 0:
+            messages.append(literal.replace("{}", str(rnd.randint(1, 10 ** 6)), 1).replace("{}", "250", 1))
+
+    index = LiteralIndex(os.path.join(tempfile.mkdtemp(), "literals.sqlite3"))
+    t0 = time.perf_counter()
+    index.add(docs)
+    index.exact("warm up", "v1")
+    print(f"build + load        : {(time.perf_counter() - t0) * 1000:9.1f} ms for {args.literals} literals")
+
+    t0 = time.perf_counter()
+    found = 0
+    for i in range(args.lookups):
+        found += bool(index.exact(messages[i % len(messages)], "v1"))
+    per = (time.perf_counter() - t0) / args.lookups
+    print(f"exact lookup        : {per * 1e6:9.1f} us/message ({found}/{args.lookups} matched)")
+
+    t0 = time.perf_counter()
+    n = min(args.lookups, 2000)
+    for i in range(n):
+        index.bm25(messages[i % len(messages)], "v1", 8)
+    print(f"bm25 top-8          : {(time.perf_counter() - t0) / n * 1e6:9.1f} us/message")
+
+
+if __name__ == "__main__":
+    main()
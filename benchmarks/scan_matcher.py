@@ -0,0 +1,69 @@
+"""Micro-benchmark: legacy regex/prefix-count scanner vs the indexed paren-balancing matcher.
+
+Usage: python -m benchmarks.scan_matcher [--methods 2000] [--repeat 3]
+"""
+from __future__ import annotations
+import argparse
+import re
+import time
+from typing import List
+
+from app.services import code_scan
+
+LEGACY_REGEX = re.compile(r"\.(info|error|warn|debug|trace)\s*\((?:.|\n)*?\)")
+
+
+def generate_java(methods: int) -> List[str]:
+    lines = ["package com.example.bench;\n", "\n", "public class Generated {\n"]
+    for i in range(methods):
+        lines += [
+            f"    public void handle{i}(String id, Order order) {{\n",
+            f"        log.info(\"Handling order {{}} for {{}}\", order.getId(), format(id, \"(n={i})\"));\n",
+            "        if (order == null) {\n",
+            f"            log.error(\n                \"Order missing for id {{}}: {{}}\",\n                id,\n                String.valueOf(lookup(id, {i})));\n",
+            "        }\n",
+            "    }\n",
+            "\n",
+        ]
+    lines.append("}\n")
+    return lines
+
+
+def legacy_scan(lines: List[str]) -> int:
+    joined = "".join(lines)
+    found = 0
+    for match in LEGACY_REGEX.finditer(joined):
+        joined[:match.start()].count("\n")
+        found += 1
+    return found
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--methods", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    lines = generate_java(args.methods)
+    size_kb = sum(len(l) for l in lines) / 1024
+    legacy = _best(lambda: legacy_scan(lines), args.repeat)
+    indexed = _best(lambda: code_scan._file_snippets("Generated.java", lines), args.repeat)
+    snippets = code_scan._file_snippets("Generated.java", lines)
+    matches = sum(len(s["metadata"]["call_lines"].split(",")) for s in snippets)
+    print(f"file: {len(lines)} lines, {size_kb:.0f} KiB, {matches} logger calls in {len(snippets)} snippets")
+    print(f"legacy regex + prefix count : {legacy * 1000:9.1f} ms")
+    print(f"line index + paren balance  : {indexed * 1000:9.1f} ms (includes snippet building)")
+    print(f"speedup                     : {legacy / indexed:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
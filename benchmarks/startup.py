@@ -0,0 +1,90 @@
+"""Cold-start benchmark: import time, create_app time and time to the first /analyze response.
+
+Usage: python -m benchmarks.startup [--runs 3] [--warmup] [--dim 384] [--id CID ...]
+Each run spawns a fresh interpreter that imports the app, builds it (running the WARMUP phase with
+``--warmup``) and posts /analyze for the given correlation IDs. Settings come from the environment,
+so point DB_URL, the index directories and OPENAI_BASE_URL at a prepared workload, or run it as
+the ``startup`` stage of ``python bench.py``. ``--dim`` serves embeddings from the hashing embedder.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+# Optional heavy dependencies that should stay off the import path
+HEAVY = ("sqlalchemy", "requests", "numpy", "chromadb", "openai", "tiktoken", "sentence_transformers", "torch")
+
+
+def child(ids: List[str], dim: int | None, spawned_at: float) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    from app import create_app
+    import_s = time.perf_counter() - t0
+    heavy = [m for m in HEAVY if m in sys.modules]
+    if dim:
+        from benchmarks import fake_embedder
+        fake_embedder.install(dim)
+    t1 = time.perf_counter()
+    client = create_app().test_client()
+    create_s = time.perf_counter() - t1
+    responses = []
+    for cid in ids:
+        t = time.perf_counter()
+        resp = client.post("/analyze", json={"correlation_id": cid})
+        responses.append(time.perf_counter() - t)
+        if resp.status_code != 200:
+            raise RuntimeError(f"/analyze {cid} returned {resp.status_code}")
+        if len(responses) == 1:
+            first_at = time.time()
+    return {
+        "import_ms": round(import_s * 1000, 1),
+        "create_app_ms": round(create_s * 1000, 1),
+        "first_response_ms": round(responses[0] * 1000, 1),
+        "next_response_ms": round(responses[1] * 1000, 1) if len(responses) > 1 else None,
+        # spawn to first response, interpreter start-up included
+        "time_to_first_response_ms": round((first_at - spawned_at) * 1000, 1),
+        "heavy_modules_at_import": heavy,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+    }
+
+
+def measure(runs: int, ids: List[str], warmup: bool = False, dim: int | None = None) -> List[Dict[str, Any]]:
+    env = dict(os.environ, WARMUP="1" if warmup else "0")
+    out = []
+    for _ in range(runs):
+        cmd = [sys.executable, "-m", "benchmarks.startup", "--child", str(time.time()), *(["--dim", str(dim)] if dim else [])]
+        for cid in ids:
+            cmd += ["--id", cid]
+        proc = subprocess.run(cmd, capture_output=True, text=True, cwd=os.getcwd(), env=env)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else str(proc.returncode))
+        out.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--warmup", action="store_true", help="set WARMUP=1 in the measured processes")
+    ap.add_argument("--dim", type=int, help="use the hashing embedder with this dimension")
+    ap.add_argument("--id", dest="ids", action="append", help="correlation ID to analyze (repeatable; default: two probes)")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    ids = args.ids or ["startup-probe-1", "startup-probe-2"]
+
+    if args.child:
+        print(json.dumps(child(ids, args.dim, float(args.child))))
+        return
+
+    for n, r in enumerate(measure(args.runs, ids, args.warmup, args.dim), 1):
+        print(f"run {n}: import {r['import_ms']}ms, create_app {r['create_app_ms']}ms, first /analyze {r['first_response_ms']}ms, "
+              f"next {r['next_response_ms']}ms, spawn to first response {r['time_to_first_response_ms']}ms; "
+              f"heavy modules at import: {', '.join(r['heavy_modules_at_import']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Time-to-first-byte of /analyze/stream vs full-response latency of /analyze, against the stub LLM.
+
+Usage: python -m benchmarks.stream_ttfb [--first-token-ms 300] [--token-ms 10] [--repeat 5]
+Retrieval is stubbed out so only the log fetch and the LLM path are measured.
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+from statistics import median
+
+from benchmarks import fake_llm
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--first-token-ms", type=float, default=300)
+    ap.add_argument("--token-ms", type=float, default=10)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    server = fake_llm.serve(0, args.first_token_ms, args.token_ms)
+    from app import create_app
+    from app.config import settings
+    from app.services import rca
+
+    settings.OPENAI_API_KEY = "fake"
+    settings.OPENAI_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    settings.USE_DUMMY_LOGS = True
+    rca.query_hybrid = lambda texts, top_k=8, raw=None, loggers=None: [[] for _ in texts]
+    client = create_app().test_client()
+
+    full, first_byte, first_token, streamed = [], [], [], []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        resp = client.post("/analyze", json={"correlation_id": "bench"})
+        resp.get_json()
+        full.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        resp = client.get("/analyze/stream?correlation_id=bench", buffered=False)
+        events = []
+        for raw in resp.response:
+            if not first_byte or len(first_byte) < len(full):
+                first_byte.append(time.perf_counter() - t0)
+            events.append(raw.decode() if isinstance(raw, bytes) else raw)
+        streamed.append(time.perf_counter() - t0)
+        done = [e for e in events if e.startswith("event: done")]
+        if done:
+            first_token.append(json.loads(done[-1].split("data: ", 1)[1])["ttft_ms"] / 1000)
+
+    ms = lambda xs: f"{median(xs) * 1000:9.1f} ms" if xs else "      n/a"
+    print(f"/analyze full response        : {ms(full)}")
+    print(f"/analyze/stream first byte    : {ms(first_byte)}")
+    print(f"/analyze/stream first token   : {ms(first_token)}")
+    print(f"/analyze/stream last byte     : {ms(streamed)}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
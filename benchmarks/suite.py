@@ -0,0 +1,283 @@
+"""End-to-end benchmark suite: scan, embed, index, retrieve, analyze, batch analyze and cold start.
+
+Usage: python bench.py [--stages scan,embed,index,retrieve,analyze,batch,startup] [--out results.json] [--compare old.json]
+       (or python -m benchmarks.suite)
+Generates a synthetic Spring Boot tree and SQLite log table (benchmarks/synthetic.py), embeds with
+the deterministic hashing embedder (benchmarks/fake_embedder.py) and answers LLM calls from the stub
+server (benchmarks/fake_llm.py), so runs are reproducible and offline. Each stage runs in its own
+subprocess against the workdir, reporting throughput, p50/p95/p99 latency and peak RSS; ``--out``
+writes the results as JSON and ``--compare`` prints the change against an earlier results file.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+STAGES = ("scan", "embed", "index", "retrieve", "analyze", "batch", "startup")
+UNITS = {"scan": "files", "embed": "texts", "index": "docs", "retrieve": "queries", "analyze": "ids", "batch": "ids",
+         "startup": "starts"}
+
+
+def _rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _summarize(stage: str, count: int, seconds: float, latencies: List[float], **extra: Any) -> Dict[str, Any]:
+    lat = np.array(latencies or [seconds]) * 1000
+    return {
+        "unit": UNITS[stage],
+        "count": count,
+        "seconds": round(seconds, 3),
+        "throughput_per_s": round(count / seconds, 1) if seconds else None,
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat, 95)), 3),
+        "p99_ms": round(float(np.percentile(lat, 99)), 3),
+        "peak_rss_mb": round(_rss_mb(), 1),
+        **extra,
+    }
+
+
+def _stage_env(workdir: str, args, llm_url: str, stage: str) -> Dict[str, str]:
+    data = os.path.join(workdir, "data")
+    env = dict(os.environ)
+    env.update(
+        VECTOR_BACKEND=args.backend,
+        MMAP_INDEX_DIR=os.path.join(data, "mmap"),
+        CHROMA_DIR=os.path.join(data, "chroma"),
+        SCAN_MANIFEST_PATH=os.path.join(data, "manifest.json"),
+        EMBEDDING_CACHE_PATH=os.path.join(data, "embedding_cache.sqlite3"),
+        INGEST_JOBS_PATH=os.path.join(data, "ingest_jobs.sqlite3"),
+        JAVA_CODE_PATH=os.path.join(workdir, "src"),
+        DB_URL=f"sqlite:///{os.path.join(workdir, 'logs.sqlite3')}",
+        USE_DUMMY_LOGS="0",
+        OPENAI_API_KEY="bench",
+        OPENAI_BASE_URL=llm_url,
+        # Every analysis does the full work
+        RCA_CACHE_ENABLED="0",
+        # The embed stage measures the uncached path; later stages get a cold cache of their own
+        EMBEDDING_CACHE_ENABLED="0" if stage == "embed" else "1",
+    )
+    return env
+
+
+def _sample_ids(n: int, seed: int) -> List[str]:
+    from sqlalchemy import text
+    from app.services import db_ingest
+    with db_ingest._engine().connect() as conn:
+        ids = [r[0] for r in conn.execute(text("SELECT DISTINCT correlation_id FROM logs ORDER BY correlation_id"))]
+    return random.Random(seed).sample(ids, min(n, len(ids)))
+
+
+def run_stage(stage: str, args) -> Dict[str, Any]:
+    from benchmarks import fake_embedder
+    fake_embedder.install(args.dim)
+    from app.config import settings
+    from app.services import code_scan
+
+    src = settings.JAVA_CODE_PATH
+    if stage == "scan":
+        files = list(code_scan._iter_source_files(src))
+        latencies, snippets = [], 0
+        t0 = time.perf_counter()
+        for fp in files:
+            t = time.perf_counter()
+            snippets += len(code_scan._scan_file((fp, None))["snippets"])
+            latencies.append(time.perf_counter() - t)
+        return _summarize(stage, len(files), time.perf_counter() - t0, latencies, snippets=snippets)
+
+    if stage == "embed":
+        from app.services.embeddings import embed_texts
+        texts = [s["text"] for s in code_scan.iter_snippets(src, workers=1)]
+        latencies = []
+        t0 = time.perf_counter()
+        for i in range(0, len(texts), args.embed_batch):
+            t = time.perf_counter()
+            embed_texts(texts[i:i + args.embed_batch])
+            latencies.append(time.perf_counter() - t)
+        return _summarize(stage, len(texts), time.perf_counter() - t0, latencies, batch=args.embed_batch)
+
+    if stage == "index":
+        latencies = []
+        upsert = code_scan.upsert_documents
+
+        def _timed(docs):
+            t = time.perf_counter()
+            upsert(docs)
+            latencies.append(time.perf_counter() - t)
+
+        code_scan.upsert_documents = _timed
+        t0 = time.perf_counter()
+        stats = code_scan.scan_and_index(src, full=True)
+        return _summarize(stage, stats["documents_indexed"], time.perf_counter() - t0, latencies,
+                          files=stats["added"] + stats["updated"], error=stats.get("error"))
+
+    if stage == "retrieve":
+        from app.services import db_ingest
+        from app.services.log_templates import mask
+        from app.services.vector_store import query_hybrid
+        messages = []
+        for cid in _sample_ids(args.queries, args.seed):
+            rows = db_ingest.fetch_logs_by_correlation(cid, limit=5)
+            messages += [r["message"].split("\n", 1)[0] for r in rows]
+        messages = messages[:args.queries]
+        latencies, sources = [], {}
+        t0 = time.perf_counter()
+        for msg in messages:
+            t = time.perf_counter()
+            hits = query_hybrid([mask(msg)], 5, [msg])[0]
+            latencies.append(time.perf_counter() - t)
+            if hits:
+                source = hits[0].get("source", "vector")
+                sources[source] = sources.get(source, 0) + 1
+        return _summarize(stage, len(messages), time.perf_counter() - t0, latencies, top_source=sources)
+
+    if stage == "analyze":
+        from app.services import rca
+        ids = _sample_ids(args.analyze_ids, args.seed)
+        latencies = []
+        t0 = time.perf_counter()
+        for cid in ids:
+            t = time.perf_counter()
+            rca.analyze_correlation(cid)
+            latencies.append(time.perf_counter() - t)
+        return _summarize(stage, len(ids), time.perf_counter() - t0, latencies)
+
+    if stage == "batch":
+        from app.services import rca
+        ids = _sample_ids(args.batch_ids, args.seed)
+        t0 = time.perf_counter()
+        result = rca.analyze_batch(ids)
+        return _summarize(stage, len(ids), time.perf_counter() - t0, [], clusters=len(result["clusters"]),
+                          retrieval_queries=result["stats"]["retrieval_queries"])
+
+    if stage == "startup":
+        # Fresh interpreters (benchmarks/startup.py); latency is spawn to first /analyze response
+        from benchmarks import startup
+        runs = startup.measure(args.startup_runs, _sample_ids(2, args.seed), args.warmup, args.dim)
+        median = lambda key: round(float(np.median([r[key] for r in runs])), 1)
+        latencies = [r["time_to_first_response_ms"] / 1000 for r in runs]
+        return _summarize(stage, len(runs), sum(latencies), latencies, warmup=args.warmup,
+                          import_ms=median("import_ms"), create_app_ms=median("create_app_ms"),
+                          first_response_ms=median("first_response_ms"), next_response_ms=median("next_response_ms"),
+                          peak_rss_mb=max(r["peak_rss_mb"] for r in runs),
+                          heavy_modules_at_import=runs[-1]["heavy_modules_at_import"])
+
+    raise ValueError(f"unknown stage {stage!r}")
+
+
+def _meta(args) -> Dict[str, Any]:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10).stdout.strip()
+    except Exception:
+        rev = None
+    params = {k: v for k, v in vars(args).items() if k not in ("worker", "out", "compare", "workdir")}
+    return {"git": rev or None, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "platform": platform.platform(), "params": params}
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    print(f"\n{'stage':10s} {'throughput':>22s} {'p95':>24s} {'peak rss':>20s}")
+    for stage, cur in new["stages"].items():
+        prev = old.get("stages", {}).get(stage)
+        if not prev or cur.get("error") or prev.get("error"):
+            continue
+        delta = lambda a, b: f"{(b - a) / a * 100:+6.1f}%" if a and b is not None else "   n/a"
+        print(f"{stage:10s} {prev['throughput_per_s'] or 0:>9} -> {cur['throughput_per_s'] or 0:<9} {delta(prev['throughput_per_s'], cur['throughput_per_s'])}"
+              f"  {prev['p95_ms']:>8} -> {cur['p95_ms']:<8} {delta(prev['p95_ms'], cur['p95_ms'])}"
+              f"  {prev['peak_rss_mb']:>6} -> {cur['peak_rss_mb']:<6} {delta(prev['peak_rss_mb'], cur['peak_rss_mb'])}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--stages", default=",".join(STAGES))
+    ap.add_argument("--backend", default="mmap", help="VECTOR_BACKEND for the run (mmap or chroma)")
+    ap.add_argument("--classes", type=int, default=200)
+    ap.add_argument("--methods", type=int, default=8)
+    ap.add_argument("--ids", type=int, default=500, help="correlation IDs in the synthetic log table")
+    ap.add_argument("--lines", type=int, default=40, help="mean log lines per correlation ID")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--embed-batch", type=int, default=64)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--analyze-ids", type=int, default=20)
+    ap.add_argument("--batch-ids", type=int, default=200)
+    ap.add_argument("--startup-runs", type=int, default=3)
+    ap.add_argument("--warmup", action="store_true", help="run the startup stage with WARMUP=1")
+    ap.add_argument("--first-token-ms", type=float, default=0)
+    ap.add_argument("--token-ms", type=float, default=0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workdir", help="where the synthetic workload and indexes live (default: a temp dir)")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--compare", help="results JSON of an earlier run to diff against")
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_stage(args.worker, args)))
+        return
+
+    from benchmarks import fake_llm, synthetic
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        ap.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rca-bench-")
+    shutil.rmtree(os.path.join(workdir, "data"), ignore_errors=True)
+    shutil.rmtree(os.path.join(workdir, "src"), ignore_errors=True)
+    t0 = time.perf_counter()
+    sites = synthetic.generate_source_tree(workdir, args.classes, args.methods, args.seed)
+    synthetic.generate_log_db(os.path.join(workdir, "logs.sqlite3"), sites, args.ids, args.lines, seed=args.seed)
+    print(f"workload: {args.classes} classes, {len(sites)} logger calls, {args.ids} correlation IDs in {workdir} "
+          f"({time.perf_counter() - t0:.1f}s)")
+    if any(s in stages for s in ("retrieve", "analyze", "batch", "startup")) and "index" not in stages:
+        print("note: retrieve/analyze/batch/startup read the index built by the index stage")
+
+    server = fake_llm.serve(0, args.first_token_ms, args.token_ms)
+    llm_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    results = {"meta": _meta(args), "stages": {}}
+    print(f"\n{'stage':10s} {'count':>8s} {'unit':8s} {'throughput/s':>13s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'rss MB':>8s}")
+    passthrough = []
+    for key in ("classes", "methods", "ids", "lines", "dim", "embed_batch", "queries", "analyze_ids", "batch_ids",
+                "startup_runs", "seed"):
+        passthrough += [f"--{key.replace('_', '-')}", str(getattr(args, key))]
+    if args.warmup:
+        passthrough.append("--warmup")
+    try:
+        for stage in stages:
+            cmd = [sys.executable, "-m", "benchmarks.suite", "--worker", stage, "--backend", args.backend, *passthrough]
+            out = subprocess.run(cmd, capture_output=True, text=True, cwd=os.getcwd(),
+                                 env=_stage_env(workdir, args, llm_url, stage))
+            if out.returncode != 0:
+                err = out.stderr.strip().splitlines()[-1] if out.stderr.strip() else str(out.returncode)
+                results["stages"][stage] = {"error": err}
+                print(f"{stage:10s} failed: {err}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            results["stages"][stage] = r
+            print(f"{stage:10s} {r['count']:>8d} {r['unit']:8s} {r['throughput_per_s'] or 0:>13} {r['p50_ms']:>9} "
+                  f"{r['p95_ms']:>9} {r['p99_ms']:>9} {r['peak_rss_mb']:>8}")
+    finally:
+        server.shutdown()
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nresults written to {args.out}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
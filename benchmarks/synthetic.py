@@ -0,0 +1,171 @@
+"""Synthetic Spring Boot source tree and correlated log table for benchmarks.
+
+Usage: python -m benchmarks.synthetic --out /tmp/synth [--classes 200] [--methods 8] [--ids 500] [--lines 40]
+Writes <out>/src (Java sources with logger calls) and <out>/logs.sqlite3 (a `logs` table in the
+default DB_* column layout whose messages render the generated log formats, with stack traces
+pointing at the generated methods). Output is deterministic for a given seed.
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+MODULES = ("order", "payment", "user", "inventory", "shipping", "billing", "catalog", "auth", "search", "notify")
+NOUNS = ("order", "payment", "user", "cart", "invoice", "shipment", "account", "refund", "token", "session",
+         "profile", "ledger", "coupon", "address", "warehouse", "quote")
+VERBS = ("load", "save", "validate", "charge", "reserve", "publish", "resolve", "refresh", "sync", "cancel")
+EXCEPTIONS = ("java.lang.NullPointerException", "java.lang.IllegalStateException",
+              "org.springframework.dao.DataIntegrityViolationException", "java.util.concurrent.TimeoutException")
+JDK_FRAMES = (
+    "\tat java.base/jdk.internal.reflect.NativeMethodAccessorImpl.invoke0(Native Method)",
+    "\tat org.springframework.web.servlet.FrameworkServlet.service(FrameworkServlet.java:897)",
+    "\tat java.base/java.lang.Thread.run(Thread.java:833)",
+)
+
+
+@dataclass
+class CallSite:
+    cls: str  # fully-qualified class name
+    file: str
+    method: str
+    line: int  # 1-based line of the logger call
+    level: str
+    fmt: str  # SLF4J format string
+
+
+def _format(rnd: random.Random, level: str) -> str:
+    noun, other = rnd.sample(NOUNS, 2)
+    verb = rnd.choice(VERBS)
+    if level == "error":
+        return f"Failed to {verb} {noun} {{}} for {other} {{}}"
+    if level == "warn":
+        return f"Retrying {verb} of {noun} {{}} after {{}} ms"
+    return rnd.choice((f"{verb.title()} {noun} {{}} for {other} {{}}", f"{noun.title()} {{}} {verb}ed in {{}} ms"))
+
+
+def generate_source_tree(root: str, classes: int = 200, methods: int = 8, seed: int = 0) -> List[CallSite]:
+    """Write ``classes`` Spring-style services with ``methods`` methods each; returns their logger call sites."""
+    rnd = random.Random(seed)
+    sites: List[CallSite] = []
+    for c in range(classes):
+        module = MODULES[c % len(MODULES)]
+        package = f"com.acme.{module}.service"
+        name = f"{module.title()}{rnd.choice(NOUNS).title()}Service{c}"
+        path = os.path.join(root, "src", "main", "java", *package.split("."), f"{name}.java")
+        lines = [
+            f"package {package};\n", "\n",
+            "import org.slf4j.Logger;\n", "import org.slf4j.LoggerFactory;\n",
+            "import org.springframework.stereotype.Service;\n", "\n",
+            "@Service\n", f"public class {name} {{\n",
+            f"    private static final Logger log = LoggerFactory.getLogger({name}.class);\n", "\n",
+        ]
+        for m in range(methods):
+            method = f"{rnd.choice(VERBS)}{rnd.choice(NOUNS).title()}{m}"
+            info, warn, error = _format(rnd, "info"), _format(rnd, "warn"), _format(rnd, "error")
+            lines += [
+                "    /**\n", f"     * Handles {method}.\n", "     */\n",
+                f"    public Result {method}(String id, Request request) {{\n",
+                f"        log.info(\"{info}\", id, request.getId());\n",
+            ]
+            sites.append(CallSite(f"{package}.{name}", f"{name}.java", method, len(lines), "info", info))
+            lines += [
+                "        try {\n",
+                "            Result result = repository.find(id)\n",
+                "                .map(r -> r.withStatus(\"ok\"))\n",
+                "                .orElseThrow(() -> new IllegalStateException(\"missing \" + id));\n",
+                "            if (result.isSlow()) {\n",
+                f"                log.warn(\"{warn}\", id, result.elapsedMs());\n",
+            ]
+            sites.append(CallSite(f"{package}.{name}", f"{name}.java", method, len(lines), "warn", warn))
+            lines += [
+                "            }\n",
+                "            return result;\n",
+                "        } catch (RuntimeException e) {\n",
+                f"            log.error(\"{error}\",\n", "                id, request.getId(), e);\n",
+            ]
+            sites.append(CallSite(f"{package}.{name}", f"{name}.java", method, len(lines) - 1, "error", error))
+            lines += ["            throw e;\n", "        }\n", "    }\n", "\n"]
+        lines.append("}\n")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+    return sites
+
+
+def _render(rnd: random.Random, fmt: str) -> str:
+    out = fmt
+    while "{}" in out:
+        out = out.replace("{}", rnd.choice((str(rnd.randint(1, 10 ** 6)), f"{rnd.getrandbits(32):08x}")), 1)
+    return out
+
+
+def generate_log_db(
+    path: str,
+    sites: List[CallSite],
+    ids: int = 500,
+    lines: int = 40,
+    error_rate: float = 0.3,
+    incidents: int = 5,
+    seed: int = 0,
+) -> List[str]:
+    """Write a ``logs`` table with ``ids`` correlation IDs of ~``lines`` rows each; returns the IDs.
+
+    A share ``error_rate`` of the IDs fail at one of ``incidents`` error call sites (so failures
+    cluster, as in an outage) and log its message followed by a stack trace through that method.
+    """
+    rnd = random.Random(seed)
+    by_level = {lvl: [s for s in sites if s.level == lvl] for lvl in ("info", "warn", "error")}
+    failing = rnd.sample(by_level["error"], min(incidents, len(by_level["error"])))
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE logs (timestamp TEXT, level TEXT, logger TEXT, message TEXT, correlation_id TEXT)")
+    conn.execute("CREATE INDEX logs_cid ON logs (correlation_id, timestamp)")
+    base = datetime(2024, 1, 1)
+    cids = [f"req-{seed}-{i:06d}" for i in range(ids)]
+    rows: List[Tuple[str, str, str, str, str]] = []
+    for n, cid in enumerate(cids):
+        ts = base + timedelta(seconds=n * 7)
+        count = max(2, int(rnd.gauss(lines, lines / 4)))
+        for _ in range(count):
+            site = rnd.choice(by_level["warn"] if rnd.random() < 0.1 else by_level["info"])
+            ts += timedelta(milliseconds=rnd.randint(1, 50))
+            rows.append((ts.isoformat(), site.level.upper(), site.cls, _render(rnd, site.fmt), cid))
+        if rnd.random() < error_rate:
+            site = rnd.choice(failing)
+            trace = [f"{rnd.choice(EXCEPTIONS)}: {site.method} failed",
+                     # thrown from the orElseThrow line inside the try block
+                     f"\tat {site.cls}.{site.method}({site.file}:{site.line - 6})", *JDK_FRAMES]
+            ts += timedelta(milliseconds=5)
+            rows.append((ts.isoformat(), "ERROR", site.cls, _render(rnd, site.fmt) + "\n" + "\n".join(trace), cid))
+        if len(rows) > 50000:
+            conn.executemany("INSERT INTO logs VALUES (?, ?, ?, ?, ?)", rows)
+            rows = []
+    conn.executemany("INSERT INTO logs VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return cids
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--classes", type=int, default=200)
+    ap.add_argument("--methods", type=int, default=8)
+    ap.add_argument("--ids", type=int, default=500)
+    ap.add_argument("--lines", type=int, default=40)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    sites = generate_source_tree(args.out, args.classes, args.methods, args.seed)
+    cids = generate_log_db(os.path.join(args.out, "logs.sqlite3"), sites, args.ids, args.lines, seed=args.seed)
+    print(f"{args.classes} classes, {len(sites)} logger calls under {os.path.join(args.out, 'src')}")
+    print(f"{len(cids)} correlation IDs in {os.path.join(args.out, 'logs.sqlite3')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Recall, query latency and RSS of the mmap vector index (float32/float16/int8) vs Chroma.
+
+Usage: python -m benchmarks.vector_backends [--docs 100000] [--dim 384] [--queries 200] [--top-k 8]
+Each backend runs in its own subprocess so peak RSS is not shared; Chroma is skipped if not installed.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+def make_data(docs: int, dim: int, queries: int, seed: int = 0):
+    # Clustered vectors (like code snippets sharing idioms) and queries near random docs
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, docs // 100), dim)).astype(np.float32)
+    x = centers[rng.integers(0, len(centers), docs)] + 0.35 * rng.normal(size=(docs, dim)).astype(np.float32)
+    q = x[rng.integers(0, docs, queries)] + 0.1 * rng.normal(size=(queries, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return x, q
+
+
+def exact_top_k(x: np.ndarray, q: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(q @ x.T), axis=1)[:, :k]
+
+
+def _rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_backend(backend: str, args) -> dict:
+    x, q = make_data(args.docs, args.dim, args.queries)
+    ids = [str(i) for i in range(len(x))]
+    docs = [f"doc {i}" for i in range(len(x))]
+    metas = [{"i": i} for i in range(len(x))]
+    workdir = tempfile.mkdtemp(prefix=f"bench-{backend}-")
+    base_rss = _rss_mb()
+
+    t0 = time.perf_counter()
+    if backend == "chroma":
+        import chromadb
+        client = chromadb.PersistentClient(path=workdir)
+        col = client.get_or_create_collection("bench")
+        for i in range(0, len(x), 5000):
+            col.upsert(ids=ids[i:i + 5000], documents=docs[i:i + 5000], metadatas=metas[i:i + 5000], embeddings=x[i:i + 5000].tolist())
+
+        def search(batch):
+            res = col.query(query_embeddings=batch.tolist(), n_results=args.top_k, include=["distances"])
+            return [[int(i) for i in group] for group in res["ids"]]
+    else:
+        from app.services.mmap_index import MmapIndex
+        index = MmapIndex(workdir, backend.split(":")[1])
+        for i in range(0, len(x), 5000):
+            index.upsert(ids[i:i + 5000], docs[i:i + 5000], metas[i:i + 5000], x[i:i + 5000])
+        # Search through a fresh read-only instance, as another worker process would
+        index = MmapIndex(workdir, backend.split(":")[1])
+
+        def search(batch):
+            return [[int(h["id"]) for h in group] for group in index.search(batch, args.top_k)]
+    build_s = time.perf_counter() - t0
+
+    truth = exact_top_k(x, q, args.top_k)
+    latencies, hits = [], 0
+    for i in range(len(q)):
+        t0 = time.perf_counter()
+        found = search(q[i:i + 1])[0]
+        latencies.append(time.perf_counter() - t0)
+        hits += len(set(found) & set(truth[i].tolist()))
+    t0 = time.perf_counter()
+    search(q)
+    batch_s = time.perf_counter() - t0
+
+    lat = np.array(latencies) * 1000
+    return {
+        "backend": backend,
+        "build_s": round(build_s, 2),
+        f"recall@{args.top_k}": round(hits / (len(q) * args.top_k), 4),
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat, 95)), 3),
+        "batch_query_ms": round(batch_s * 1000, 1),
+        "peak_rss_mb": round(_rss_mb(), 1),
+        "rss_delta_mb": round(_rss_mb() - base_rss, 1),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--docs", type=int, default=100000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=8)
+    ap.add_argument("--backends", default="mmap:float32,mmap:float16,mmap:int8,chroma")
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_backend(args.worker, args)))
+        return
+
+    for backend in args.backends.split(","):
+        if backend == "chroma":
+            try:
+                import chromadb  # noqa: F401
+            except ImportError:
+                print(f"{backend:14s} skipped (chromadb not installed)")
+                continue
+        cmd = [sys.executable, "-m", "benchmarks.vector_backends", "--worker", backend,
+               "--docs", str(args.docs), "--dim", str(args.dim), "--queries", str(args.queries), "--top-k", str(args.top_k)]
+        out = subprocess.run(cmd, capture_output=True, text=True, cwd=os.getcwd())
+        if out.returncode != 0:
+            print(f"{backend:14s} failed: {out.stderr.strip().splitlines()[-1] if out.stderr.strip() else out.returncode}")
+            continue
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{backend:14s} recall@{args.top_k}={r[f'recall@{args.top_k}']:.4f}  p50={r['p50_ms']:8.3f} ms  "
+              f"p95={r['p95_ms']:8.3f} ms  batch={r['batch_query_ms']:8.1f} ms  build={r['build_s']:6.2f} s  "
+              f"peak_rss={r['peak_rss_mb']:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
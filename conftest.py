@@ -0,0 +1 @@
+# Makes the repository root importable for tests/ (pytest inserts this file's directory into sys.path)
@@ -0,0 +1,27 @@
+import sqlite3
+
+import pytest
+
+from app.config import settings
+from app.services import db_ingest
+
+
+@pytest.fixture
+def log_db(tmp_path, monkeypatch):
+    """SQLite log table with six rows for correlation "cid", two per timestamp."""
+    path = tmp_path / "logs.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE logs (timestamp TEXT, level TEXT, logger TEXT, message TEXT, correlation_id TEXT)")
+    conn.executemany(
+        "INSERT INTO logs VALUES (?, 'INFO', 'a.b', ?, 'cid')",
+        [(f"2024-01-01T00:00:0{i // 2}", f"line {i}") for i in range(6)],
+    )
+    conn.commit()
+    monkeypatch.setattr(settings, "DB_URL", f"sqlite:///{path}")
+    monkeypatch.setattr(settings, "USE_DUMMY_LOGS", False)
+    monkeypatch.setattr(settings, "COL_ROW_ID", "rowid")
+    monkeypatch.setattr(db_ingest, "_ENGINE", None)
+    yield conn
+    conn.close()
+    if db_ingest._ENGINE is not None:
+        db_ingest._ENGINE.dispose()
@@ -0,0 +1,47 @@
+from app.services import code_scan
+from app.services.frame_index import FrameIndex, parse_frames
+
+SOURCE = """package com.example.assembler;
+
+public class UserAssembler {
+    private static final Logger log = LoggerFactory.getLogger(UserAssembler.class);
+
+    public UserDto map(User user) {
+        UserDto dto = new UserDto();
+        dto.setName(user.getProfile().getName());
+        return dto;
+    }
+
+    public void audit(User user) {
+        log.info("Mapped user {}", user.getId());
+    }
+}
+"""
+
+
+def _index(tmp_path):
+    lines = SOURCE.splitlines(keepends=True)
+    snippets, spans = code_scan._file_documents(str(tmp_path / "UserAssembler.java"), lines)
+    index = FrameIndex(None)
+    index.add(snippets)
+    index.add(spans)
+    return index, snippets, spans
+
+
+def test_only_methods_with_logger_calls_are_embedded(tmp_path):
+    _, snippets, spans = _index(tmp_path)
+    assert [s["metadata"]["method"] for s in snippets] == ["audit"]
+    assert [s["metadata"]["method"] for s in spans] == ["map"]
+
+
+def test_frame_resolves_into_method_without_log_call(tmp_path):
+    index, _, spans = _index(tmp_path)
+    frames = parse_frames("java.lang.NullPointerException\n\tat com.example.assembler.UserAssembler.map(UserAssembler.java:8)")
+    assert index.resolve(frames, "v1") == [(frames[0], spans[0]["id"])]
+    doc = index.documents([spans[0]["id"]])[spans[0]["id"]]
+    assert "user.getProfile().getName()" in doc["document"]
+
+
+def test_frame_outside_any_method_does_not_resolve(tmp_path):
+    index, _, _ = _index(tmp_path)
+    assert index.resolve(parse_frames("at com.example.assembler.UserAssembler.x(UserAssembler.java:4)"), "v1") == []
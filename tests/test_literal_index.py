@@ -0,0 +1,43 @@
+import time
+
+from app.services.literal_index import LiteralIndex, _segments, fullmatch
+
+
+def _index(*formats):
+    index = LiteralIndex(None)
+    index.add([
+        {"id": f"doc{i}", "text": f"snippet {i}", "metadata": {"log_format": fmt}}
+        for i, fmt in enumerate(formats)
+    ])
+    return index
+
+
+def test_fullmatch_placeholders_match_anything():
+    parts = _segments("Payment {} failed for order %s")
+    assert fullmatch(parts, "Payment card-42 failed for order 7")
+    assert fullmatch(parts, "  Payment  failed for order 7\n")
+    assert not fullmatch(parts, "Payment 1 failed for order")
+    assert not fullmatch(parts, "Refund 1 failed for order 7")
+
+
+def test_fullmatch_prefix_and_suffix_do_not_overlap():
+    parts = _segments("abc{}cde")
+    assert not fullmatch(parts, "abcde")
+    assert fullmatch(parts, "abccde")
+
+
+def test_exact_lookup():
+    index = _index("Cache miss for userId={}", "Request completed with status={}")
+    assert index.exact("Cache miss for userId=42", "1") == ["doc0"]
+    assert index.exact("Cache hit for userId=42", "1") == []
+
+
+def test_exact_on_long_non_matching_message_is_linear():
+    index = _index("Error processing {} for {} in {} at {} with {}")
+    # Every segment but the last repeats, which made the old regex backtrack polynomially
+    message = "Error processing " + "x for y in z at w " * 200 + "done"
+    assert len(message) > 3500
+    t0 = time.perf_counter()
+    assert index.exact(message, "1") == []
+    assert time.perf_counter() - t0 < 0.5
+    assert index.exact(message[:-4] + "with v", "1") == ["doc0"]
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from app.config import settings
+from app.services import llm
+from benchmarks import fake_llm
+
+LOGS = [{"ts": "2024-01-01T00:00:03", "level": "ERROR", "logger": "com.example.UserAssembler", "message": "NPE"}]
+
+
+def _serve(failures: int):
+    """The fake LLM, answering the first ``failures`` requests with 503."""
+    base = fake_llm.make_handler(0, 0)
+
+    class Handler(base):
+        def do_POST(self):
+            if server.failures > 0:
+                server.failures -= 1
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self.send_response(503)
+                # The OpenAI SDK honours this instead of its default ~0.5s backoff
+                self.send_header("retry-after-ms", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            server.requests += 1
+            super().do_POST()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.failures, server.requests = failures, 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def llm_server(monkeypatch):
+    servers = []
+
+    def start(failures=0):
+        server = _serve(failures)
+        servers.append(server)
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "fake")
+        monkeypatch.setattr(settings, "OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+        monkeypatch.setattr(settings, "REQUIRE_LLM", True)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _stream():
+    async def _collect():
+        return [piece async for piece in llm.astream_rca(LOGS, [])]
+    return asyncio.run(_collect())
+
+
+def test_generate(llm_server):
+    llm_server()
+    assert asyncio.run(llm.agenerate_rca(LOGS, [])) == fake_llm.CANNED_RCA
+
+
+def test_generate_retries_then_succeeds(llm_server):
+    server = llm_server(failures=1)
+    assert asyncio.run(llm.agenerate_rca(LOGS, [])) == fake_llm.CANNED_RCA
+    assert server.failures == 0 and server.requests == 1
+
+
+def test_generate_gives_up(llm_server):
+    server = llm_server(failures=100)
+    report = asyncio.run(llm.agenerate_rca(LOGS, []))
+    assert llm.is_error_report(report) and "503" in report
+    assert server.requests == 0
+
+
+def test_stream(llm_server):
+    llm_server()
+    pieces = _stream()
+    assert len(pieces) > 1 and "".join(pieces) == fake_llm.CANNED_RCA
+
+
+def test_stream_retries_then_succeeds(llm_server):
+    llm_server(failures=1)
+    assert "".join(_stream()) == fake_llm.CANNED_RCA
+
+
+def test_stream_gives_up(llm_server):
+    llm_server(failures=100)
+    pieces = _stream()
+    assert len(pieces) == 1 and llm.is_error_report(pieces[0])
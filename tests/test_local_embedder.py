@@ -0,0 +1,15 @@
+from app.services import local_embedder
+from app.services.local_embedder import LocalEmbedder
+
+
+def test_key_names_the_inference_variant(monkeypatch):
+    monkeypatch.setattr(local_embedder, "_supports_backends", lambda: True)
+    assert LocalEmbedder("m").key == "m"
+    assert LocalEmbedder("m", quantize=True).key == "m[int8]"
+    assert LocalEmbedder("m", backend="onnx", model_file="onnx/model_qint8.onnx").key == "m[onnx,onnx/model_qint8.onnx]"
+
+
+def test_unsupported_backend_resolves_to_torch_before_the_key_is_read(monkeypatch):
+    monkeypatch.setattr(local_embedder, "_supports_backends", lambda: False)
+    embedder = LocalEmbedder("m", backend="onnx", model_file="onnx/model.onnx")
+    assert (embedder.backend, embedder.model_file, embedder.key) == ("torch", None, "m")
@@ -0,0 +1,33 @@
+from app.config import settings
+from app.services import db_ingest
+
+
+def _streamed(correlation_id):
+    fp = db_ingest.LogFingerprint()
+    for log in db_ingest.iter_logs_by_correlation(correlation_id):
+        fp.update(log)
+    return fp.hexdigest()
+
+
+def test_aggregate_fingerprint_matches_streamed_rows(log_db):
+    assert db_ingest.logs_fingerprint("cid") == _streamed("cid") == "6|2024-01-01T00:00:02|6"
+    assert db_ingest.logs_fingerprint("other") == _streamed("other")
+
+
+def test_fingerprint_changes_when_logs_change(log_db):
+    before = db_ingest.logs_fingerprint("cid")
+    log_db.execute("INSERT INTO logs VALUES ('2024-01-01T00:00:02', 'ERROR', 'a.b', 'late', 'cid')")
+    log_db.commit()
+    after_insert = db_ingest.logs_fingerprint("cid")
+    assert after_insert != before
+    log_db.execute("DELETE FROM logs WHERE message = 'line 0'")
+    log_db.commit()
+    assert db_ingest.logs_fingerprint("cid") not in (before, after_insert)
+
+
+def test_fingerprint_without_row_id_column(log_db, monkeypatch):
+    monkeypatch.setattr(settings, "COL_ROW_ID", "")
+    assert db_ingest.logs_fingerprint("cid") == _streamed("cid") == "6|2024-01-01T00:00:02"
+    log_db.execute("INSERT INTO logs VALUES ('2024-01-01T00:00:03', 'ERROR', 'a.b', 'late', 'cid')")
+    log_db.commit()
+    assert db_ingest.logs_fingerprint("cid") == "7|2024-01-01T00:00:03"
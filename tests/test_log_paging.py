@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from flask import Flask
+
+from app.config import settings
+from app.routes import bp
+from app.services import db_ingest
+
+
+@pytest.fixture
+def client(log_db):
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    return app.test_client()
+
+
+def _pages(limit):
+    pages, after = [], None
+    while True:
+        page = db_ingest.fetch_logs_by_correlation("cid", after=after, limit=limit)
+        if not page:
+            return pages
+        pages.append([log["message"] for log in page])
+        after = db_ingest.log_cursor(page[-1])
+
+
+def test_keyset_pages_split_timestamp_ties(log_db):
+    # Every page boundary falls between two rows sharing a timestamp
+    assert _pages(limit=3) == [["line 0", "line 1", "line 2"], ["line 3", "line 4", "line 5"]]
+    assert sum(_pages(limit=1), []) == [f"line {i}" for i in range(6)]
+
+
+def test_cursor_round_trip(log_db):
+    logs = db_ingest.fetch_logs_by_correlation("cid")
+    cursor = db_ingest.log_cursor(logs[2])
+    assert cursor == "2024-01-01T00:00:01|3"
+    assert db_ingest.fetch_logs_by_correlation("cid", after=cursor) == logs[3:]
+    # A bare timestamp pages strictly after it
+    assert db_ingest.fetch_logs_by_correlation("cid", after="2024-01-01T00:00:01") == logs[4:]
+
+
+def test_pages_by_timestamp_without_row_id(log_db, monkeypatch):
+    monkeypatch.setattr(settings, "COL_ROW_ID", "")
+    logs = db_ingest.fetch_logs_by_correlation("cid")
+    assert len(logs) == 6 and all("row_id" not in log for log in logs)
+    assert db_ingest.log_cursor(logs[1]) == "2024-01-01T00:00:00"
+    assert db_ingest.fetch_logs_by_correlation("cid", after=db_ingest.log_cursor(logs[1])) == logs[2:]
+
+
+def test_api_logs_pages_with_next_after(client):
+    seen, after = [], None
+    while True:
+        body = client.get("/api/logs", query_string={"correlation_id": "cid", "limit": 4, "after": after or ""}).get_json()
+        seen += [log["message"] for log in body["logs"]]
+        after = body["next_after"]
+        if after is None:
+            break
+    assert seen == [f"line {i}" for i in range(6)]
+
+
+def test_api_logs_ndjson(client):
+    resp = client.get("/api/logs", query_string={"correlation_id": "cid", "format": "ndjson", "limit": 4})
+    assert resp.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [r["message"] for r in rows] == ["line 0", "line 1", "line 2", "line 3"]
+    after = db_ingest.log_cursor(rows[-1])
+    resp = client.get("/api/logs", query_string={"correlation_id": "cid", "after": after},
+                      headers={"Accept": "application/x-ndjson"})
+    assert [json.loads(line)["message"] for line in resp.get_data(as_text=True).splitlines()] == ["line 4", "line 5"]
@@ -0,0 +1,113 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.config import settings
+from app.services import embeddings
+
+
+def _serve(script, batch_endpoint=True):
+    """Stub Ollama server answering from ``script``: a status code per request (the last one repeats),
+    or "drop" to close the connection without a response. Without ``batch_endpoint`` /api/embed is a 404."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *_):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            server.calls.append((self.path, body))
+            if self.path == "/api/embed" and not batch_endpoint:
+                return self._send(404, {"error": "404 page not found"})
+            step = server.script.pop(0) if len(server.script) > 1 else server.script[0]
+            if step == "drop":
+                self.close_connection = True
+                return
+            if step != 200:
+                return self._send(step, {"error": "busy"})
+            if self.path == "/api/embed":
+                return self._send(200, {"embeddings": [[float(len(t)), 1.0] for t in body["input"]]})
+            self._send(200, {"embedding": [float(len(body["prompt"])), 1.0]})
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.script, server.calls = list(script), []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def ollama(monkeypatch):
+    monkeypatch.setattr(settings, "OLLAMA_EMBED_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "OLLAMA_EMBED_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "OLLAMA_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "OLLAMA_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(embeddings, "_OLLAMA_LEGACY", False)
+    # A fresh pooled session per test, built by embeddings._ollama_session
+    monkeypatch.setattr(embeddings, "_OLLAMA_SESSION", None)
+    servers = []
+
+    def start(*script, batch_endpoint=True):
+        server = _serve(script, batch_endpoint)
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}/"
+    yield start
+    if embeddings._OLLAMA_SESSION is not None:
+        embeddings._OLLAMA_SESSION.close()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_batches_texts_per_request(ollama):
+    server, url = ollama(200)
+    assert embeddings.ollama_embed(["a", "bb", "ccc"], url, "m") == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert server.calls == [
+        ("/api/embed", {"model": "m", "input": ["a", "bb"]}),
+        ("/api/embed", {"model": "m", "input": ["ccc"]}),
+    ]
+
+
+def test_retries_transient_failures_then_succeeds(ollama):
+    server, url = ollama(429, 503, 200)
+    assert embeddings.ollama_embed(["a"], url, "m") == [[1.0, 1.0]]
+    assert len(server.calls) == 3
+
+
+def test_retries_dropped_connections(ollama):
+    server, url = ollama("drop", 200)
+    assert embeddings.ollama_embed(["a"], url, "m") == [[1.0, 1.0]]
+    assert len(server.calls) == 2
+
+
+def test_gives_up_after_max_retries(ollama):
+    server, url = ollama(503)
+    assert embeddings.ollama_embed(["a", "bb", "ccc"], url, "m") == [None, None, None]
+    # Each batch: one attempt plus OLLAMA_MAX_RETRIES retries
+    assert len(server.calls) == 2 * 3
+
+
+def test_client_errors_are_not_retried(ollama):
+    server, url = ollama(400)
+    assert embeddings.ollama_embed(["a"], url, "m") == [None]
+    assert len(server.calls) == 1
+
+
+def test_falls_back_to_legacy_endpoint_on_404(ollama):
+    server, url = ollama(200, batch_endpoint=False)
+    assert embeddings.ollama_embed(["a", "bb"], url, "m") == [[1.0, 1.0], [2.0, 1.0]]
+    assert embeddings.ollama_embed(["ccc"], url, "m") == [[3.0, 1.0]]
+    # Detected once: later batches go straight to /api/embeddings
+    assert [path for path, _ in server.calls] == ["/api/embed", "/api/embeddings", "/api/embeddings", "/api/embeddings"]
@@ -0,0 +1,37 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.config import settings
+from app.services import db_ingest, rca
+
+
+def test_failed_consumer_stops_producer_and_closes_cursor(monkeypatch):
+    closed = threading.Event()
+    produced = []
+
+    def rows(correlation_id, after=None, limit=None):
+        try:
+            for i in range(10_000):
+                produced.append(i)
+                yield {"ts": str(i), "row_id": i, "level": "INFO", "logger": "a.b", "message": f"line {i}"}
+        finally:
+            closed.set()
+
+    def add(self, log):
+        if log["row_id"] >= 4:
+            raise RuntimeError("template mining failed")
+
+    monkeypatch.setattr(settings, "RCA_CHUNK_SIZE", 2)
+    monkeypatch.setattr(db_ingest, "iter_logs_by_correlation", rows)
+    monkeypatch.setattr(rca._Collector, "add", add)
+
+    async def run():
+        with pytest.raises(RuntimeError, match="template mining failed"):
+            await asyncio.wait_for(rca._gather_context("cid"), timeout=5)
+
+    asyncio.run(run())
+    # The producer thread returned (no put left blocked on the full queue) and closed the cursor
+    assert closed.wait(1)
+    assert len(produced) < 10_000